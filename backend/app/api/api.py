@@ -1,7 +1,9 @@
 from fastapi import APIRouter
-from app.api.endpoints import products, search
+from app.api.endpoints import admin, inventory, products, search
 
 api_router = APIRouter()
 
 api_router.include_router(search.router, prefix="/search", tags=["search"])
-api_router.include_router(products.router, prefix="/products", tags=["products"])
\ No newline at end of file
+api_router.include_router(products.router, prefix="/products", tags=["products"])
+api_router.include_router(inventory.router, prefix="/inventory", tags=["inventory"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
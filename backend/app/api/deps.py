@@ -0,0 +1,31 @@
+import re
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from app.core.config import settings
+
+# 租户ID只允许字母、数字、下划线和连字符
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# 已开通的租户，默认租户始终可用
+KNOWN_TENANT_IDS = frozenset(
+    [settings.DEFAULT_TENANT_ID] + [tenant.strip() for tenant in settings.TENANT_IDS.split(",") if tenant.strip()]
+)
+
+def get_tenant_id(x_tenant_id: Optional[str] = Header(None, description="租户（店铺）ID")) -> str:
+    """
+    依赖函数，从 X-Tenant-ID 请求头获取当前租户
+    
+    未携带请求头时使用默认租户（TENANT_HEADER_REQUIRED 开启时返回400）；
+    未开通的租户返回403，避免任意租户ID在缓存、词表和热度统计中创建分区。
+    """
+    if not x_tenant_id:
+        if settings.TENANT_HEADER_REQUIRED:
+            raise HTTPException(status_code=400, detail="缺少 X-Tenant-ID 请求头")
+        return settings.DEFAULT_TENANT_ID
+    if not TENANT_ID_PATTERN.match(x_tenant_id):
+        raise HTTPException(status_code=400, detail="X-Tenant-ID 格式不正确")
+    if x_tenant_id not in KNOWN_TENANT_IDS:
+        raise HTTPException(status_code=403, detail="未开通的租户")
+    return x_tenant_id
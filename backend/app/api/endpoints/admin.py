@@ -0,0 +1,48 @@
+import secrets
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import settings
+from app.core.profiling import profiler, slow_requests
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    诊断接口仅在开启 PROFILING_ENABLED 时可用，并且必须携带正确的管理令牌
+
+    返回的调用栈和SQL参数可能包含敏感数据，未配置 ADMIN_TOKEN 时一律拒绝。
+    """
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="未配置管理令牌")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="管理令牌无效")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_event_loop(
+    seconds: float = Query(10, gt=0, description="采样时长（秒）")
+) -> Any:
+    """
+    对事件循环做统计采样，返回折叠栈格式的结果
+    
+    结果可直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+    """
+    if seconds > settings.PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"采样时长不能超过 {settings.PROFILER_MAX_SECONDS} 秒")
+    if profiler.busy:
+        raise HTTPException(status_code=409, detail="已有采样在进行")
+    try:
+        return await profiler.profile_loop(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/slow-requests")
+async def get_slow_requests(
+    limit: int = Query(20, gt=0, description="返回的记录数")
+) -> List[Dict[str, Any]]:
+    """最近的慢请求，包括执行的SQL、各阶段耗时和意图"""
+    return list(slow_requests)[-limit:][::-1]
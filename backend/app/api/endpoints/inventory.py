@@ -0,0 +1,58 @@
+# app/api/endpoints/inventory.py
+from fastapi import APIRouter, Depends, HTTPException, Path
+
+from app.api.deps import get_tenant_id
+from app.schemas.inventory import ReservationCreate, ReservationResponse
+from app.services.inventory import (
+    InsufficientStockError,
+    ReservationNotFoundError,
+    ReservationStateError,
+    inventory_service,
+)
+from app.services.write_behind import ProductNotFoundError
+
+router = APIRouter()
+
+@router.post("/reservations", response_model=ReservationResponse, status_code=201)
+async def create_reservation(
+    reservation: ReservationCreate,
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """预留库存，库存不足时返回409"""
+    try:
+        return await inventory_service.reserve(
+            reservation.product_id,
+            reservation.quantity,
+            tenant_id=tenant_id,
+            ttl_seconds=reservation.ttl_seconds,
+        )
+    except ProductNotFoundError:
+        raise HTTPException(status_code=404, detail="产品不存在")
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/reservations/{reservation_id}/confirm", response_model=ReservationResponse)
+async def confirm_reservation(
+    reservation_id: str = Path(..., description="预留ID"),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """确认预留（下单成功），过期或已释放的预留返回409"""
+    try:
+        return await inventory_service.confirm(reservation_id, tenant_id=tenant_id)
+    except ReservationNotFoundError:
+        raise HTTPException(status_code=404, detail="预留不存在")
+    except ReservationStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/reservations/{reservation_id}/release", response_model=ReservationResponse)
+async def release_reservation(
+    reservation_id: str = Path(..., description="预留ID"),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """释放预留并返还库存"""
+    try:
+        return await inventory_service.release(reservation_id, tenant_id=tenant_id)
+    except ReservationNotFoundError:
+        raise HTTPException(status_code=404, detail="预留不存在")
+    except ReservationStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
@@ -2,10 +2,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Path, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Any, List, Optional
+from app.api.deps import get_tenant_id
+from app.core.config import settings
 from app.db.database import get_db
 from app.models.product import Product
-from app.schemas.product import ProductCreate, ProductResponse, ProductUpdate
+from app.schemas.product import (
+    BulkUpdateResult,
+    ProductCreate,
+    ProductResponse,
+    ProductStockPriceUpdate,
+    ProductUpdate,
+)
 from app.services.product_service import ProductService
+from app.services.trending import trending_engine
+from app.services.write_behind import StockBelowReservedError
 
 router = APIRouter()
 
@@ -14,54 +24,80 @@ async def get_products(
     skip: int = 0,
     limit: int = 100,
     category: Optional[str] = None,
-    db: AsyncSession = Depends(get_db)
+    in_stock: Optional[bool] = None,
+    db: AsyncSession = Depends(get_db),
+    tenant_id: str = Depends(get_tenant_id)
 ):
     """获取产品列表"""
-    product_service = ProductService(db)
-    products = await product_service.get_products(skip=skip, limit=limit, category=category)
+    product_service = ProductService(db, tenant_id)
+    products = await product_service.get_products(skip=skip, limit=limit, category=category, in_stock=in_stock)
     return products
 
 @router.post("/", response_model=ProductResponse, status_code=201)
 async def create_product(
     product: ProductCreate,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    tenant_id: str = Depends(get_tenant_id)
 ):
     """创建新产品"""
-    product_service = ProductService(db)
+    product_service = ProductService(db, tenant_id)
     return await product_service.create_product(product=product)
 
+@router.patch("/", response_model=BulkUpdateResult)
+async def bulk_update_products(
+    updates: List[ProductStockPriceUpdate],
+    db: AsyncSession = Depends(get_db),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """批量更新库存和价格，单次最多 WRITE_BATCH_MAX_SIZE 项"""
+    if not updates:
+        raise HTTPException(status_code=400, detail="更新列表不能为空")
+    if len(updates) > settings.WRITE_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"单次最多更新 {settings.WRITE_BATCH_MAX_SIZE} 项")
+    if any(not item.dict(exclude_unset=True, exclude={"id"}) for item in updates):
+        raise HTTPException(status_code=400, detail="每项更新至少包含库存或价格")
+    product_service = ProductService(db, tenant_id)
+    return await product_service.bulk_update_stock_price(updates)
+
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(
     product_id: int = Path(..., description="产品ID"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    tenant_id: str = Depends(get_tenant_id)
 ):
     """根据ID获取产品详情"""
-    product_service = ProductService(db)
-    product = await product_service.get_product(product_id=product_id)
+    product_service = ProductService(db, tenant_id)
+    product = await product_service.get_product_payload(product_id=product_id)
     if not product:
         raise HTTPException(status_code=404, detail="产品不存在")
+    trending_engine.record_view(product_id, tenant_id)
     return product
 
 @router.put("/{product_id}", response_model=ProductResponse)
 async def update_product(
     product_id: int,
     product: ProductUpdate,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    tenant_id: str = Depends(get_tenant_id)
 ):
     """更新产品信息"""
-    product_service = ProductService(db)
+    product_service = ProductService(db, tenant_id)
     db_product = await product_service.get_product(product_id=product_id)
     if not db_product:
         raise HTTPException(status_code=404, detail="产品不存在")
-    return await product_service.update_product(product_id=product_id, product=product)
+    try:
+        return await product_service.update_product(product_id=product_id, product=product)
+    except StockBelowReservedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 @router.delete("/{product_id}", status_code=204)
 async def delete_product(
     product_id: int,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    tenant_id: str = Depends(get_tenant_id)
 ):
     """删除产品"""
-    product_service = ProductService(db)
+    product_service = ProductService(db, tenant_id)
     db_product = await product_service.get_product(product_id=product_id)
     if not db_product:
         raise HTTPException(status_code=404, detail="产品不存在")
@@ -1,11 +1,19 @@
 # app/api/endpoints/search.py
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+import time
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from app.api.deps import get_tenant_id
+from app.core import profiling
+from app.core.metrics import metrics
 from app.db.database import get_db
-from app.schemas.product import ProductSearchQuery, SearchResults, ProductSearchResponse
+from app.schemas.intent import SearchIntent
+from app.schemas.product import ProductSearchQuery, SearchClick, SearchResults, ProductSearchResponse
 from app.services.ai_service import AIService
 from app.services.product_service import ProductService, search_products
+from app.services.query_log import query_logger
+from app.services.trending import trending_engine
 
 router = APIRouter()  # 确保这一行存在
 ai_service = AIService()
@@ -13,35 +21,162 @@ ai_service = AIService()
 @router.post("/natural", response_model=SearchResults)
 async def search_by_natural_language(
     search_query: ProductSearchQuery,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    tenant_id: str = Depends(get_tenant_id)
 ) -> Any:
     """基于自然语言搜索产品"""
+    started = time.perf_counter()
+    degraded = getattr(request.state, "degraded", False)
     try:
-        # 解析用户意图
-        intent_data = await ai_service.parse_search_intent(search_query.query)
-        
-        # 搜索产品
-        product_service = ProductService(db)
-        search_results = await product_service.search_products_by_intent(
-            intent_data=intent_data,
-            page=search_query.page,
-            limit=search_query.limit
-        )
+        product_service = ProductService(db, tenant_id)
         
-        return search_results
+        if degraded:
+            # 准入控制判定饱和：不调用LLM，使用缓存的意图或规则解析结果
+            intent = await ai_service.parse_search_intent(search_query.query, allow_llm=False, tenant_id=tenant_id)
+            parsed = time.perf_counter()
+            search_results = await product_service.search_products_by_intent(
+                intent=intent,
+                page=search_query.page,
+                limit=search_query.limit
+            )
+        else:
+            intent, search_results, parsed = await _parse_and_search(product_service, search_query)
+        if search_results["total"] == 0:
+            intent, search_results = await _search_corrected(
+                product_service, search_query, intent, search_results, allow_llm=not degraded
+            )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"搜索失败: {str(e)}"
         )
+    
+    finished = time.perf_counter()
+    latencies_ms = {
+        "parse": (parsed - started) * 1000,
+        "search": (finished - parsed) * 1000,
+        "total": (finished - started) * 1000,
+    }
+    query_logger.log(
+        "natural",
+        search_query.query,
+        intent=intent,
+        result_count=search_results["total"],
+        latencies_ms=latencies_ms,
+        degraded=degraded,
+        tenant=tenant_id
+    )
+    profiling.annotate(
+        query=search_query.query,
+        intent=intent.to_dict(),
+        latency_ms={stage: round(value, 2) for stage, value in latencies_ms.items()},
+        degraded=degraded
+    )
+    return search_results
+
+async def _parse_and_search(
+    product_service: ProductService,
+    search_query: ProductSearchQuery
+) -> Tuple[SearchIntent, Dict[str, Any], float]:
+    """
+    解析意图并搜索，核心字段到达后提前开始搜索
+    
+    Returns:
+        (意图, 搜索结果, 意图解析完成的时间点)
+    """
+    speculative: Dict[str, Any] = {}
+    
+    def start_search(core_intent: SearchIntent) -> None:
+        # 产品类型和价格范围到达后提前取出候选，不等待意图完整返回
+        speculative["intent"] = core_intent
+        speculative["task"] = asyncio.create_task(product_service.find_core_candidates(core_intent))
+    
+    # 解析用户意图
+    try:
+        intent = await ai_service.parse_search_intent(
+            search_query.query,
+            on_core_ready=start_search,
+            tenant_id=product_service.tenant_id
+        )
+    except BaseException:
+        # 请求被取消或解析失败时，等提前搜索结束后再释放会话，避免会话被并发使用
+        task = speculative.get("task")
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        raise
+    parsed = time.perf_counter()
+    
+    if "task" in speculative:
+        # 会话不能并发使用，无论结果是否可用都先等待提前搜索结束
+        candidates = await speculative["task"]
+        if candidates is not None and speculative["intent"] == intent.core():
+            # 核心条件一致时在候选上应用品牌、关键词和排序
+            metrics.inc("intent_speculative_search_total", outcome="hit")
+            search_results = await product_service.search_candidates(
+                candidates,
+                intent=intent,
+                page=search_query.page,
+                limit=search_query.limit
+            )
+            return intent, search_results, parsed
+        metrics.inc("intent_speculative_search_total", outcome="miss")
+    
+    # 搜索产品
+    search_results = await product_service.search_products_by_intent(
+        intent=intent,
+        page=search_query.page,
+        limit=search_query.limit
+    )
+    return intent, search_results, parsed
+
+async def _search_corrected(
+    product_service: ProductService,
+    search_query: ProductSearchQuery,
+    intent: SearchIntent,
+    search_results: Dict[str, Any],
+    allow_llm: bool
+) -> Tuple[SearchIntent, Dict[str, Any]]:
+    """
+    原查询没有结果时，按编辑距离纠正拼写和字形后重新解析并搜索
+    
+    纠正后有结果时返回新结果并附带纠正后的查询，否则保留原结果。
+    """
+    normalizer = ai_service.normalizer
+    tenant_id = product_service.tenant_id
+    corrected = normalizer.normalize(search_query.query, tenant_id, fuzzy=True)
+    if corrected == normalizer.normalize(search_query.query, tenant_id):
+        return intent, search_results
+    corrected_intent = await ai_service.parse_search_intent(corrected, allow_llm=allow_llm, tenant_id=tenant_id)
+    corrected_results = await product_service.search_products_by_intent(
+        intent=corrected_intent,
+        page=search_query.page,
+        limit=search_query.limit
+    )
+    if corrected_results["total"] == 0:
+        metrics.inc("search_corrected_retry_total", outcome="empty")
+        return intent, search_results
+    metrics.inc("search_corrected_retry_total", outcome="found")
+    profiling.annotate(corrected_query=corrected)
+    return corrected_intent, {**corrected_results, "corrected_query": corrected}
+
+@router.post("/click", status_code=204)
+async def record_search_click(click: SearchClick, tenant_id: str = Depends(get_tenant_id)):
+    """记录搜索结果点击，用于计算热门产品"""
+    trending_engine.record_click(click.product_id, tenant_id)
+    if click.query:
+        query_logger.log("click", click.query, product_id=click.product_id, tenant=tenant_id)
+    return None
 
 @router.get("/featured", response_model=SearchResults)
 async def get_featured_products(
     limit: int = 10,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    tenant_id: str = Depends(get_tenant_id)
 ) -> Any:
     """获取推荐产品"""
-    product_service = ProductService(db)
+    product_service = ProductService(db, tenant_id)
     products = await product_service.get_featured_products(limit=limit)
     
     return {
@@ -67,6 +202,7 @@ async def search(
     """
     搜索产品
     """
+    started = time.perf_counter()
     try:
         results = await search_products(
             query=q,
@@ -79,12 +215,19 @@ async def search(
             limit=limit,
             db=db
         )
-        return results
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"搜索失败: {str(e)}"
         )
+    
+    query_logger.log(
+        "search",
+        q,
+        result_count=len(results),
+        latencies_ms={"total": (time.perf_counter() - started) * 1000}
+    )
+    return results
 
 @router.get("/suggest")
 async def get_suggestions(
@@ -94,6 +237,7 @@ async def get_suggestions(
     """
     获取搜索建议
     """
+    query_logger.log("suggest", q)
     return {
         "suggestions": [
             f"{q} 相关产品",
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """令牌桶，按固定速率补充令牌，容量即允许的突发量"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def try_acquire(self, cost: float = 1.0) -> bool:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= cost:
+            self._tokens -= cost
+            return True
+        return False
+
+    def retry_after(self, cost: float = 1.0) -> float:
+        """距离攒够 cost 个令牌还需要的秒数"""
+        return max(0.0, (cost - self._tokens) / self.rate) if self.rate > 0 else 60.0
+
+
+class RateLimiter:
+    """按客户端（API密钥或IP）划分的令牌桶限流，只保留最近活跃的客户端"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def acquire(self, client: str, cost: float = 1.0) -> Optional[float]:
+        """
+        尝试为客户端扣减令牌
+
+        Returns:
+            放行时返回None，被限流时返回建议的重试等待秒数
+        """
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, clock=self._clock)
+            self._buckets[client] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        if bucket.try_acquire(cost):
+            return None
+        return bucket.retry_after(cost)
+
+
+@dataclass
+class RouteClass:
+    """路由类别的准入配置"""
+    name: str
+    max_concurrency: int
+    max_queue: int
+    queue_timeout: float
+    cost: float = 1.0
+    # 饱和时转入的降级类别，降级请求设置 request.state.degraded
+    degrade_to: Optional[str] = None
+
+
+class Overloaded(Exception):
+    """排队超出上限或等待超时"""
+
+
+class ConcurrencyLimiter:
+    """有界并发队列：超出并发的请求排队，队列已满或等待超时则拒绝"""
+
+    def __init__(self, route_class: RouteClass):
+        self.route_class = route_class
+        self._semaphore = asyncio.Semaphore(route_class.max_concurrency)
+        self._waiting = 0
+
+    @property
+    def saturated(self) -> bool:
+        return self._semaphore.locked()
+
+    async def acquire(self, timeout: Optional[float] = None) -> None:
+        """
+        获取执行槽位
+
+        Raises:
+            Overloaded: 队列已满或等待超过截止时间
+        """
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return
+        if self._waiting >= self.route_class.max_queue:
+            raise Overloaded(self.route_class.name)
+        self._waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                self._semaphore.acquire(),
+                timeout=self.route_class.queue_timeout if timeout is None else timeout
+            )
+        except asyncio.TimeoutError:
+            raise Overloaded(self.route_class.name)
+        finally:
+            self._waiting -= 1
+            metrics.observe("admission_queue_wait_ms", (time.perf_counter() - started) * 1000, route_class=self.route_class.name)
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+def default_route_classes() -> Dict[str, RouteClass]:
+    """按配置创建默认的路由类别"""
+    timeout = settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000
+    return {
+        "expensive": RouteClass(
+            "expensive",
+            settings.EXPENSIVE_ROUTE_CONCURRENCY,
+            settings.ADMISSION_QUEUE_LIMIT,
+            timeout,
+            cost=settings.EXPENSIVE_ROUTE_COST,
+            degrade_to="search",
+        ),
+        "search": RouteClass("search", settings.SEARCH_ROUTE_CONCURRENCY, settings.ADMISSION_QUEUE_LIMIT, timeout),
+        "default": RouteClass("default", settings.DEFAULT_ROUTE_CONCURRENCY, settings.ADMISSION_QUEUE_LIMIT, timeout),
+    }
+
+
+def parse_api_keys(value: str) -> frozenset:
+    """解析逗号分隔的API密钥配置"""
+    return frozenset(key.strip() for key in value.split(",") if key.strip())
+
+
+def default_exempt_paths() -> Tuple[str, ...]:
+    """不经过准入控制的路径：健康检查、指标和本服务直接提供的媒体文件"""
+    paths = ["/health", "/metrics"]
+    if settings.MEDIA_BASE_URL.startswith("/"):
+        paths.append(settings.MEDIA_BASE_URL.rstrip("/"))
+    return tuple(paths)
+
+
+def classify_route(path: str) -> str:
+    """根据请求路径确定路由类别"""
+    if path.startswith(f"{settings.API_PREFIX}/search/natural"):
+        return "expensive"
+    if path.startswith(f"{settings.API_PREFIX}/search"):
+        return "search"
+    return "default"
+
+
+class AdmissionMiddleware:
+    """
+    ASGI准入控制中间件
+
+    先按客户端做令牌桶限流（超限返回429），再按路由类别限制并发：
+    排队超过截止时间或队列已满时返回503；可降级的类别饱和时改走降级类别，
+    由端点根据 request.state.degraded 提供低成本结果。
+    健康检查、指标和媒体文件不受限制，避免过载时探针失败或静态资源被挤占。
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        route_classes: Optional[Dict[str, RouteClass]] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        classifier: Callable[[str], str] = classify_route,
+        api_keys: Optional[Iterable[str]] = None,
+        exempt_paths: Optional[Iterable[str]] = None,
+    ):
+        self.app = app
+        self.route_classes = route_classes or default_route_classes()
+        self.limiters = {name: ConcurrencyLimiter(rc) for name, rc in self.route_classes.items()}
+        self.rate_limiter = rate_limiter or RateLimiter(settings.RATE_LIMIT_RPS, settings.RATE_LIMIT_BURST)
+        self.classifier = classifier
+        self.api_keys = frozenset(api_keys) if api_keys is not None else parse_api_keys(settings.API_KEYS)
+        self.exempt_paths = tuple(exempt_paths) if exempt_paths is not None else default_exempt_paths()
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope.get("method") == "OPTIONS" or self._exempt(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self.route_classes[self.classifier(scope["path"])]
+        client = self._client_key(scope)
+        retry_after = self.rate_limiter.acquire(client, route_class.cost)
+        if retry_after is not None:
+            metrics.inc("admission_rejected_total", route_class=route_class.name, reason="rate_limited")
+            await self._reject(send, 429, "请求过于频繁，请稍后重试", retry_after)
+            return
+
+        limiter = self.limiters[route_class.name]
+        if route_class.degrade_to and limiter.saturated:
+            # 昂贵路由已满时不排队，直接转入降级类别
+            metrics.inc("admission_degraded_total", route_class=route_class.name)
+            scope.setdefault("state", {})["degraded"] = True
+            limiter = self.limiters[route_class.degrade_to]
+
+        try:
+            await limiter.acquire()
+        except Overloaded:
+            metrics.inc("admission_rejected_total", route_class=limiter.route_class.name, reason="overloaded")
+            await self._reject(send, 503, "服务繁忙，请稍后重试", limiter.route_class.queue_timeout)
+            return
+
+        metrics.inc("admission_admitted_total", route_class=limiter.route_class.name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+    def _exempt(self, path: str) -> bool:
+        return any(path == prefix or path.startswith(prefix + "/") for prefix in self.exempt_paths)
+
+    def _client_key(self, scope: Dict[str, Any]) -> str:
+        """
+        已签发的API密钥按密钥识别客户端，否则使用IP
+
+        未校验的密钥头不能作为限流键，否则客户端每次换一个密钥就能得到新的令牌桶。
+        """
+        for name, value in scope.get("headers") or []:
+            if name == b"x-api-key" and value:
+                key = value.decode("latin-1")
+                if key in self.api_keys:
+                    return "key:" + key
+                break
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    async def _reject(self, send: Any, status: int, detail: str, retry_after: float) -> None:
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """带过期时间的LRU缓存，超过容量时淘汰最久未使用的条目"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取未过期的值，命中时刷新LRU顺序"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < self._clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """写入值，可为单个条目指定过期时间"""
+        with self._lock:
+            self._data[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+class PartitionedTTLCache:
+    """
+    按分区（例如租户）隔离的带过期时间LRU缓存
+
+    每个分区最多 partition_size 个条目，超出时淘汰该分区最久未使用的条目，
+    一个分区的热点不会挤掉其他分区的缓存；所有分区合计超过 maxsize 时，
+    从最久未访问的分区开始淘汰。读写只访问所在分区，开销与分区数量无关。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        partition_size: Optional[int] = None,
+        ttl: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.partition_size = partition_size or maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._partitions: "OrderedDict[Hashable, OrderedDict[Hashable, Tuple[float, Any]]]" = OrderedDict()
+        self._size = 0
+
+    def get(self, partition: Hashable, key: Hashable, default: Any = None) -> Any:
+        """读取未过期的值，命中时刷新条目和分区的LRU顺序"""
+        with self._lock:
+            entries = self._partitions.get(partition)
+            item = entries.get(key) if entries is not None else None
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < self._clock():
+                self._remove(partition, entries, key)
+                return default
+            entries.move_to_end(key)
+            self._partitions.move_to_end(partition)
+            return value
+
+    def set(self, partition: Hashable, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """写入值，超出分区配额或总容量时淘汰"""
+        with self._lock:
+            entries = self._partitions.get(partition)
+            if entries is None:
+                entries = self._partitions[partition] = OrderedDict()
+            if key not in entries:
+                self._size += 1
+            entries[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+            entries.move_to_end(key)
+            self._partitions.move_to_end(partition)
+            while len(entries) > self.partition_size:
+                entries.popitem(last=False)
+                self._size -= 1
+            while self._size > self.maxsize:
+                oldest_partition, oldest_entries = next(iter(self._partitions.items()))
+                self._remove(oldest_partition, oldest_entries, next(iter(oldest_entries)))
+
+    def pop(self, partition: Hashable, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entries = self._partitions.get(partition)
+            if entries is None or key not in entries:
+                return default
+            value = entries[key][1]
+            self._remove(partition, entries, key)
+            return value
+
+    def clear(self, partition: Optional[Hashable] = None) -> None:
+        """清空指定分区，不指定时清空全部"""
+        with self._lock:
+            if partition is None:
+                self._partitions.clear()
+                self._size = 0
+                return
+            entries = self._partitions.pop(partition, None)
+            if entries is not None:
+                self._size -= len(entries)
+
+    def partition_len(self, partition: Hashable) -> int:
+        entries = self._partitions.get(partition)
+        return len(entries) if entries is not None else 0
+
+    def _remove(self, partition: Hashable, entries: "OrderedDict[Hashable, Tuple[float, Any]]", key: Hashable) -> None:
+        del entries[key]
+        self._size -= 1
+        if not entries:
+            del self._partitions[partition]
+
+    def __len__(self) -> int:
+        return self._size
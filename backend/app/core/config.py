@@ -2,7 +2,7 @@ import os
 from pathlib import Path
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
-from typing import List
+from typing import List, Optional
 
 # 加载 .env 文件
 dotenv_path = Path(__file__).parent.parent.parent / ".env"
@@ -23,6 +23,7 @@ class Settings(BaseSettings):
         "DATABASE_URL", 
         "sqlite+aiosqlite:///./ecommerce.db"
     )
+    SQLITE_BUSY_TIMEOUT_MS: int = 10000  # 并发写入时等待写锁的最长时间
     
     # 安全配置
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here-for-dev-only")
@@ -35,12 +36,132 @@ class Settings(BaseSettings):
     # AI服务配置
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     DEFAULT_AI_MODEL: str = "gpt-3.5-turbo"
+    FAST_AI_MODEL: str = "gpt-3.5-turbo"
+
+    # 意图路由配置
+    INTENT_LATENCY_BUDGET_MS: float = 2000  # 单次请求留给意图解析的时间预算
+    INTENT_RULE_CONFIDENCE: float = 0.75  # 规则解析置信度达到该值时跳过LLM
+    DEFAULT_AI_MODEL_EXPECTED_MS: float = 1500  # 模型耗时的初始估计
+    FAST_AI_MODEL_EXPECTED_MS: float = 600
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 3  # 连续失败多少次后熔断
+    LLM_BREAKER_RECOVERY_SECONDS: float = 30  # 熔断后多久进入半开探测
+    INTENT_COMPACT_OUTPUT: bool = True  # 使用紧凑JSON输出并流式解析
+    INTENT_RESPONSE_FORMAT: str = "json_object"  # json_object / function / text
+    INTENT_MAX_TOKENS: int = 120
+    INTENT_STREAM_WORKERS: int = 8  # 消费LLM流式响应的专用线程数，超出的调用排队直到超时
+    INTENT_SPECULATIVE_MAX_CANDIDATES: int = 2000  # 提前搜索最多取出的候选行数，超出时等完整意图到达后再查询
+    
+    # 库存/价格写合并配置
+    WRITE_BATCH_INTERVAL_MS: float = 20  # 组提交间隔
+    WRITE_BATCH_MAX_SIZE: int = 500  # 积压达到该数量时立即提交
+    
+    # 准入控制配置
+    ADMISSION_ENABLED: bool = True
+    RATE_LIMIT_RPS: float = 20  # 每个API密钥/IP每秒补充的令牌数
+    RATE_LIMIT_BURST: float = 40  # 令牌桶容量
+    EXPENSIVE_ROUTE_COST: float = 5  # 自然语言搜索每次消耗的令牌数
+    EXPENSIVE_ROUTE_CONCURRENCY: int = 8
+    SEARCH_ROUTE_CONCURRENCY: int = 32
+    DEFAULT_ROUTE_CONCURRENCY: int = 64
+    ADMISSION_QUEUE_LIMIT: int = 64  # 每个路由类别最多排队的请求数
+    ADMISSION_QUEUE_TIMEOUT_MS: float = 500  # 排队超过该时间返回503
+    API_KEYS: str = os.getenv("API_KEYS", "")  # 已签发的API密钥，逗号分隔；只有列出的密钥按密钥限流，其余请求按IP限流
+    
+    # 多租户配置，请求通过 X-Tenant-ID 头指定店铺，未指定时使用默认租户
+    DEFAULT_TENANT_ID: str = "default"
+    TENANT_HEADER_REQUIRED: bool = False
+    TENANT_IDS: str = os.getenv("TENANT_IDS", "")  # 已开通的租户ID，逗号分隔；默认租户始终可用，其他租户请求返回403
+    
+    # 缓存配置（结果缓存按租户分区，容量为所有租户合计）
+    TENANT_CACHE_SHARE: float = 0.25  # 单个租户最多占用每个缓存容量的比例
+    INTENT_CACHE_SIZE: int = 10000
+    INTENT_CACHE_TTL: float = 3600
+    SEARCH_RESULT_CACHE_SIZE: int = 2000
+    SEARCH_RESULT_CACHE_TTL: float = 30
+    PRODUCT_DETAIL_CACHE_SIZE: int = 5000
+    PRODUCT_DETAIL_CACHE_TTL: float = 600
+    FEATURED_CACHE_TTL: float = 60
+    
+    # 列式内存筛选配置，关闭时筛选和分页全部走数据库
+    FILTER_STORE_ENABLED: bool = True
+    FILTER_STORE_MAX_MB: float = 512  # 所有租户存储合计的内存上限，超出时淘汰最久未访问的租户
+    
+    # 性能诊断配置，默认关闭；开启后提供管理端采样接口、慢请求记录和事件循环延迟监控
+    PROFILING_ENABLED: bool = False
+    ADMIN_TOKEN: Optional[str] = os.getenv("ADMIN_TOKEN")  # 管理端接口需携带 X-Admin-Token；未设置时管理端接口不可用
+    PROFILER_INTERVAL_MS: float = 5
+    PROFILER_MAX_SECONDS: float = 60
+    SLOW_REQUEST_MS: float = 1000
+    SLOW_REQUEST_HISTORY: int = 100
+    LOOP_LAG_INTERVAL_MS: float = 50
+    LOOP_LAG_THRESHOLD_MS: float = 100
     
+    # 热门产品配置
+    TRENDING_ENABLED: bool = True
+    TRENDING_REFRESH_SECONDS: float = 60  # 排名物化和推荐列表刷新间隔
+    TRENDING_HALF_LIFE_SECONDS: float = 3600  # 热度衰减半衰期
+    TRENDING_TOP_K: int = 100  # 每个租户的热门产品数
+    TRENDING_MAX_CANDIDATES: int = 20000  # 所有租户合计跟踪的候选产品数
+    TRENDING_CLICK_WEIGHT: float = 3.0  # 一次搜索点击相当于多少次浏览
+    TRENDING_SKETCH_WIDTH: int = 4096
+    TRENDING_SKETCH_DEPTH: int = 4
+
+    # 查询规范化与纠错配置，关闭纠错时仍做全角/半角折叠和繁简转换
+    QUERY_CORRECTION_ENABLED: bool = True
+    QUERY_CORRECTION_MAX_DISTANCE: int = 2  # 长拉丁词允许的最大编辑距离，短词和汉字固定为1
+
+    # 图片处理流水线配置，原图和缩略图按内容哈希存放在 MEDIA_DIR，经 MEDIA_BASE_URL 对外提供
+    MEDIA_PIPELINE_ENABLED: bool = True
+    MEDIA_BASE_URL: str = os.getenv("MEDIA_BASE_URL", "/media")  # 可设为CDN地址；以 / 开头时由本服务直接提供
+    MEDIA_WORKERS: int = 4
+    MEDIA_QUEUE_SIZE: int = 1000  # 队列满时新任务被丢弃，下次启动时补处理
+    MEDIA_THUMBNAIL_SIZE: int = 320  # 缩略图最长边像素
+    MEDIA_FETCH_TIMEOUT: float = 10
+    MEDIA_MAX_BYTES: int = 10 * 1024 * 1024
+    MEDIA_MAX_ATTEMPTS: int = 3  # 处理失败的图片最多尝试的次数（包括进程内的退避重试和启动时的补处理）
+    MEDIA_RETRY_BASE_SECONDS: float = 30  # 下载失败后的首次重试间隔，之后每次加倍
+    MEDIA_MAX_REDIRECTS: int = 5
+    MEDIA_ALLOWED_HOSTS: str = os.getenv("MEDIA_ALLOWED_HOSTS", "")  # 允许下载图片的域名（含子域名），逗号分隔；为空时不限制域名
+
+    # 库存预留配置
+    INVENTORY_RESERVATION_TTL_SECONDS: float = 900  # 未确认的预留过期后返还库存
+    INVENTORY_MAX_TTL_SECONDS: float = 3600
+    INVENTORY_MAX_QUANTITY: int = 1000  # 单次预留的最大数量
+    INVENTORY_BATCH_INTERVAL_MS: float = 5  # 预留组提交间隔
+    INVENTORY_BATCH_MAX_SIZE: int = 500
+    INVENTORY_HOT_THRESHOLD: float = 20  # 每秒预留次数达到该值的产品改为从进程内额度分配
+    INVENTORY_LEASE_SIZE: int = 100  # 热门产品每次从数据库扣下的额度
+    INVENTORY_RECONCILE_SECONDS: float = 2  # 额度续期、冷却产品额度返还和过期预留清理的间隔
+    INVENTORY_LEASE_TTL_SECONDS: float = 30  # 进程未续期的额度过期后返还库存
+
     # 文件路径
     BASE_DIR: Path = Path(__file__).parent.parent.parent
     DATA_DIR: Path = BASE_DIR / "data"
     MEDIA_DIR: Path = BASE_DIR / "media"
     
+    # 查询日志配置
+    QUERY_LOG_ENABLED: bool = True
+    QUERY_LOG_DIR: Path = DATA_DIR / "query_logs"
+    QUERY_LOG_FLUSH_INTERVAL_SECONDS: float = 1.0
+    QUERY_LOG_BATCH_SIZE: int = 500
+    QUERY_LOG_QUEUE_SIZE: int = 10000  # 队列满时丢弃新记录，不阻塞请求
+    QUERY_LOG_ROTATE_MB: int = 16
+    QUERY_LOG_MAX_FILES: int = 50
+    
+    # 缓存预热配置
+    WARMUP_ENABLED: bool = True
+    WARMUP_QUERIES_FILE: Path = DATA_DIR / "warmup_queries.txt"  # 每行一个查询，可由 app.tools.query_report 生成
+    WARMUP_FROM_LOGS: bool = True  # 预热文件不存在时从查询日志中选取热门查询
+    WARMUP_MAX_QUERIES: int = 200
+    WARMUP_PAGE_SIZE: int = 10
+    WARMUP_TOP_PRODUCTS: int = 50  # 预先生成详情的产品数量
+    WARMUP_THROTTLE_MS: float = 50  # 每项预热之间的间隔，避免挤占线上请求
+    WARMUP_RESULT_TTL: float = 900  # 预热的搜索结果缓存时长，产品写入时按租户失效
+    WARMUP_REFRESH_SECONDS: float = 600  # 定期重新预热搜索结果的间隔，应小于 WARMUP_RESULT_TTL；0 表示只在启动时预热
+    
+    # 常用词表，每行一个词；表中的词不会被纠错改写（内置常用商品词之外的补充）
+    QUERY_LEXICON_FILE: Path = DATA_DIR / "lexicon.txt"
+    
     class Config:
         case_sensitive = True
         env_file = dotenv_path
@@ -0,0 +1,81 @@
+import threading
+from typing import Any, Dict, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    """把标签字典转换为可哈希且顺序稳定的键"""
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_key(name: str, key: LabelKey) -> str:
+    if not key:
+        return name
+    inner = ",".join(f"{k}={v}" for k, v in key)
+    return f"{name}{{{inner}}}"
+
+
+class MetricsRegistry:
+    """进程内指标注册表，记录计数器、仪表和耗时分布"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._gauges: Dict[Tuple[str, LabelKey], float] = {}
+        self._summaries: Dict[Tuple[str, LabelKey], Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """计数器累加"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """设置仪表当前值"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """记录一次观测值（如耗时），维护次数、总和、最小值和最大值"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = {"count": 1, "sum": value, "min": value, "max": value}
+                return
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+
+    def get_counter(self, name: str, **labels: Any) -> float:
+        """读取计数器当前值"""
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出所有指标的快照"""
+        with self._lock:
+            summaries = {}
+            for (name, key), summary in self._summaries.items():
+                item = dict(summary)
+                item["avg"] = item["sum"] / item["count"] if item["count"] else 0
+                summaries[_format_key(name, key)] = item
+            return {
+                "counters": {_format_key(n, k): v for (n, k), v in self._counters.items()},
+                "gauges": {_format_key(n, k): v for (n, k), v in self._gauges.items()},
+                "summaries": summaries,
+            }
+
+    def reset(self) -> None:
+        """清空所有指标"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+
+# 全局指标实例
+metrics = MetricsRegistry()
@@ -0,0 +1,261 @@
+import asyncio
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame: Any) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame: Any) -> str:
+    """把调用栈转换为火焰图折叠格式（根在前，分号分隔）"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    统计采样分析器
+
+    在独立线程中按固定间隔读取事件循环线程的调用栈并计数，
+    结果为 flamegraph.pl / speedscope 可直接读取的折叠栈文本。同一时间只允许一次采样。
+    """
+
+    def __init__(self, interval: float = settings.PROFILER_INTERVAL_MS / 1000):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def sample(self, thread_id: int, seconds: float) -> str:
+        """
+        阻塞采样指定线程，应在线程池中调用
+
+        Raises:
+            RuntimeError: 已有采样在进行
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("已有采样在进行")
+        try:
+            stacks: Counter = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    stacks[collapse_stack(frame)] += 1
+                time.sleep(self.interval)
+            metrics.inc("profiler_samples_total", sum(stacks.values()))
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally:
+            self._lock.release()
+
+    async def profile_loop(self, seconds: float) -> str:
+        """采样当前事件循环所在线程，采样期间事件循环照常处理请求"""
+        return await asyncio.to_thread(self.sample, threading.get_ident(), seconds)
+
+
+class LoopLagMonitor:
+    """
+    事件循环延迟监控
+
+    协程按固定间隔醒来并记录心跳和调度延迟；看门狗线程发现心跳停滞超过阈值时，
+    记录事件循环线程当前的调用栈，定位阻塞事件循环的同步代码（例如同步的OpenAI客户端）。
+    """
+
+    def __init__(
+        self,
+        interval: float = settings.LOOP_LAG_INTERVAL_MS / 1000,
+        threshold: float = settings.LOOP_LAG_THRESHOLD_MS / 1000,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self._heartbeat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self._watchdog.join)
+        self._watchdog = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag_ms = max(0.0, now - expected) * 1000
+            metrics.observe("event_loop_lag_ms", lag_ms)
+            if lag_ms >= self.threshold * 1000:
+                metrics.inc("event_loop_blocked_total")
+                logger.warning(f"事件循环延迟 {lag_ms:.0f}ms")
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat
+            # 每次停滞只记录一次调用栈
+            if stalled < self.threshold + self.interval or reported == heartbeat:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning(f"事件循环已阻塞 {stalled * 1000:.0f}ms，当前调用栈:\n{stack}")
+
+
+@dataclass
+class RequestProfile:
+    """单个请求的耗时记录"""
+    method: str
+    path: str
+    started: float = field(default_factory=time.perf_counter)
+    sql: List[Dict[str, Any]] = field(default_factory=list)
+    annotations: Dict[str, Any] = field(default_factory=dict)
+
+
+_current_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+def annotate(**values: Any) -> None:
+    """为当前请求附加诊断信息（例如解析出的意图），未启用慢请求记录时不做任何事"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.annotations.update(values)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    # 异步引擎在greenlet中执行同步事件，greenlet沿用发起查询的协程的上下文，能读到当前请求
+    profile = _current_profile.get()
+    if profile is None:
+        return
+    profile.sql.append({
+        "statement": " ".join(statement.split()),
+        "parameters": repr(parameters)[:200],
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+    })
+
+
+def instrument_engine(engine: Engine) -> None:
+    """在同步引擎上注册事件，记录当前请求执行的SQL及耗时，重复调用只注册一次"""
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def uninstrument_engine(engine: Engine) -> None:
+    """移除 instrument_engine 注册的事件"""
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class SlowRequestMiddleware:
+    """
+    慢请求记录中间件
+
+    为每个请求建立耗时记录，请求执行的SQL由引擎事件写入；
+    总耗时超过阈值时把SQL、耗时和附加信息写入日志并保留在最近慢请求列表中。
+    """
+
+    def __init__(self, app: Any, threshold_ms: float = settings.SLOW_REQUEST_MS, history: Optional[Deque] = None):
+        self.app = app
+        self.threshold_ms = threshold_ms
+        self.history = slow_requests if history is None else history
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope.get("method", ""), scope["path"])
+        status: Dict[str, int] = {}
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            elapsed_ms = (time.perf_counter() - profile.started) * 1000
+            if elapsed_ms >= self.threshold_ms:
+                self._record(profile, elapsed_ms, status.get("code"))
+
+    def _record(self, profile: RequestProfile, elapsed_ms: float, status: Optional[int]) -> None:
+        record = {
+            "ts": round(time.time(), 3),
+            "method": profile.method,
+            "path": profile.path,
+            "status": status,
+            "ms": round(elapsed_ms, 2),
+            "sql_ms": round(sum(query["ms"] for query in profile.sql), 2),
+            "sql": profile.sql,
+            **profile.annotations,
+        }
+        self.history.append(record)
+        metrics.inc("slow_requests_total", path=profile.path)
+        logger.warning(f"慢请求: {json.dumps(record, ensure_ascii=False, default=str)}")
+
+
+# 最近的慢请求记录
+slow_requests: Deque[Dict[str, Any]] = deque(maxlen=settings.SLOW_REQUEST_HISTORY)
+
+# 全局采样分析器和事件循环监控
+profiler = SamplingProfiler()
+loop_monitor = LoopLagMonitor()
@@ -1,5 +1,5 @@
 from typing import AsyncGenerator
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -14,6 +14,21 @@ engine = create_async_engine(
     future=True,
 )
 
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        """
+        使用WAL日志并设置忙等待超时
+
+        默认的回滚日志模式下，读事务持有共享锁时另一个连接无法提交；多个会话并发写入
+        （预留组提交、释放和确认）时可能直接返回 database is locked。WAL模式下读写互不阻塞，
+        写事务之间按忙等待超时排队。
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
 # 创建异步会话
 async_session_factory = sessionmaker(
     engine, 
@@ -3,9 +3,13 @@ import logging
 import os
 from pathlib import Path
 
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
 from app.db.database import engine, Base, get_db
-from app.models.product import Product
+from app.models.inventory import InventoryReservation  # 导入模型以便 create_all 创建预留表
+from app.models.product import Product, ProductRanking, ProductSearch
+from app.services import search_projection
 from app.services.product_service import ProductService
 
 logger = logging.getLogger(__name__)
@@ -17,17 +21,58 @@ async def init_db():
     try:
         # 创建所有定义的表
         async with engine.begin() as conn:
+            await conn.run_sync(_migrate_tenant_columns)
+            await conn.run_sync(_drop_outdated_derived_tables)
             await conn.run_sync(Base.metadata.create_all)
         
         logger.info("数据库表创建完成")
         
         # 加载示例产品数据
         await load_sample_data()
+        
+        # 确保搜索投影与产品表一致
+        async for db in get_db():
+            await search_projection.ensure_projection(db)
     
     except Exception as e:
         logger.error(f"初始化数据库失败: {str(e)}")
         raise
 
+def _migrate_tenant_columns(conn) -> None:
+    """
+    为多租户之前创建的数据库补充租户列
+    
+    已有产品归入默认租户；搜索投影和热门排名是派生数据，由 _drop_outdated_derived_tables 删除后重建。
+    SQLite无法修改旧库中SKU的全局唯一约束，旧库仍要求SKU全局唯一。
+    """
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    
+    def has_tenant_column(table_name: str) -> bool:
+        return "tenant_id" in {column["name"] for column in inspector.get_columns(table_name)}
+    
+    if "products" in tables and not has_tenant_column("products"):
+        conn.execute(text(
+            "ALTER TABLE products ADD COLUMN tenant_id VARCHAR(64) NOT NULL "
+            f"DEFAULT '{settings.DEFAULT_TENANT_ID}'"
+        ))
+        for index in Product.__table__.indexes:
+            index.create(conn, checkfirst=True)
+        logger.info("已为产品表添加租户列，现有产品归入默认租户")
+
+def _drop_outdated_derived_tables(conn) -> None:
+    """搜索投影和热门排名是派生数据，缺少模型中的列时直接删除，由启动流程按新结构重建"""
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    for table in (ProductSearch.__table__, ProductRanking.__table__):
+        if table.name not in tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = set(table.columns.keys()) - existing
+        if missing:
+            table.drop(conn)
+            logger.info(f"已删除旧的 {table.name} 表（缺少列 {sorted(missing)}），将重建")
+
 async def load_sample_data():
     """
     从JSON文件加载示例产品数据
@@ -1,8 +1,23 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
 from app.api.api import api_router
+from app.api.endpoints.search import ai_service
+from app.core.admission import AdmissionMiddleware
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.profiling import SlowRequestMiddleware, instrument_engine, loop_monitor
+from app.db.database import engine
 from app.db.init_db import init_db
+from app.services.filter_store import filter_stores
+from app.services.inventory import inventory_service
+from app.services.media import media_pipeline
+from app.services.query_log import query_logger
+from app.services.query_normalizer import query_normalizer
+from app.services.trending import trending_engine
+from app.services.warmup import CacheWarmer
+from app.services.write_behind import write_queue
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -10,6 +25,15 @@ app = FastAPI(
     version="0.1.0",
 )
 
+# 添加准入控制中间件（先于CORS添加，使被拒绝的响应也带有CORS头）
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
+# 慢请求记录（在准入控制外层，耗时包含排队等待）
+if settings.PROFILING_ENABLED:
+    instrument_engine(engine.sync_engine)
+    app.add_middleware(SlowRequestMiddleware)
+
 # 添加CORS中间件
 app.add_middleware(
     CORSMiddleware,
@@ -22,11 +46,76 @@ app.add_middleware(
 # 包含API路由
 app.include_router(api_router, prefix=settings.API_PREFIX)
 
+# 未配置CDN时由本服务提供处理后的图片，文件名为内容哈希，可长期缓存
+if settings.MEDIA_BASE_URL.startswith("/"):
+    app.mount(settings.MEDIA_BASE_URL, StaticFiles(directory=settings.MEDIA_DIR), name="media")
+
+# 缓存预热，完成前就绪检查返回503
+cache_warmer = CacheWarmer(ai_service)
+
 @app.on_event("startup")
 async def startup_event():
     # 初始化数据库
     await init_db()
+    # 预先加载默认租户的列式筛选存储，其他租户在首次访问时加载
+    if settings.FILTER_STORE_ENABLED:
+        await filter_stores.get(settings.DEFAULT_TENANT_ID)
+    # 在后台从产品表构建查询纠错词表
+    if settings.QUERY_CORRECTION_ENABLED:
+        query_normalizer.start()
+    # 启动图片处理流水线，并在后台补处理尚未处理的图片
+    if settings.MEDIA_PIPELINE_ENABLED:
+        await media_pipeline.start()
+    # 启动库存/价格写合并队列
+    await write_queue.start()
+    # 启动库存预留的组提交和额度维护
+    await inventory_service.start()
+    # 启动查询日志
+    if settings.QUERY_LOG_ENABLED:
+        await query_logger.start()
+    # 恢复热门排名并启动定期刷新
+    if settings.TRENDING_ENABLED:
+        await trending_engine.start()
+    # 监控事件循环延迟
+    if settings.PROFILING_ENABLED:
+        loop_monitor.start()
+    # 在后台预热缓存
+    if settings.WARMUP_ENABLED:
+        cache_warmer.start()
+    else:
+        cache_warmer.ready.set()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await cache_warmer.stop()
+    await loop_monitor.stop()
+    await query_normalizer.stop()
+    await media_pipeline.stop()
+    await trending_engine.stop()
+    # 提交积压的预留并返还进程持有的额度
+    await inventory_service.stop()
+    # 提交积压的库存/价格更新
+    await write_queue.stop()
+    # 写出剩余的查询日志
+    await query_logger.stop()
 
 @app.get("/")
 async def root():
-    return {"message": "欢迎使用AI电商助手API"}
\ No newline at end of file
+    return {"message": "欢迎使用AI电商助手API"}
+
+@app.get("/health/live")
+async def liveness():
+    """存活检查"""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def readiness():
+    """就绪检查，缓存预热完成后才返回就绪"""
+    if not cache_warmer.ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming"})
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """导出进程内指标"""
+    return metrics.snapshot()
\ No newline at end of file
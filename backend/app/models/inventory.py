@@ -0,0 +1,40 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String
+from sqlalchemy.sql import func
+
+from app.core.config import settings
+from app.db.database import Base
+
+# 预留状态
+RESERVATION_HELD = "held"
+RESERVATION_CONFIRMED = "confirmed"
+RESERVATION_RELEASED = "released"
+RESERVATION_EXPIRED = "expired"
+# 进程为热门产品预先扣下的库存额度，quantity 为尚未分配给预留的数量
+RESERVATION_LEASE = "lease"
+
+
+class InventoryReservation(Base):
+    """
+    库存预留
+
+    预留创建时已从产品库存中扣除；确认后库存不再返还，释放或过期时返还。
+    状态为 lease 的行是应用进程为热门产品整块扣下的库存额度，owner 为持有该额度的进程，
+    进程定期续期，进程退出后额度过期并由任意进程返还到产品库存。
+    """
+    __tablename__ = "inventory_reservations"
+
+    id = Column(String(32), primary_key=True)
+    tenant_id = Column(String(64), nullable=False, default=settings.DEFAULT_TENANT_ID)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    status = Column(String(16), nullable=False)
+    owner = Column(String(32), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # 过期清理按状态和过期时间扫描
+        Index("ix_inventory_reservations_status_expires", "status", "expires_at"),
+        Index("ix_inventory_reservations_tenant_product", "tenant_id", "product_id"),
+    )
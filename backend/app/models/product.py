@@ -1,32 +1,76 @@
-from sqlalchemy import Column, Integer, String, Float, Text, JSON, DateTime, ForeignKey, Table
+from sqlalchemy import Boolean, Column, Integer, String, Float, Text, JSON, DateTime, ForeignKey, Index, Table, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from typing import Dict, List, Any, Optional
 
+from app.core.config import settings
 from app.db.database import Base
 
 class Product(Base):
-    """产品数据库模型"""
+    """产品数据库模型，每个产品属于一个租户（店铺）"""
     __tablename__ = "products"
 
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String(64), nullable=False, default=settings.DEFAULT_TENANT_ID)
     name = Column(String(255), nullable=False, index=True)
     description = Column(Text, nullable=True)
     price = Column(Float, nullable=False)
     currency = Column(String(3), default="CNY")
-    category = Column(String(100), nullable=False, index=True)
+    category = Column(String(100), nullable=False)
     stock = Column(Integer, default=0)
     image_url = Column(String(512), nullable=True)
-    sku = Column(String(50), unique=True, nullable=False, index=True)
+    sku = Column(String(50), nullable=False, index=True)
     tags = Column(JSON, default=list)
     attributes = Column(JSON, default=dict)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+    # 图片处理结果，随产品一起加载，响应中直接使用预先计算的URL和尺寸
+    media = relationship(
+        "ProductMedia", uselist=False, lazy="joined", cascade="all, delete-orphan", passive_deletes=True
+    )
+
+    # 所有查询都以租户为前缀，不会扫描其他租户的行；SKU只需在租户内唯一
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "sku", name="uq_products_tenant_sku"),
+        Index("ix_products_tenant_category", "tenant_id", "category"),
+        Index("ix_products_tenant_created", "tenant_id", "created_at", "id"),
+    )
+
+    @property
+    def ready_media(self) -> Optional["ProductMedia"]:
+        """已处理完成且与当前图片地址一致的图片信息，图片更换后在重新处理前返回None"""
+        media = self.media
+        if media is None or media.status != MEDIA_READY or media.source_url != self.image_url:
+            return None
+        return media
+
+    @property
+    def display_image_url(self) -> Optional[str]:
+        """响应中的图片地址：处理完成后为CDN地址，否则为原始地址"""
+        media = self.ready_media
+        return media.image_url if media is not None else self.image_url
+
+    @property
+    def thumbnail_url(self) -> Optional[str]:
+        media = self.ready_media
+        return media.thumbnail_url if media is not None else None
+
+    @property
+    def image_width(self) -> Optional[int]:
+        media = self.ready_media
+        return media.width if media is not None else None
+
+    @property
+    def image_height(self) -> Optional[int]:
+        media = self.ready_media
+        return media.height if media is not None else None
+
     def to_dict(self) -> Dict[str, Any]:
         """将模型转换为字典"""
         return {
             "id": self.id,
+            "tenant_id": self.tenant_id,
             "name": self.name,
             "description": self.description,
             "price": self.price,
@@ -45,6 +89,7 @@ class Product(Base):
     def from_dict(cls, data: Dict[str, Any]) -> "Product":
         """从字典创建模型实例"""
         return cls(
+            tenant_id=data.get("tenant_id", settings.DEFAULT_TENANT_ID),
             name=data.get("name"),
             description=data.get("description"),
             price=data.get("price"),
@@ -55,4 +100,89 @@ class Product(Base):
             sku=data.get("sku"),
             tags=data.get("tags", []),
             attributes=data.get("attributes", {})
-        )
\ No newline at end of file
+        )
+
+
+class Category(Base):
+    """产品类别字典表，为搜索投影提供整数类别ID"""
+    __tablename__ = "categories"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, nullable=False, index=True)
+
+
+class ProductSearch(Base):
+    """
+    产品搜索投影
+
+    只保存搜索和列表页需要的字段，由ProductService在产品写入时同步维护。
+    描述完整保存，搜索结果与产品详情返回相同的描述。
+    复合索引以租户为前缀，覆盖租户内按类别+价格、类别+创建时间的筛选、排序和分页，
+    查询只需扫描该租户的索引范围即可得到结果页的ID。
+    """
+    __tablename__ = "product_search"
+
+    id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    tenant_id = Column(String(64), nullable=False, default=settings.DEFAULT_TENANT_ID)
+    name = Column(String(255), nullable=False)
+    description = Column(Text, nullable=True)
+    price = Column(Float, nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    in_stock = Column(Boolean, nullable=False, default=False)
+    popularity = Column(Float, nullable=False, default=0.0)
+    search_text = Column(Text, nullable=False, default="")
+    image_url = Column(String(512), nullable=True)
+    thumbnail_url = Column(String(512), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_product_search_tenant_category_price", "tenant_id", "category_id", "price", "id"),
+        Index("ix_product_search_tenant_category_created", "tenant_id", "category_id", "created_at", "id"),
+        Index("ix_product_search_tenant_price", "tenant_id", "price", "id"),
+        Index("ix_product_search_tenant_created", "tenant_id", "created_at", "id"),
+    )
+
+
+class ProductRanking(Base):
+    """热门产品排名物化表，排名在租户内计算，由热度引擎定期整体替换"""
+    __tablename__ = "product_rankings"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    tenant_id = Column(String(64), nullable=False, default=settings.DEFAULT_TENANT_ID)
+    rank = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_product_rankings_tenant_rank", "tenant_id", "rank"),
+    )
+
+
+# 图片处理状态
+MEDIA_READY = "ready"
+MEDIA_FAILED = "failed"
+
+
+class ProductMedia(Base):
+    """
+    产品图片处理结果
+
+    由图片处理流水线在后台写入：原图和缩略图按内容哈希存放在媒体目录，
+    记录可直接返回给前端的CDN地址和尺寸。source_url 为处理时的原始图片地址，
+    与产品当前地址不一致说明图片已更换、结果已过期。
+    """
+    __tablename__ = "product_media"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    tenant_id = Column(String(64), nullable=False, default=settings.DEFAULT_TENANT_ID)
+    source_url = Column(String(512), nullable=False)
+    status = Column(String(16), nullable=False)
+    content_hash = Column(String(64), nullable=True)
+    content_type = Column(String(32), nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    image_url = Column(String(512), nullable=True)
+    thumbnail_url = Column(String(512), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String(255), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,210 @@
+# app/schemas/intent.py
+import sys
+from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+# 紧凑输出的排序代码与原有排序偏好文本的对应关系
+SORT_CODES = {
+    "pa": "价格从低到高",
+    "pd": "价格从高到低",
+    "new": "最新",
+}
+
+# 流式解析时，收到这些字段即可提前开始搜索
+CORE_FIELDS = frozenset({"t", "p"})
+
+# 用于函数调用/JSON Schema输出的参数定义
+COMPACT_INTENT_JSON_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "t": {"type": ["string", "null"]},
+        "p": {
+            "type": ["array", "null"],
+            "items": {"type": ["number", "null"]},
+            "minItems": 2,
+            "maxItems": 2,
+        },
+        "s": {"type": ["string", "null"], "enum": ["pa", "pd", "new", None]},
+        "b": {"type": "array", "items": {"type": "string"}},
+        "k": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["t", "p"],
+    "additionalProperties": False,
+}
+
+
+class CompactIntent(BaseModel):
+    """LLM紧凑输出的意图，字段使用短代码以减少token"""
+    model_config = ConfigDict(extra="forbid")
+
+    t: Optional[str] = Field(None, max_length=50, description="产品类型")
+    p: Optional[List[Optional[float]]] = Field(None, description="价格范围[最低价, 最高价]")
+    s: Optional[Literal["pa", "pd", "new"]] = Field(None, description="排序偏好代码")
+    b: List[str] = Field(default=[], max_length=10, description="品牌")
+    k: List[str] = Field(default=[], max_length=10, description="其他特征关键词")
+
+    @field_validator("t")
+    @classmethod
+    def strip_type(cls, value: Optional[str]) -> Optional[str]:
+        value = value.strip() if value else None
+        return value or None
+
+    @field_validator("p")
+    @classmethod
+    def check_price_range(cls, value: Optional[List[Optional[float]]]) -> Optional[List[Optional[float]]]:
+        if value is None:
+            return None
+        if len(value) != 2:
+            raise ValueError("价格范围必须包含最低价和最高价两个元素")
+        if any(v is not None and v < 0 for v in value):
+            raise ValueError("价格不能为负数")
+        return value
+
+    @field_validator("b", "k")
+    @classmethod
+    def strip_terms(cls, value: List[str]) -> List[str]:
+        return [v.strip() for v in value if v and v.strip()]
+
+    def to_search_intent(self) -> "SearchIntent":
+        """转换为搜索路径共用的意图结构"""
+        low, high = self.p if self.p else (None, None)
+        return SearchIntent(
+            category=self.t,
+            min_price=low,
+            max_price=high,
+            brands=self.b,
+            keywords=self.k,
+            sort=self.s,
+        )
+
+
+def _normalize_price(value: Any) -> Optional[float]:
+    """价格统一为保留两位小数的正数，0和无效值视为未指定"""
+    try:
+        price = round(float(value), 2)
+    except (TypeError, ValueError):
+        return None
+    return price if price > 0 else None
+
+
+def _normalize_terms(values: Optional[Iterable[str]], lower: bool = False) -> Tuple[str, ...]:
+    """去重、排序并驻留字符串，保证相同意图得到相同的元组"""
+    terms = set()
+    for value in values or ():
+        if not isinstance(value, str):
+            continue
+        value = value.strip()
+        if value:
+            terms.add(sys.intern(value.lower() if lower else value))
+    return tuple(sorted(terms))
+
+
+def _sort_code(sort_preference: Optional[str]) -> Optional[str]:
+    """把排序偏好文本转换为排序代码"""
+    if not sort_preference:
+        return None
+    if sort_preference in SORT_CODES:
+        return sort_preference
+    if "价格" in sort_preference:
+        return "pd" if "高到低" in sort_preference else "pa"
+    if "最新" in sort_preference:
+        return "new"
+    return None
+
+
+class SearchIntent:
+    """
+    搜索意图
+
+    不可变且可哈希，在AI服务、搜索服务和路由之间传递。
+    类目和品牌字符串经过驻留，价格上下界已规范化（未指定为None且保证下界不大于上界），
+    相同语义的意图总是相等并拥有相同的 cache_key，可直接用作缓存和请求合并的键。
+    """
+
+    __slots__ = ("category", "min_price", "max_price", "brands", "keywords", "sort", "_key")
+
+    def __init__(
+        self,
+        category: Optional[str] = None,
+        min_price: Any = None,
+        max_price: Any = None,
+        brands: Optional[Iterable[str]] = None,
+        keywords: Optional[Iterable[str]] = None,
+        sort: Optional[str] = None,
+    ):
+        category = category.strip() if isinstance(category, str) else None
+        if not category or category == "其他":
+            category = None
+        low, high = _normalize_price(min_price), _normalize_price(max_price)
+        if low is not None and high is not None and low > high:
+            low, high = high, low
+
+        set_attr = object.__setattr__
+        set_attr(self, "category", sys.intern(category) if category else None)
+        set_attr(self, "min_price", low)
+        set_attr(self, "max_price", high)
+        set_attr(self, "brands", _normalize_terms(brands))
+        set_attr(self, "keywords", _normalize_terms(keywords, lower=True))
+        set_attr(self, "sort", _sort_code(sort))
+        set_attr(self, "_key", (self.category, low, high, self.brands, self.keywords, self.sort))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("SearchIntent 是不可变对象")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("SearchIntent 是不可变对象")
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, SearchIntent):
+            return NotImplemented
+        return self._key == other._key
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __repr__(self) -> str:
+        return f"SearchIntent({self.cache_key})"
+
+    def __reduce__(self):
+        return (SearchIntent, (self.category, self.min_price, self.max_price, self.brands, self.keywords, self.sort))
+
+    @property
+    def cache_key(self) -> str:
+        """规范化的字符串键，用于缓存、日志和请求合并"""
+        price = f"{self.min_price or ''}-{self.max_price or ''}"
+        return "|".join((
+            f"t={self.category or ''}",
+            f"p={price}",
+            f"b={','.join(self.brands)}",
+            f"k={','.join(self.keywords)}",
+            f"s={self.sort or ''}",
+        ))
+
+    def core(self) -> "SearchIntent":
+        """只保留类目和价格范围的核心意图，与流式输出中提前到达的字段对应"""
+        return SearchIntent(category=self.category, min_price=self.min_price, max_price=self.max_price)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SearchIntent":
+        """从意图字典创建（兼容完整提示词模式下LLM返回的格式）"""
+        price_range = data.get("price_range")
+        if not isinstance(price_range, dict):
+            price_range = {}
+        return cls(
+            category=data.get("product_type"),
+            min_price=price_range.get("min"),
+            max_price=price_range.get("max"),
+            brands=data.get("brands"),
+            keywords=data.get("keywords"),
+            sort=data.get("sort_preference"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为意图字典"""
+        return {
+            "product_type": self.category or "其他",
+            "price_range": {"min": self.min_price or 0, "max": self.max_price or 0},
+            "brands": list(self.brands),
+            "keywords": list(self.keywords),
+            "sort_preference": SORT_CODES.get(self.sort) if self.sort else None,
+        }
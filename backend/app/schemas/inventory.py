@@ -0,0 +1,24 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+
+
+class ReservationCreate(BaseModel):
+    """创建库存预留"""
+    product_id: int = Field(..., description="产品ID")
+    quantity: int = Field(..., ge=1, le=settings.INVENTORY_MAX_QUANTITY, description="预留数量")
+    ttl_seconds: Optional[float] = Field(
+        None, gt=0, le=settings.INVENTORY_MAX_TTL_SECONDS, description="预留有效期，默认使用配置值"
+    )
+
+
+class ReservationResponse(BaseModel):
+    """库存预留"""
+    id: str
+    product_id: int
+    quantity: int
+    status: str
+    expires_at: datetime
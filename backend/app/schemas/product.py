@@ -1,6 +1,6 @@
 # app/schemas/product.py
 from typing import Any, Dict, List, Optional
-from pydantic import BaseModel, Field, HttpUrl, validator
+from pydantic import AliasChoices, BaseModel, Field, HttpUrl, field_validator, validator
 from datetime import datetime
 
 # 基础产品模型
@@ -33,9 +33,46 @@ class ProductUpdate(BaseModel):
     tags: Optional[List[str]] = None
     attributes: Optional[Dict[str, Any]] = None
 
+    @field_validator("stock", "price")
+    @classmethod
+    def reject_null(cls, value: Any) -> Any:
+        # 省略字段表示不修改；显式的 null 不能当作0写入
+        if value is None:
+            raise ValueError("库存和价格不能为null，不修改时请省略该字段")
+        return value
+
+class ProductStockPriceUpdate(BaseModel):
+    """批量更新中的单个库存/价格修改"""
+    id: int = Field(..., description="产品ID")
+    stock: Optional[int] = Field(None, ge=0, description="库存数量")
+    price: Optional[float] = Field(None, ge=0, description="产品价格")
+
+    @field_validator("stock", "price")
+    @classmethod
+    def reject_null(cls, value: Any) -> Any:
+        if value is None:
+            raise ValueError("库存和价格不能为null，不修改时请省略该字段")
+        return value
+
+class BulkUpdateResult(BaseModel):
+    """批量更新结果"""
+    updated: int
+    missing: List[int] = []
+    rejected: List[int] = []
+
 class ProductResponse(ProductBase):
-    """产品响应模型"""
+    """
+    产品响应模型
+
+    图片地址在写入时已校验，响应中直接输出字符串；图片处理完成后为CDN地址并附带缩略图和尺寸。
+    """
     id: int
+    image_url: Optional[str] = Field(
+        None, validation_alias=AliasChoices("display_image_url", "image_url"), description="产品图片URL"
+    )
+    thumbnail_url: Optional[str] = Field(None, description="缩略图URL")
+    image_width: Optional[int] = Field(None, description="图片宽度")
+    image_height: Optional[int] = Field(None, description="图片高度")
     sku: str
     tags: List[str] = []
     attributes: Dict[str, Any] = {}
@@ -59,16 +96,23 @@ class ProductSearchResponse(BaseModel):
     description: Optional[str] = None
     price: float
     category: str
-    image_url: Optional[HttpUrl] = None
+    image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
     relevance_score: Optional[float] = None
 
     class Config:
         from_attributes = True
 
+class SearchClick(BaseModel):
+    """搜索结果点击事件"""
+    product_id: int = Field(..., description="被点击的产品ID")
+    query: Optional[str] = Field(None, description="产生该结果的搜索查询")
+
 class SearchResults(BaseModel):
     """搜索结果集合"""
     items: List[ProductSearchResponse]
     total: int
     page: int
     limit: int
-    pages: int
\ No newline at end of file
+    pages: int
+    corrected_query: Optional[str] = Field(None, description="原查询没有结果、按纠正后的查询返回结果时的查询文本")
\ No newline at end of file
@@ -1,72 +1,424 @@
+import asyncio
 import json
-from typing import Dict, Any, List, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 import logging
 from openai import OpenAI
+from pydantic import ValidationError
 
+from app.core import profiling
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.schemas.intent import COMPACT_INTENT_JSON_SCHEMA, CORE_FIELDS, CompactIntent, SearchIntent
+from app.services.intent_router import ModelRouter
+from app.services.intent_stream import IncrementalJSONParser
+from app.services.query_normalizer import QueryNormalizer, query_normalizer
+from app.services.search_projection import normalize_text
 
 logger = logging.getLogger(__name__)
 
+# 紧凑输出模式的提示词，字段顺序保证核心字段最先输出
+COMPACT_INTENT_PROMPT = (
+    '抽取电商搜索意图，只输出JSON:{"t":类目|null,"p":[最低价|null,最高价|null]|null,'
+    '"s":"pa"|"pd"|"new"|null,"b":[品牌],"k":[类目和品牌之外的特征词]}。'
+    's:pa价格升序,pd价格降序,new最新'
+)
+
+
+# 规则解析使用的类目词表
+PRODUCT_CATEGORIES = {
+    "手机": ["手机", "智能手机", "phone", "iphone", "华为", "小米", "三星", "oppo", "vivo"],
+    "电脑": ["电脑", "笔记本", "台式机", "平板", "laptop", "macbook", "surface", "thinkpad"],
+    "相机": ["相机", "单反", "微单", "camera", "gopro", "佳能", "尼康", "索尼"],
+    "耳机": ["耳机", "airpods", "蓝牙耳机", "headphone", "earphone", "耳麦"],
+    "服装": ["衣服", "裤子", "鞋子", "外套", "连衣裙", "t恤", "牛仔裤", "夹克"],
+    "家具": ["家具", "桌子", "椅子", "沙发", "床", "柜子", "书架"],
+    "食品": ["食品", "零食", "饮料", "水果", "蔬菜", "肉类", "海鲜", "糕点"]
+}
+
+# 规则解析使用的品牌词表
+COMMON_BRANDS = {
+    "手机": ["苹果", "华为", "小米", "三星", "oppo", "vivo", "荣耀"],
+    "电脑": ["苹果", "联想", "戴尔", "惠普", "华硕", "微软", "宏碁"],
+    "相机": ["佳能", "尼康", "索尼", "富士", "松下", "奥林巴斯", "徕卡", "gopro"],
+    "耳机": ["苹果", "索尼", "bose", "森海塞尔", "beats", "华为", "小米"]
+}
+
+# 不作为关键词的口语化词
+STOP_WORDS = {"帮我", "我要", "我想", "想要", "推荐", "一个", "一款", "找个", "买个", "有没有", "的"}
+
+
+# 规则解析能识别的价格表达用词
+PRICE_WORDS = {
+    "低于", "不超过", "小于", "以下", "以内", "高于", "超过", "大于", "以上",
+    "到", "至", "之间", "大约", "左右", "附近", "价格", "预算", "元", "块", "钱",
+}
+
+# 规则词表，长词优先匹配
+_RULE_TERMS = sorted(
+    {term.lower() for terms in PRODUCT_CATEGORIES.values() for term in terms}
+    | set(PRODUCT_CATEGORIES)
+    | {brand.lower() for brands in COMMON_BRANDS.values() for brand in brands}
+    | STOP_WORDS
+    | PRICE_WORDS,
+    key=len,
+    reverse=True
+)
+
+
+def _rule_coverage(query: str) -> float:
+    """查询中被规则词表、数字和标点覆盖的字符比例"""
+    text = query.lower()
+    covered = [not char.isalnum() or char.isdigit() for char in text]
+    for term in _RULE_TERMS:
+        start = text.find(term)
+        while start >= 0:
+            covered[start:start + len(term)] = [True] * len(term)
+            start = text.find(term, start + len(term))
+    meaningful = [flag for char, flag in zip(text, covered) if not char.isspace()]
+    if not meaningful:
+        return 0.0
+    return sum(meaningful) / len(meaningful)
+
+
+def _close_stream(stream: Any) -> None:
+    """关闭流式响应的底层连接，正在读取响应的线程随即结束（openai 1.x 的 Stream 通过 response 关闭）"""
+    for target in (getattr(stream, "response", None), stream):
+        close = getattr(target, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                logger.debug(f"关闭流式响应失败: {str(e)}")
+            return
+
+
+def _chunk_text(chunk: Any) -> str:
+    """从流式响应块中取出文本，兼容函数调用和普通内容两种输出"""
+    if not chunk.choices:
+        return ""
+    delta = chunk.choices[0].delta
+    if getattr(delta, "tool_calls", None):
+        return delta.tool_calls[0].function.arguments or ""
+    return delta.content or ""
+
 class AIService:
     """AI服务，用于处理自然语言理解任务"""
     
-    def __init__(self):
-        """初始化AI服务"""
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(
+        self,
+        client: Optional[Any] = None,
+        router: Optional[ModelRouter] = None,
+        normalizer: Optional[QueryNormalizer] = None
+    ):
+        """
+        初始化AI服务
+        
+        Args:
+            client: OpenAI兼容的客户端，测试时可传入桩对象离线运行
+            router: 模型路由器，默认按配置中的快慢模型创建
+            normalizer: 查询规范化与纠错，默认使用全局实例（词表随产品变更维护）
+        """
+        self.client = client or OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.llm_enabled = client is not None or bool(settings.OPENAI_API_KEY)
         self.model = settings.DEFAULT_AI_MODEL
+        # 规范化查询到LLM解析结果的缓存
+        self.intent_cache = TTLCache(maxsize=settings.INTENT_CACHE_SIZE, ttl=settings.INTENT_CACHE_TTL)
+        self.router = router or ModelRouter(
+            models=[settings.DEFAULT_AI_MODEL, settings.FAST_AI_MODEL],
+            expected_latency_ms={
+                settings.FAST_AI_MODEL: settings.FAST_AI_MODEL_EXPECTED_MS,
+                settings.DEFAULT_AI_MODEL: settings.DEFAULT_AI_MODEL_EXPECTED_MS,
+            },
+            failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=settings.LLM_BREAKER_RECOVERY_SECONDS,
+        )
+        self.normalizer = normalizer or query_normalizer
+        # 流式响应在专用的有界线程池中消费，慢模型不会占满默认线程池（查询日志等也在使用）
+        self._stream_executor = ThreadPoolExecutor(
+            max_workers=settings.INTENT_STREAM_WORKERS, thread_name_prefix="intent-stream"
+        )
+        # 类目词、品牌和口语词加入纠错词表，避免被纠正成其他词
+        self.normalizer.add_static_terms(
+            [category for category in PRODUCT_CATEGORIES]
+            + [keyword for keywords in PRODUCT_CATEGORIES.values() for keyword in keywords]
+            + [brand for brands in COMMON_BRANDS.values() for brand in brands]
+            + list(STOP_WORDS)
+        )
     
-    async def parse_search_intent(self, query: str) -> Dict[str, Any]:
+    async def parse_search_intent(
+        self,
+        query: str,
+        latency_budget_ms: Optional[float] = None,
+        on_core_ready: Optional[Callable[[SearchIntent], None]] = None,
+        allow_llm: bool = True,
+        tenant_id: str = settings.DEFAULT_TENANT_ID
+    ) -> SearchIntent:
         """
         解析用户搜索意图
         
+        查询先经过规范化和拼写纠错，后续的规则解析、缓存和LLM都使用纠正后的文本。
+        先用规则解析，置信度足够时直接返回；再查找之前的LLM解析缓存；
+        否则在延迟预算内选择模型调用LLM，模型不可用、超出预算或调用失败时回退到规则解析结果。
+        
         Args:
             query: 用户的自然语言查询字符串
+            latency_budget_ms: 本次请求的延迟预算，默认使用配置值
+            on_core_ready: 紧凑输出模式下，产品类型和价格范围到达时的回调，
+                参数为仅含核心字段的意图
+            allow_llm: 为False时不调用LLM（降级模式），只使用缓存或规则解析
+            tenant_id: 纠错使用该租户的商品词表
             
         Returns:
-            解析后的意图数据，包含产品类型、价格范围、品牌等信息
+            解析后的搜索意图，包含产品类型、价格范围、品牌等信息
         """
-        try:
-            if not settings.OPENAI_API_KEY:
-                logger.warning("未设置OpenAI API密钥，使用模拟数据")
-                return self._mock_intent_data(query)
-            
-            prompt = self._build_intent_prompt(query)
-            
-            # 使用同步API调用
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的电商搜索意图分析助手，可以从用户的自然语言查询中提取关键信息。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=500
-            )
-            
-            content = response.choices[0].message.content
-            
-            # 从回复中提取JSON
-            try:
-                # 尝试直接解析整个回复
-                intent_data = json.loads(content)
-            except json.JSONDecodeError:
-                # 如果失败，尝试提取内容中的JSON部分
-                start_index = content.find('{')
-                end_index = content.rfind('}') + 1
-                if start_index >= 0 and end_index > start_index:
-                    json_str = content[start_index:end_index]
-                    intent_data = json.loads(json_str)
-                else:
-                    # 无法提取JSON，使用模拟数据
-                    logger.warning(f"无法从AI回复中提取JSON: {content}")
-                    intent_data = self._mock_intent_data(query)
-            
-            return intent_data
+        normalized = self.normalizer.normalize(query, tenant_id)
+        if normalized != normalize_text(query):
+            logger.info(f"查询纠正: {query!r} -> {normalized!r}")
+            profiling.annotate(corrected_query=normalized)
+        query = normalized
+        rule_intent = self._mock_intent_data(query)
+        confidence = self._rule_confidence(query, rule_intent)
+        metrics.observe("intent_rule_confidence", confidence)
+        
+        if confidence >= settings.INTENT_RULE_CONFIDENCE:
+            metrics.inc("intent_route_total", route="rule")
+            return rule_intent
         
+        cache_key = normalize_text(query)
+        cached = self.intent_cache.get(cache_key)
+        if cached is not None:
+            metrics.inc("intent_route_total", route="cache")
+            return cached
+        
+        if not allow_llm:
+            metrics.inc("intent_route_total", route="rule_degraded")
+            return rule_intent
+        
+        if not self.llm_enabled:
+            logger.warning("未设置OpenAI API密钥，使用模拟数据")
+            metrics.inc("intent_route_total", route="rule_no_llm")
+            return rule_intent
+        
+        budget_ms = latency_budget_ms if latency_budget_ms is not None else settings.INTENT_LATENCY_BUDGET_MS
+        model = self.router.choose_model(budget_ms)
+        if model is None:
+            metrics.inc("intent_route_total", route="rule_fallback")
+            return rule_intent
+        
+        metrics.inc("intent_route_total", route="llm", model=model)
+        profiling.annotate(intent_model=model)
+        timeout = budget_ms / 1000
+        started = time.perf_counter()
+        try:
+            if settings.INTENT_COMPACT_OUTPUT:
+                call = self._compact_intent(model, query, timeout, on_core_ready)
+            else:
+                call = self._verbose_intent(model, query, timeout)
+            intent_data = await asyncio.wait_for(call, timeout=timeout)
+        except ValueError as e:
+            # 模型有响应但输出不合法，不计入熔断
+            self.router.record_success(model, (time.perf_counter() - started) * 1000)
+            logger.warning(f"AI回复不是合法的意图数据: {str(e)}")
+            metrics.inc("intent_route_total", route="llm_invalid_fallback", model=model)
+            return rule_intent
         except Exception as e:
+            self.router.record_failure(model, (time.perf_counter() - started) * 1000)
             logger.error(f"解析搜索意图失败: {str(e)}")
-            # 出错时使用简单的模拟数据
-            return self._mock_intent_data(query)
+            metrics.inc("intent_route_total", route="llm_error_fallback", model=model)
+            # 出错时使用规则解析结果
+            return rule_intent
+        except BaseException:
+            # 请求被取消时不会进入上面的分支，需要归还半开状态的探测名额
+            self.router.record_cancelled(model)
+            raise
+        
+        self.router.record_success(model, (time.perf_counter() - started) * 1000)
+        self.intent_cache.set(cache_key, intent_data)
+        return intent_data
+    
+    async def _compact_intent(
+        self,
+        model: str,
+        query: str,
+        timeout: float,
+        on_core_ready: Optional[Callable[[SearchIntent], None]] = None
+    ) -> SearchIntent:
+        """
+        以紧凑JSON格式流式获取意图
+        
+        产品类型和价格范围到达后立即回调 on_core_ready，让调用方提前开始搜索；
+        完整对象到达后做严格校验。
+        
+        Raises:
+            ValueError: 输出不完整或校验失败
+        """
+        started = time.perf_counter()
+        parser = IncrementalJSONParser()
+        members: Dict[str, Any] = {}
+        core_sent = on_core_ready is None
+        
+        # 完整对象到达后立即关闭流，不等待模型输出结束
+        async with aclosing(self._stream_completion(**self._compact_request(model, query, timeout))) as fragments:
+            async for fragment in fragments:
+                for key, value in parser.feed(fragment):
+                    members[key] = value
+                if not core_sent and CORE_FIELDS <= members.keys():
+                    core_sent = True
+                    try:
+                        core_intent = CompactIntent.model_validate(members)
+                    except ValidationError:
+                        # 核心字段不合法时不提前搜索，等待完整对象后统一报错
+                        pass
+                    else:
+                        metrics.observe(
+                            "intent_core_ready_ms", (time.perf_counter() - started) * 1000, model=model
+                        )
+                        on_core_ready(core_intent.to_search_intent())
+                if parser.done:
+                    break
+        
+        if not parser.done:
+            raise ValueError(f"意图JSON不完整: {members}")
+        return CompactIntent.model_validate(members).to_search_intent()
+    
+    def _compact_request(self, model: str, query: str, timeout: float) -> Dict[str, Any]:
+        """构建紧凑输出模式的请求参数"""
+        request = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": COMPACT_INTENT_PROMPT},
+                {"role": "user", "content": query}
+            ],
+            "temperature": 0,
+            "max_tokens": settings.INTENT_MAX_TOKENS,
+            "timeout": timeout,
+        }
+        if settings.INTENT_RESPONSE_FORMAT == "function":
+            request["tools"] = [{
+                "type": "function",
+                "function": {"name": "intent", "parameters": COMPACT_INTENT_JSON_SCHEMA}
+            }]
+            request["tool_choice"] = {"type": "function", "function": {"name": "intent"}}
+        elif settings.INTENT_RESPONSE_FORMAT == "json_object":
+            request["response_format"] = {"type": "json_object"}
+        return request
+    
+    async def _stream_completion(self, **request: Any) -> AsyncIterator[str]:
+        """
+        在专用线程池中消费同步客户端的流式响应，逐段产出文本
+
+        调用方停止迭代（超时取消或已取得完整对象）时关闭底层连接，阻塞在读取上的线程立即结束，
+        不会一直占用线程等待模型输出。
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        streams: List[Any] = []
+        
+        def put(item: Any) -> None:
+            if stop.is_set():
+                return
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # 事件循环已关闭，没有消费方
+                pass
+        
+        def produce():
+            if stop.is_set():
+                # 排队期间调用方已放弃
+                return
+            stream = None
+            try:
+                stream = self.client.chat.completions.create(stream=True, **request)
+                streams.append(stream)
+                if stop.is_set():
+                    return
+                for chunk in stream:
+                    if stop.is_set():
+                        break
+                    fragment = _chunk_text(chunk)
+                    if fragment:
+                        put(fragment)
+            except Exception as e:
+                put(e)
+            finally:
+                if stream is not None:
+                    _close_stream(stream)
+                put(None)
+        
+        loop.run_in_executor(self._stream_executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            for stream in streams:
+                _close_stream(stream)
+    
+    async def _verbose_intent(self, model: str, query: str, timeout: float) -> SearchIntent:
+        """
+        以完整提示词获取意图（关闭紧凑输出时使用）
+        
+        Raises:
+            ValueError: 回复中没有可解析的JSON
+        """
+        content = await self._complete(model, self._build_intent_prompt(query), timeout=timeout)
+        
+        # 从回复中提取JSON
+        try:
+            # 尝试直接解析整个回复
+            intent_data = json.loads(content)
+        except json.JSONDecodeError:
+            # 如果失败，尝试提取内容中的JSON部分
+            start_index = content.find('{')
+            end_index = content.rfind('}') + 1
+            if start_index < 0 or end_index <= start_index:
+                raise ValueError(f"无法从AI回复中提取JSON: {content}")
+            intent_data = json.loads(content[start_index:end_index])
+        if not isinstance(intent_data, dict):
+            raise ValueError(f"AI回复不是JSON对象: {content}")
+        return SearchIntent.from_dict(intent_data)
+    
+    async def _complete(self, model: str, prompt: str, timeout: float) -> str:
+        """在线程池中调用同步客户端，避免阻塞事件循环"""
+        response = await asyncio.to_thread(
+            self.client.chat.completions.create,
+            model=model,
+            messages=[
+                {"role": "system", "content": "你是一个专业的电商搜索意图分析助手，可以从用户的自然语言查询中提取关键信息。"},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1,
+            max_tokens=500,
+            timeout=timeout
+        )
+        return response.choices[0].message.content
+    
+    def _rule_confidence(self, query: str, intent: SearchIntent) -> float:
+        """
+        评估规则解析结果的置信度
+        
+        识别出产品类型得0.5分，查询中有数字时需解析出价格范围才得0.5分；
+        再乘以查询中被规则词表覆盖的比例。中文查询通常不带空格，
+        未被类目词、品牌、价格表达和口语词覆盖的部分规则无法理解，只能原样作为关键词匹配。
+        """
+        score = 0.0
+        if intent.category:
+            score += 0.5
+        if not any(char.isdigit() for char in query) or intent.min_price or intent.max_price:
+            score += 0.5
+        return score * _rule_coverage(query)
     
     def _build_intent_prompt(self, query: str) -> str:
         """构建提示信息"""
@@ -94,26 +446,15 @@ class AIService:
         如果某个字段未提及，请使用null或空列表。
         """
     
-    def _mock_intent_data(self, query: str) -> Dict[str, Any]:
+    def _mock_intent_data(self, query: str) -> SearchIntent:
         """生成模拟意图数据，增强对价格区间和产品类型的理解"""
         # 转换为小写并分词
         query_lower = query.lower()
         words = query_lower.split()
         
-        # 识别可能的产品类型
-        product_categories = {
-            "手机": ["手机", "智能手机", "phone", "iphone", "华为", "小米", "三星", "oppo", "vivo"],
-            "电脑": ["电脑", "笔记本", "台式机", "平板", "laptop", "macbook", "surface", "thinkpad"],
-            "相机": ["相机", "单反", "微单", "camera", "gopro", "佳能", "尼康", "索尼"],
-            "耳机": ["耳机", "airpods", "蓝牙耳机", "headphone", "earphone", "耳麦"],
-            "服装": ["衣服", "裤子", "鞋子", "外套", "连衣裙", "t恤", "牛仔裤", "夹克"],
-            "家具": ["家具", "桌子", "椅子", "沙发", "床", "柜子", "书架"],
-            "食品": ["食品", "零食", "饮料", "水果", "蔬菜", "肉类", "海鲜", "糕点"]
-        }
-        
         # 检查产品类型
         identified_category = "其他"
-        for category, keywords in product_categories.items():
+        for category, keywords in PRODUCT_CATEGORIES.items():
             for keyword in keywords:
                 if keyword in query_lower:
                     identified_category = category
@@ -122,19 +463,12 @@ class AIService:
                 break
         
         # 识别可能的品牌
-        common_brands = {
-            "手机": ["苹果", "华为", "小米", "三星", "oppo", "vivo", "荣耀"],
-            "电脑": ["苹果", "联想", "戴尔", "惠普", "华硕", "微软", "宏碁"],
-            "相机": ["佳能", "尼康", "索尼", "富士", "松下", "奥林巴斯", "徕卡", "gopro"],
-            "耳机": ["苹果", "索尼", "bose", "森海塞尔", "beats", "华为", "小米"]
-        }
-        
         identified_brands = []
-        relevant_brands = common_brands.get(identified_category, [])
+        relevant_brands = COMMON_BRANDS.get(identified_category, [])
         for brand in relevant_brands:
             if brand.lower() in query_lower:
                 identified_brands.append(brand)
-        print(identified_brands, "identified_brands")
+        logger.debug(f"识别到的品牌: {identified_brands}")
         # 增强的价格范围识别
         price_range = {"min": 0, "max": 0}
         
@@ -212,15 +546,30 @@ class AIService:
                     except (ValueError, IndexError):
                         pass
         
+        # 关键词只保留类目词、品牌词和价格表达之外的特性描述
+        stripped_terms = sorted(
+            set(PRODUCT_CATEGORIES.get(identified_category, [])) | {brand.lower() for brand in identified_brands},
+            key=len,
+            reverse=True
+        )
+        keywords = []
+        for word in words:
+            if any(char.isdigit() for char in word) or word in STOP_WORDS:
+                continue
+            for term in stripped_terms:
+                word = word.replace(term, " ")
+            keywords.extend(w for w in word.split() if len(w) > 1 and w not in STOP_WORDS)
+        
         # 返回最终的意图数据
-        print("Return Mock result",{"product_type": identified_category,"price_range": price_range,"brands": identified_brands,"keywords": [w for w in words if len(w) > 1 and w not in product_categories.get(identified_category, [])],"sort_preference": None})
-        return {
-            "product_type": identified_category,
-            "price_range": price_range,
-            "brands": identified_brands,
-            "keywords": [w for w in words if len(w) > 1 and w not in product_categories.get(identified_category, [])],
-            "sort_preference": None
-        }
+        intent = SearchIntent(
+            category=identified_category,
+            min_price=price_range["min"],
+            max_price=price_range["max"],
+            brands=identified_brands,
+            keywords=keywords
+        )
+        logger.debug(f"规则解析结果: {intent}")
+        return intent
 
     async def get_product_recommendations(self, 
                                          product_id: int, 
@@ -0,0 +1,42 @@
+from typing import Iterable
+
+from app.core.cache import PartitionedTTLCache
+from app.core.config import settings
+
+
+def _partition_size(maxsize: int) -> int:
+    return max(1, int(maxsize * settings.TENANT_CACHE_SHARE))
+
+
+# 以下缓存都按租户分区，单个租户最多占用 TENANT_CACHE_SHARE 比例的容量
+
+# 意图搜索结果缓存，键为 (意图, 页码, 每页数量)，产品变更时清空所在租户的分区
+search_result_cache = PartitionedTTLCache(
+    maxsize=settings.SEARCH_RESULT_CACHE_SIZE,
+    partition_size=_partition_size(settings.SEARCH_RESULT_CACHE_SIZE),
+    ttl=settings.SEARCH_RESULT_CACHE_TTL,
+)
+
+# 产品详情响应缓存，键为产品ID，产品变更时主动失效
+product_detail_cache = PartitionedTTLCache(
+    maxsize=settings.PRODUCT_DETAIL_CACHE_SIZE,
+    partition_size=_partition_size(settings.PRODUCT_DETAIL_CACHE_SIZE),
+    ttl=settings.PRODUCT_DETAIL_CACHE_TTL,
+)
+
+# 推荐产品列表缓存，键为数量
+featured_cache = PartitionedTTLCache(maxsize=1024, partition_size=16, ttl=settings.FEATURED_CACHE_TTL)
+
+
+def invalidate_products(tenant_id: str, product_ids: Iterable[int], search_results: bool = True) -> None:
+    """
+    产品变更后使该租户的详情缓存失效
+
+    搜索结果和推荐列表按意图和数量缓存，无法定位包含某个产品的条目，
+    search_results 为True时清空该租户的这两个分区；只改变库存件数的变更不影响其中的字段，可以保留。
+    """
+    for product_id in product_ids:
+        product_detail_cache.pop(tenant_id, product_id)
+    if search_results:
+        search_result_cache.clear(tenant_id)
+        featured_cache.clear(tenant_id)
@@ -0,0 +1,463 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import async_session_factory
+from app.models.product import Category, Product, ProductSearch
+from app.services.search_projection import leased_units
+
+logger = logging.getLogger(__name__)
+
+# 列定义：列名 -> 数据类型
+COLUMNS = {
+    "id": np.int64,
+    "price": np.float64,
+    "stock": np.int32,
+    "category": np.int32,
+    "created": np.int64,  # 创建时间，微秒时间戳
+    "alive": np.bool_,
+}
+
+# 从末尾向前查找默认排序页时每次扫描的行数
+_SCAN_CHUNK = 1 << 16
+
+
+def _timestamp(value: Optional[datetime]) -> int:
+    return int(value.timestamp() * 1_000_000) if value is not None else 0
+
+
+class ColumnarFilterStore:
+    """
+    列式内存筛选存储
+
+    用NumPy数组按产品ID升序保存价格、库存、类别ID和创建时间，
+    价格区间、类别和有货筛选以及排序都在数组上向量化完成，只把当前页的ID交给调用方回表。
+    删除只打标记，死行过多时整体压缩。存储只在事件循环中修改和读取，不需要加锁。
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._size = 0
+        self._live = 0
+        self._columns: Dict[str, np.ndarray] = {
+            name: np.zeros(initial_capacity, dtype=dtype) for name, dtype in COLUMNS.items()
+        }
+        self._categories: Dict[int, str] = {}
+        # 创建时间随ID单调不减时，物理顺序的逆序就是默认排序，不需要排序索引
+        self._created_sorted = True
+        self._created_order: Optional[np.ndarray] = None
+        # 类别ID -> 该类别的行位置（升序）
+        self._by_category: Optional[Dict[int, np.ndarray]] = None
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return self._live
+
+    def _col(self, name: str) -> np.ndarray:
+        return self._columns[name][:self._size]
+
+    async def load(self, db: AsyncSession, tenant_id: str, batch_size: int = 50000) -> int:
+        """
+        从搜索投影和产品表加载一个租户的全部产品
+
+        Returns:
+            加载的产品数
+        """
+        self.__init__()
+        result = await db.stream(
+            select(
+                ProductSearch.id,
+                ProductSearch.price,
+                # 有货状态按库存加预留额度计算
+                Product.stock + leased_units(Product.id),
+                ProductSearch.category_id,
+                ProductSearch.created_at,
+            )
+            .join(Product, Product.id == ProductSearch.id)
+            .where(ProductSearch.tenant_id == tenant_id)
+            .order_by(ProductSearch.id)
+        )
+        async for rows in result.partitions(batch_size):
+            self._append_rows(rows)
+
+        category_ids = np.unique(self._col("category")).tolist()
+        if category_ids:
+            categories = await db.execute(select(Category.id, Category.name).where(Category.id.in_(category_ids)))
+            self._categories = {category_id: name for category_id, name in categories.all()}
+        self.loaded = True
+        return self._live
+
+    def _append_rows(self, rows: Sequence[Any]) -> None:
+        count = len(rows)
+        self._reserve(self._size + count)
+        ids, prices, stocks, categories, created = zip(*rows)
+        end = self._size + count
+        self._columns["id"][self._size:end] = ids
+        self._columns["price"][self._size:end] = prices
+        self._columns["stock"][self._size:end] = [stock or 0 for stock in stocks]
+        self._columns["category"][self._size:end] = categories
+        self._columns["created"][self._size:end] = [_timestamp(value) for value in created]
+        self._columns["alive"][self._size:end] = True
+        self._size = end
+        self._live += count
+        self._created_sorted = bool(np.all(np.diff(self._col("created")) >= 0))
+        self._invalidate_indexes()
+
+    def _invalidate_indexes(self) -> None:
+        self._created_order = None
+        self._by_category = None
+
+    def _reserve(self, capacity: int) -> None:
+        current = len(self._columns["id"])
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, current * 2)
+        for name, column in self._columns.items():
+            grown = np.zeros(new_capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def _position(self, product_id: int) -> Optional[int]:
+        ids = self._col("id")
+        position = int(np.searchsorted(ids, product_id))
+        if position < self._size and ids[position] == product_id:
+            return position
+        return None
+
+    def add_category(self, category_id: int, name: str) -> None:
+        self._categories[category_id] = name
+
+    def upsert(
+        self,
+        product_id: int,
+        price: float,
+        stock: Optional[int],
+        category_id: int,
+        created_at: Optional[datetime],
+    ) -> None:
+        """写入或覆盖单个产品"""
+        created = _timestamp(created_at)
+        values = {"price": price, "stock": stock or 0, "category": category_id, "created": created}
+        position = self._position(product_id)
+        if position is None:
+            position = int(np.searchsorted(self._col("id"), product_id))
+            self._reserve(self._size + 1)
+            if position < self._size:
+                # 非递增ID很少出现，整体后移一位
+                for column in self._columns.values():
+                    column[position + 1:self._size + 1] = column[position:self._size]
+                self._invalidate_indexes()
+            else:
+                # 追加到末尾是常见情况，只需把新位置加入所属类别
+                self._created_order = None
+                if self._by_category is not None:
+                    existing = self._by_category.get(category_id, np.empty(0, dtype=np.int64))
+                    self._by_category[category_id] = np.append(existing, position)
+            self._columns["id"][position] = product_id
+            self._size += 1
+            self._live += 1
+        else:
+            if not self._columns["alive"][position]:
+                self._live += 1
+            if self._columns["created"][position] != created:
+                self._created_order = None
+            if self._columns["category"][position] != category_id:
+                self._by_category = None
+        for name, value in values.items():
+            self._columns[name][position] = value
+        self._columns["alive"][position] = True
+        if self._created_sorted:
+            created_col = self._col("created")
+            if (position > 0 and created_col[position - 1] > created) or (
+                position + 1 < self._size and created_col[position + 1] < created
+            ):
+                self._created_sorted = False
+
+    def update_fields(self, product_id: int, price: Optional[float] = None, stock: Optional[int] = None) -> None:
+        """更新价格或库存，产品不在存储中时忽略"""
+        position = self._position(product_id)
+        if position is None or not self._columns["alive"][position]:
+            return
+        if price is not None:
+            self._columns["price"][position] = price
+        if stock is not None:
+            self._columns["stock"][position] = stock
+
+    def remove(self, product_id: int) -> None:
+        position = self._position(product_id)
+        if position is None or not self._columns["alive"][position]:
+            return
+        self._columns["alive"][position] = False
+        self._live -= 1
+        if self._size - self._live > max(1024, self._size // 2):
+            self._compact()
+
+    def _compact(self) -> None:
+        """丢弃已删除的行"""
+        alive = self._col("alive").copy()
+        live = int(np.count_nonzero(alive))
+        for name, column in self._columns.items():
+            column[:live] = column[:self._size][alive]
+        self._size = live
+        self._invalidate_indexes()
+
+    def match_categories(self, pattern: str, exact: bool = False) -> List[int]:
+        """
+        按名称匹配类别ID，与 search_projection.find_category_ids 的规则一致
+
+        Args:
+            pattern: 类别名称或名称片段
+            exact: 是否精确匹配，否则按包含关系不区分大小写匹配
+        """
+        if exact:
+            return [category_id for category_id, name in self._categories.items() if name == pattern]
+        pattern = pattern.lower()
+        return [category_id for category_id, name in self._categories.items() if pattern in name.lower()]
+
+    def _category_positions(self, category_ids: Sequence[int]) -> np.ndarray:
+        """给定类别的行位置（升序），类别索引惰性构建"""
+        if self._by_category is None:
+            category = self._col("category")
+            order = np.argsort(category, kind="stable")
+            codes, starts = np.unique(category[order], return_index=True)
+            self._by_category = {
+                int(code): part for code, part in zip(codes, np.split(order, starts[1:]))
+            }
+        parts = [self._by_category[code] for code in category_ids if code in self._by_category]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        if len(parts) == 1:
+            return parts[0]
+        return np.sort(np.concatenate(parts))
+
+    def _conditions(
+        self,
+        positions: Optional[np.ndarray],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        in_stock: Optional[bool],
+    ) -> np.ndarray:
+        """在给定行位置（None表示全部行）上计算存活、价格和库存条件"""
+        def column(name: str) -> np.ndarray:
+            values = self._col(name)
+            return values if positions is None else values[positions]
+
+        mask = column("alive").copy()
+        if min_price is not None or max_price is not None:
+            price = column("price")
+            if min_price is not None:
+                mask &= price >= min_price
+            if max_price is not None:
+                mask &= price <= max_price
+        if in_stock is not None:
+            stock = column("stock")
+            mask &= (stock > 0) if in_stock else (stock <= 0)
+        return mask
+
+    def page(
+        self,
+        category_ids: Optional[Sequence[int]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock: Optional[bool] = None,
+        sort: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 20,
+    ) -> Tuple[List[int], int]:
+        """
+        筛选并排序，返回当前页的产品ID和命中总数
+
+        有类别条件时先从类别索引取出该类别的行，其余条件只在这些行上计算；
+        否则在整列上计算条件。
+
+        Args:
+            category_ids: 类别ID列表，None表示不限类别
+            sort: "pa" 价格升序，"pd" 价格降序，其他按创建时间降序；均以ID作为次级排序键
+
+        Returns:
+            (当前页产品ID列表, 命中总数)
+        """
+        if limit <= 0:
+            return [], 0
+        if category_ids is not None:
+            positions = self._category_positions(category_ids)
+            positions = positions[self._conditions(positions, min_price, max_price, in_stock)]
+            total = len(positions)
+            if offset >= total:
+                return [], total
+            if sort in ("pa", "pd"):
+                positions = self._ordered_slice(positions, "price", sort == "pd", offset, limit)
+            elif self._created_sorted:
+                positions = positions[::-1][offset:offset + limit]
+            else:
+                positions = self._ordered_slice(positions, "created", True, offset, limit)
+            return self._col("id")[positions].tolist(), total
+
+        mask = self._conditions(None, min_price, max_price, in_stock)
+        total = int(np.count_nonzero(mask))
+        if offset >= total:
+            return [], total
+        if sort in ("pa", "pd"):
+            positions = self._ordered_slice(np.flatnonzero(mask), "price", sort == "pd", offset, limit)
+        elif self._created_sorted:
+            positions = self._tail_page(mask, offset, limit)
+        else:
+            order = self._created_permutation()
+            positions = order[self._tail_page(mask[order], offset, limit)]
+        return self._col("id")[positions].tolist(), total
+
+    def _tail_page(self, mask: np.ndarray, offset: int, limit: int) -> np.ndarray:
+        """按从后往前的顺序取第 offset 到 offset+limit 个命中位置，只扫描需要的分块"""
+        needed = offset + limit
+        start = len(mask)
+        found = 0
+        while start > 0 and found < needed:
+            chunk_start = max(0, start - _SCAN_CHUNK)
+            found += int(np.count_nonzero(mask[chunk_start:start]))
+            start = chunk_start
+        positions = np.flatnonzero(mask[start:])[::-1] + start
+        return positions[offset:needed]
+
+    def _ordered_slice(
+        self, positions: np.ndarray, key: str, descending: bool, offset: int, limit: int
+    ) -> np.ndarray:
+        """按 (key, ID) 排序取一页：先用部分选择缩小候选，再对候选做完整排序"""
+        values = self._col(key)[positions]
+        if descending:
+            values = -values
+        needed = offset + limit
+        if needed < len(positions):
+            # 取第 needed 小的值作为阈值，阈值处的并列项全部保留以保证ID次序正确
+            threshold = np.partition(values, needed - 1)[needed - 1]
+            keep = values <= threshold
+            positions, values = positions[keep], values[keep]
+        ids = self._col("id")[positions]
+        order = np.lexsort((-ids if descending else ids, values))
+        return positions[order[offset:needed]]
+
+    def _created_permutation(self) -> np.ndarray:
+        """按 (创建时间, ID) 升序的位置排列，变更后惰性重建"""
+        if self._created_order is None:
+            self._created_order = np.lexsort((self._col("id"), self._col("created")))
+        return self._created_order
+
+    @property
+    def nbytes(self) -> int:
+        """数组按已分配容量占用的字节数"""
+        return sum(column.nbytes for column in self._columns.values())
+
+    def memory_usage(self) -> Dict[str, float]:
+        """报告数组占用的内存"""
+        total = self.nbytes
+        return {
+            "products": self._live,
+            "bytes": total,
+            "row_bytes": sum(np.dtype(dtype).itemsize for dtype in COLUMNS.values()),
+            "bytes_per_product": total / self._live if self._live else 0.0,
+        }
+
+
+class TenantFilterStores:
+    """
+    按租户划分的列式筛选存储
+
+    每个租户一个独立的存储，首次访问时从数据库加载；所有租户合计超过内存配额时
+    淘汰最久未访问的租户，下次访问重新加载。每个请求只访问本租户的存储，
+    开销与租户数量无关。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any] = async_session_factory,
+        max_bytes: int = int(settings.FILTER_STORE_MAX_MB * 1024 * 1024),
+    ):
+        self.session_factory = session_factory
+        self.max_bytes = max_bytes
+        self._stores: "OrderedDict[str, ColumnarFilterStore]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        # 每个租户的变更计数，加载期间有变更时重新加载，避免遗漏
+        self._versions: Dict[str, int] = {}
+
+    async def get(self, tenant_id: str) -> ColumnarFilterStore:
+        """获取租户的存储，未加载时从数据库加载"""
+        store = self._stores.get(tenant_id)
+        if store is not None:
+            self._stores.move_to_end(tenant_id)
+            return store
+        loading = self._loading.get(tenant_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[tenant_id] = future
+        try:
+            store = await self._load(tenant_id)
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待方时避免未读取异常的警告
+            future.exception()
+            raise
+        finally:
+            del self._loading[tenant_id]
+        future.set_result(store)
+        return store
+
+    async def _load(self, tenant_id: str) -> ColumnarFilterStore:
+        started = time.perf_counter()
+        while True:
+            version = self._versions.get(tenant_id, 0)
+            store = ColumnarFilterStore()
+            async with self.session_factory() as db:
+                await store.load(db, tenant_id)
+            if self._versions.get(tenant_id, 0) == version:
+                break
+        self._stores[tenant_id] = store
+        self._evict()
+        usage = store.memory_usage()
+        metrics.observe("filter_store_load_ms", (time.perf_counter() - started) * 1000)
+        logger.info(
+            f"租户 {tenant_id} 的列式筛选存储已加载 {usage['products']} 个产品，"
+            f"占用 {usage['bytes']} 字节，每个产品 {usage['bytes_per_product']:.1f} 字节"
+        )
+        return store
+
+    def for_update(self, tenant_id: str) -> Optional[ColumnarFilterStore]:
+        """
+        记录租户有数据变更，返回已加载的存储供调用方同步
+
+        存储未加载时返回None，下次访问时会加载到最新数据。
+        """
+        if tenant_id in self._loading or tenant_id in self._stores:
+            self._versions[tenant_id] = self._versions.get(tenant_id, 0) + 1
+        return self._stores.get(tenant_id)
+
+    def _evict(self) -> None:
+        """合计内存超过配额时淘汰最久未访问的租户，至少保留最近加载的一个"""
+        total = sum(store.nbytes for store in self._stores.values())
+        while total > self.max_bytes and len(self._stores) > 1:
+            tenant_id, store = self._stores.popitem(last=False)
+            total -= store.nbytes
+            self._versions.pop(tenant_id, None)
+            metrics.inc("filter_store_evictions_total")
+        metrics.set_gauge("filter_store_tenants", len(self._stores))
+        metrics.set_gauge("filter_store_bytes", total)
+
+    def memory_usage(self) -> Dict[str, Dict[str, float]]:
+        """各租户存储的内存占用"""
+        return {tenant_id: store.memory_usage() for tenant_id, store in self._stores.items()}
+
+    def clear(self) -> None:
+        self._stores.clear()
+        self._versions.clear()
+
+
+# 全局的按租户列式筛选存储，按需加载，产品变更时同步
+filter_stores = TenantFilterStores()
@@ -0,0 +1,169 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.core.metrics import metrics
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败达到阈值后进入打开状态，在恢复时间内拒绝所有调用；
+    恢复时间过后进入半开状态，只放行有限数量的探测请求，
+    探测成功则关闭熔断器，探测失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @property
+    def state(self) -> str:
+        """当前状态，打开状态超过恢复时间后视为半开"""
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self) -> None:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._transition(self.HALF_OPEN)
+            self._half_open_calls = 0
+
+    def _transition(self, state: str) -> None:
+        if state != self._state:
+            self._state = state
+            metrics.inc("circuit_breaker_transitions_total", breaker=self.name, state=state)
+
+    def allow_request(self) -> bool:
+        """判断是否允许发起调用"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            return False
+
+    def release(self) -> None:
+        """
+        放弃一次已放行的调用（调用被取消，既不算成功也不算失败）
+
+        归还半开状态的探测名额，否则被取消的探测会让熔断器一直停留在半开状态并拒绝所有调用。
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self) -> None:
+        """记录一次成功调用"""
+        with self._lock:
+            self._failures = 0
+            self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        """记录一次失败调用"""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                self._transition(self.OPEN)
+
+
+class LatencyTracker:
+    """使用指数加权移动平均估计模型的响应耗时"""
+
+    def __init__(self, initial_ms: float, alpha: float = 0.2):
+        self.initial_ms = initial_ms
+        self.estimate_ms = initial_ms
+        self.alpha = alpha
+
+    def record(self, latency_ms: float) -> None:
+        self.estimate_ms = self.alpha * latency_ms + (1 - self.alpha) * self.estimate_ms
+
+    def relax(self) -> None:
+        """未被选中时向初始估计回落，避免一次慢响应让模型永远被跳过"""
+        if self.estimate_ms > self.initial_ms:
+            self.estimate_ms = self.alpha * self.initial_ms + (1 - self.alpha) * self.estimate_ms
+
+
+class ModelRouter:
+    """
+    按延迟预算选择模型
+
+    候选模型按质量从高到低排列，选择第一个熔断器放行且预估耗时在预算内的模型；
+    都不满足时返回None，由调用方回退到规则解析。
+    """
+
+    def __init__(
+        self,
+        models: List[str],
+        expected_latency_ms: Dict[str, float],
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        # 去重并保持顺序，快慢模型相同时只保留一个
+        self.models = list(dict.fromkeys(models))
+        self.breakers = {
+            model: CircuitBreaker(
+                model,
+                failure_threshold=failure_threshold,
+                recovery_timeout=recovery_timeout,
+                clock=clock,
+            )
+            for model in self.models
+        }
+        self.latency = {
+            model: LatencyTracker(expected_latency_ms.get(model, 1000.0))
+            for model in self.models
+        }
+
+    def choose_model(self, budget_ms: float) -> Optional[str]:
+        """根据剩余预算选择模型"""
+        for model in self.models:
+            if self.latency[model].estimate_ms > budget_ms:
+                self.latency[model].relax()
+                metrics.inc("intent_route_skipped_total", model=model, reason="over_budget")
+                continue
+            if not self.breakers[model].allow_request():
+                metrics.inc("intent_route_skipped_total", model=model, reason="circuit_open")
+                continue
+            return model
+        return None
+
+    def record_success(self, model: str, latency_ms: float) -> None:
+        self.breakers[model].record_success()
+        self.latency[model].record(latency_ms)
+        metrics.observe("intent_llm_latency_ms", latency_ms, model=model)
+
+    def record_cancelled(self, model: str) -> None:
+        """调用被取消（客户端断开等），归还熔断器的探测名额"""
+        self.breakers[model].release()
+        metrics.inc("intent_llm_cancelled_total", model=model)
+
+    def record_failure(self, model: str, latency_ms: float) -> None:
+        self.breakers[model].record_failure()
+        # 超时等失败同样计入耗时估计，避免持续选择过慢的模型
+        self.latency[model].record(latency_ms)
+        metrics.inc("intent_llm_failures_total", model=model)
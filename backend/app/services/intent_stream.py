@@ -0,0 +1,73 @@
+import json
+from typing import Any, List, Tuple
+
+
+class IncrementalJSONParser:
+    """
+    顶层JSON对象的增量解析器
+
+    流式输入JSON文本片段，每当顶层对象的一个成员完整到达时立即返回该键值对，
+    不必等待整个对象结束。对象之前的多余文本会被忽略。
+    """
+
+    def __init__(self):
+        self._member: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.started = False
+        self.done = False
+
+    def feed(self, fragment: str) -> List[Tuple[str, Any]]:
+        """
+        输入一个文本片段
+
+        Returns:
+            本次新完成的 (键, 值) 列表
+
+        Raises:
+            ValueError: 成员不是合法的JSON
+        """
+        completed: List[Tuple[str, Any]] = []
+        for char in fragment:
+            if self.done:
+                break
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._member.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._flush_member(completed)
+                    self.done = True
+                    continue
+            elif char == "," and self._depth == 1:
+                self._flush_member(completed)
+                continue
+            self._member.append(char)
+        return completed
+
+    def _flush_member(self, completed: List[Tuple[str, Any]]) -> None:
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return
+        member = json.loads("{" + text + "}")
+        completed.extend(member.items())
@@ -0,0 +1,670 @@
+import asyncio
+import copy
+import logging
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import and_, bindparam, delete, func, insert, select, update
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import async_session_factory
+from app.models.inventory import (
+    RESERVATION_CONFIRMED,
+    RESERVATION_EXPIRED,
+    RESERVATION_HELD,
+    RESERVATION_LEASE,
+    RESERVATION_RELEASED,
+    InventoryReservation,
+)
+from app.models.product import Product, ProductSearch
+from app.services.caches import invalidate_products
+from app.services.filter_store import filter_stores
+from app.services.search_projection import leased_units
+from app.services.write_behind import ProductNotFoundError
+
+logger = logging.getLogger(__name__)
+
+_products = Product.__table__
+_projection = ProductSearch.__table__
+_reservations = InventoryReservation.__table__
+
+
+class InsufficientStockError(Exception):
+    """库存不足以满足预留"""
+
+    def __init__(self, product_id: int, requested: int, available: int):
+        super().__init__(f"产品 {product_id} 库存不足: 需要 {requested}, 可用 {available}")
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+
+
+class ReservationNotFoundError(LookupError):
+    """预留不存在或不属于该租户"""
+
+
+class ReservationStateError(Exception):
+    """预留已确认、释放或过期，不能再执行该操作"""
+
+
+class _LeaseLostError(Exception):
+    """进程持有的额度已被其他进程作为过期额度返还"""
+
+    def __init__(self, product_ids: Set[int]):
+        super().__init__(f"额度已失效: {sorted(product_ids)}")
+        self.product_ids = product_ids
+
+
+@dataclass
+class _Lease:
+    """进程为热门产品扣下的库存额度"""
+    id: str
+    tenant_id: str
+    product_id: int
+    remaining: int = 0
+    persisted: bool = False
+    dirty: bool = False
+
+
+@dataclass
+class _BatchStock:
+    """
+    批次内各产品的库存
+
+    每个产品在批次中的第一次扣减直接执行条件扣减并取得写锁（SQLite按库加锁，行锁数据库锁定该行），
+    之后的扣减在内存中按已知库存判断，批次末尾合并为一次条件扣减，库存不足的请求不再访问数据库。
+    """
+    known: Dict[Tuple[str, int], int] = field(default_factory=dict)
+    deferred: Counter = field(default_factory=Counter)
+    missing: Set[Tuple[str, int]] = field(default_factory=set)
+
+
+@dataclass
+class _ReserveRequest:
+    tenant_id: str
+    product_id: int
+    quantity: int
+    expires_at: datetime
+    future: asyncio.Future
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite 读出的时间不带时区，存入时统一为UTC
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+class InventoryService:
+    """
+    库存预留
+
+    预留通过条件扣减（UPDATE ... WHERE stock >= n）原子地从产品库存中扣除，不会超卖；
+    并发的预留请求在短间隔内归并为一个事务提交（组提交）。
+    预留在有效期内确认后生效，释放或过期时库存返还。
+
+    预留频繁的热门产品改为从进程内额度分配：进程用一次条件扣减整块扣下 INVENTORY_LEASE_SIZE 件，
+    之后的预留只在内存中扣减额度并写入预留行，不再更新热点产品行。每个进程持有的额度相当于库存的一个分片，
+    剩余额度随批次持久化为 lease 行；后台任务定期续期、把冷却产品的额度返还到库存并清理过期预留，
+    进程退出未返还的额度在过期后由其他进程返还。持有额度期间 products.stock 不含额度中的件数，
+    搜索投影和列式筛选的有货状态按库存加额度计算。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any] = async_session_factory,
+        interval_ms: float = settings.INVENTORY_BATCH_INTERVAL_MS,
+        max_batch: int = settings.INVENTORY_BATCH_MAX_SIZE,
+        hot_threshold: float = settings.INVENTORY_HOT_THRESHOLD,
+        lease_size: int = settings.INVENTORY_LEASE_SIZE,
+        reconcile_seconds: float = settings.INVENTORY_RECONCILE_SECONDS,
+        lease_ttl_seconds: float = settings.INVENTORY_LEASE_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self.hot_threshold = hot_threshold
+        self.lease_size = lease_size
+        self.reconcile_seconds = reconcile_seconds
+        self.lease_ttl = timedelta(seconds=lease_ttl_seconds)
+        self.clock = clock
+        # 本进程的标识，额度行以此区分持有者
+        self.owner = uuid.uuid4().hex
+        self._pending: List[_ReserveRequest] = []
+        self._leases: Dict[int, _Lease] = {}
+        # 当前统计窗口内各产品的预留次数，以及按上一窗口判定的热门产品
+        self._hits: Counter = Counter()
+        self._window_started = clock()
+        self._hot: Set[int] = set()
+        # 批次提交和额度调整都会修改内存中的额度，串行执行
+        self._lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def leased_units(self) -> int:
+        return sum(lease.remaining for lease in self._leases.values())
+
+    async def start(self) -> None:
+        """启动组提交和定期维护任务"""
+        if self.running:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._maintain())]
+
+    async def stop(self) -> None:
+        """提交积压的预留，并把本进程持有的额度全部返还到库存"""
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        runner, maintainer = self._tasks
+        maintainer.cancel()
+        try:
+            await maintainer
+        except asyncio.CancelledError:
+            pass
+        # 不取消提交任务，避免打断正在提交的批次
+        await runner
+        self._tasks = []
+        await self.flush()
+        self._hot.clear()
+        await self.reconcile()
+
+    async def reserve(
+        self,
+        product_id: int,
+        quantity: int,
+        tenant_id: str = settings.DEFAULT_TENANT_ID,
+        ttl_seconds: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        预留库存并等待所在批次提交
+
+        Raises:
+            ValueError: 数量不合法
+            InsufficientStockError: 库存不足
+            ProductNotFoundError: 产品不存在
+        """
+        if quantity <= 0:
+            raise ValueError("预留数量必须大于0")
+        if not self.running:
+            raise RuntimeError("库存预留服务未启动")
+        ttl = ttl_seconds if ttl_seconds is not None else settings.INVENTORY_RESERVATION_TTL_SECONDS
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_ReserveRequest(
+            tenant_id, product_id, quantity, _utcnow() + timedelta(seconds=ttl), future
+        ))
+        self._track(product_id)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return await future
+
+    def _track(self, product_id: int) -> None:
+        """统计预留频率，窗口内次数超过阈值的产品立即视为热门"""
+        self._hits[product_id] += 1
+        if self._hits[product_id] >= self.hot_threshold * self.reconcile_seconds:
+            self._hot.add(product_id)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # 错误已传递给等待的调用方，这里只保证后台任务不退出
+                logger.error(f"库存预留提交失败: {str(e)}")
+
+    async def flush(self) -> None:
+        """把积压的预留作为一个批次提交"""
+        if not self._pending:
+            return
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            started = time.perf_counter()
+            for attempt in range(2):
+                # 事务失败时内存中的额度恢复到批次开始前的状态
+                snapshot = copy.deepcopy(self._leases)
+                try:
+                    results, available = await self._write_batch(batch)
+                    break
+                except Exception as e:
+                    self._leases = snapshot
+                    if isinstance(e, _LeaseLostError) and attempt == 0:
+                        # 额度已被其他进程返还，丢弃后重新执行整个批次（改为重新扣减库存）
+                        logger.warning(str(e))
+                        for product_id in e.product_ids:
+                            self._leases.pop(product_id, None)
+                        continue
+                    for request in batch:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+                    raise
+
+        self._apply_stock(available)
+        for request, result in zip(batch, results):
+            if request.future.done():
+                continue
+            if isinstance(result, Exception):
+                request.future.set_exception(result)
+            else:
+                request.future.set_result(result)
+        metrics.observe("inventory_batch_size", len(batch))
+        metrics.observe("inventory_flush_ms", (time.perf_counter() - started) * 1000)
+        metrics.set_gauge("inventory_leased_units", self.leased_units)
+
+    async def _write_batch(
+        self, batch: List[_ReserveRequest]
+    ) -> Tuple[List[Union[Dict[str, Any], Exception]], Dict[Tuple[str, int], int]]:
+        """
+        在一个事务中扣减库存、写入预留行和额度行
+
+        Returns:
+            (每个请求的预留或异常, (租户, 产品ID) -> 可用库存)
+        """
+        results: List[Union[Dict[str, Any], Exception]] = []
+        rows = []
+        touched: Set[Tuple[str, int]] = set()
+        stock = _BatchStock()
+        async with self.session_factory() as db:
+            for request in batch:
+                try:
+                    if request.product_id in self._hot:
+                        await self._take_from_lease(db, stock, request)
+                    else:
+                        await self._decrement(db, stock, request.tenant_id, request.product_id, request.quantity)
+                except (InsufficientStockError, ProductNotFoundError) as e:
+                    metrics.inc("inventory_reservations_total", result=type(e).__name__)
+                    results.append(e)
+                    continue
+                touched.add((request.tenant_id, request.product_id))
+                reservation = {
+                    "id": uuid.uuid4().hex,
+                    "tenant_id": request.tenant_id,
+                    "product_id": request.product_id,
+                    "quantity": request.quantity,
+                    "status": RESERVATION_HELD,
+                    "expires_at": request.expires_at,
+                }
+                rows.append(reservation)
+                results.append(reservation)
+            await self._apply_deferred(db, stock)
+            if rows:
+                await db.execute(insert(InventoryReservation), rows)
+            await self._persist_leases(db)
+            available = await self._sync_projection(db, touched)
+            await db.commit()
+        for lease in self._leases.values():
+            lease.dirty = False
+        metrics.inc("inventory_reservations_total", len(rows), result="held")
+        return [self._response(result) for result in results], available
+
+    async def _decrement(self, db: Any, stock: _BatchStock, tenant_id: str, product_id: int, quantity: int) -> None:
+        """扣减库存，库存不足时抛出 InsufficientStockError"""
+        key = (tenant_id, product_id)
+        if key in stock.missing:
+            raise ProductNotFoundError(product_id)
+        known = stock.known.get(key)
+        if known is None:
+            stock.known[key] = await self._conditional_decrement(db, tenant_id, product_id, quantity, stock)
+            return
+        if known < quantity:
+            raise InsufficientStockError(product_id, quantity, known)
+        stock.known[key] = known - quantity
+        stock.deferred[key] += quantity
+
+    async def _apply_deferred(self, db: Any, stock: _BatchStock) -> None:
+        """把批次内在内存中计算的扣减合并写入，每个产品一条条件扣减"""
+        for (tenant_id, product_id), quantity in stock.deferred.items():
+            result = await db.execute(
+                update(_products)
+                .where(
+                    _products.c.id == product_id,
+                    _products.c.tenant_id == tenant_id,
+                    _products.c.stock >= quantity,
+                )
+                .values(stock=_products.c.stock - quantity)
+            )
+            if result.rowcount == 0:
+                # 持有写锁时不会发生；行锁数据库中首次扣减失败未锁定行时，库存可能已被并发修改
+                raise RuntimeError(f"产品 {product_id} 的库存在批次执行期间被修改")
+
+    async def _conditional_decrement(
+        self, db: Any, tenant_id: str, product_id: int, quantity: int, stock: _BatchStock
+    ) -> int:
+        """条件扣减库存，返回扣减后的库存"""
+        result = await db.execute(
+            update(_products)
+            .where(
+                _products.c.id == product_id,
+                _products.c.tenant_id == tenant_id,
+                _products.c.stock >= quantity,
+            )
+            .values(stock=_products.c.stock - quantity)
+            .returning(_products.c.stock)
+        )
+        remaining = result.scalar_one_or_none()
+        if remaining is not None:
+            return remaining
+        result = await db.execute(
+            select(_products.c.stock).where(_products.c.id == product_id, _products.c.tenant_id == tenant_id)
+        )
+        row = result.first()
+        if row is None:
+            stock.missing.add((tenant_id, product_id))
+            raise ProductNotFoundError(product_id)
+        stock.known[(tenant_id, product_id)] = row.stock or 0
+        raise InsufficientStockError(product_id, quantity, row.stock or 0)
+
+    async def _take_from_lease(self, db: Any, stock: _BatchStock, request: _ReserveRequest) -> None:
+        """从进程内额度分配，额度不足时从库存补充一整块（库存不够一整块时按实际剩余补充）"""
+        lease = self._leases.get(request.product_id)
+        if lease is not None and lease.tenant_id != request.tenant_id:
+            raise ProductNotFoundError(request.product_id)
+        remaining = lease.remaining if lease is not None else 0
+        if remaining < request.quantity:
+            need = request.quantity - remaining
+            take = max(need, self.lease_size)
+            try:
+                await self._decrement(db, stock, request.tenant_id, request.product_id, take)
+            except InsufficientStockError as e:
+                if e.available < need:
+                    raise InsufficientStockError(request.product_id, request.quantity, e.available + remaining)
+                # 库存不够一整块时取走剩余的全部库存
+                take = e.available
+                await self._decrement(db, stock, request.tenant_id, request.product_id, take)
+            if lease is None:
+                lease = self._leases[request.product_id] = _Lease(
+                    uuid.uuid4().hex, request.tenant_id, request.product_id
+                )
+            lease.remaining += take
+            metrics.inc("inventory_lease_refills_total")
+        lease.remaining -= request.quantity
+        lease.dirty = True
+
+    async def _persist_leases(self, db: Any) -> None:
+        """把剩余额度和续期时间写入额度行，额度行已被其他进程返还时抛出 _LeaseLostError"""
+        expires_at = _utcnow() + self.lease_ttl
+        lost = set()
+        for lease in self._leases.values():
+            if not lease.dirty:
+                continue
+            if not lease.persisted:
+                await db.execute(insert(InventoryReservation).values(
+                    id=lease.id,
+                    tenant_id=lease.tenant_id,
+                    product_id=lease.product_id,
+                    quantity=lease.remaining,
+                    status=RESERVATION_LEASE,
+                    owner=self.owner,
+                    expires_at=expires_at,
+                ))
+                lease.persisted = True
+                continue
+            result = await db.execute(
+                update(_reservations)
+                .where(_reservations.c.id == lease.id, _reservations.c.owner == self.owner)
+                .values(quantity=lease.remaining, expires_at=expires_at)
+            )
+            if result.rowcount == 0:
+                lost.add(lease.product_id)
+        if lost:
+            raise _LeaseLostError(lost)
+
+    async def _sync_projection(self, db: Any, keys: Iterable[Tuple[str, int]]) -> Dict[Tuple[str, int], int]:
+        """
+        在同一事务中按库存加额度（包括其他进程的额度）更新搜索投影的有货状态，调用方需先写入额度行
+
+        Returns:
+            (租户, 产品ID) -> 可用库存
+        """
+        by_tenant: Dict[str, List[int]] = {}
+        for tenant_id, product_id in keys:
+            by_tenant.setdefault(tenant_id, []).append(product_id)
+        available: Dict[Tuple[str, int], int] = {}
+        for tenant_id, product_ids in by_tenant.items():
+            result = await db.execute(
+                select(_products.c.id, func.coalesce(_products.c.stock, 0) + leased_units(_products.c.id))
+                .where(_products.c.id.in_(product_ids), _products.c.tenant_id == tenant_id)
+            )
+            rows = result.all()
+            if not rows:
+                continue
+            await db.execute(
+                update(_projection)
+                .where(
+                    _projection.c.id == bindparam("product_id"),
+                    _projection.c.tenant_id == bindparam("b_tenant_id"),
+                )
+                .values(in_stock=bindparam("in_stock")),
+                [
+                    {"product_id": product_id, "b_tenant_id": tenant_id, "in_stock": units > 0}
+                    for product_id, units in rows
+                ]
+            )
+            available.update(((tenant_id, product_id), units) for product_id, units in rows)
+        return available
+
+    def _apply_stock(self, available: Dict[Tuple[str, int], int]) -> None:
+        """事务提交后同步列式筛选存储并使详情缓存失效（搜索结果不含库存，不需要失效）"""
+        for (tenant_id, product_id), stock in available.items():
+            store = filter_stores.for_update(tenant_id)
+            if store is not None:
+                store.update_fields(product_id, stock=stock)
+            invalidate_products(tenant_id, [product_id], search_results=False)
+
+    @staticmethod
+    def _response(result: Union[Dict[str, Any], Exception]) -> Union[Dict[str, Any], Exception]:
+        if isinstance(result, Exception):
+            return result
+        return {key: result[key] for key in ("id", "product_id", "quantity", "status", "expires_at")}
+
+    async def confirm(self, reservation_id: str, tenant_id: str = settings.DEFAULT_TENANT_ID) -> Dict[str, Any]:
+        """
+        确认未过期的预留，库存不再返还
+
+        Raises:
+            ReservationNotFoundError: 预留不存在
+            ReservationStateError: 预留已确认、释放或过期
+        """
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(_reservations)
+                .where(
+                    _reservations.c.id == reservation_id,
+                    _reservations.c.tenant_id == tenant_id,
+                    _reservations.c.status == RESERVATION_HELD,
+                    _reservations.c.expires_at > _utcnow(),
+                )
+                .values(status=RESERVATION_CONFIRMED)
+                .returning(_reservations.c.id, _reservations.c.product_id, _reservations.c.quantity,
+                           _reservations.c.status, _reservations.c.expires_at)
+            )
+            row = result.first()
+            if row is None:
+                await self._raise_for_state(db, reservation_id, tenant_id)
+            await db.commit()
+        metrics.inc("inventory_confirmed_total")
+        return self._row_response(row)
+
+    async def release(self, reservation_id: str, tenant_id: str = settings.DEFAULT_TENANT_ID) -> Dict[str, Any]:
+        """
+        释放未确认的预留并返还库存
+
+        Raises:
+            ReservationNotFoundError: 预留不存在
+            ReservationStateError: 预留已确认、释放或过期
+        """
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(_reservations)
+                .where(
+                    _reservations.c.id == reservation_id,
+                    _reservations.c.tenant_id == tenant_id,
+                    _reservations.c.status == RESERVATION_HELD,
+                )
+                .values(status=RESERVATION_RELEASED)
+                .returning(_reservations.c.id, _reservations.c.product_id, _reservations.c.quantity,
+                           _reservations.c.status, _reservations.c.expires_at)
+            )
+            row = result.first()
+            if row is None:
+                await self._raise_for_state(db, reservation_id, tenant_id)
+            available = await self._restock(db, [(tenant_id, row.product_id, row.quantity)])
+            await db.commit()
+        self._apply_stock(available)
+        metrics.inc("inventory_released_total")
+        return self._row_response(row)
+
+    async def _raise_for_state(self, db: Any, reservation_id: str, tenant_id: str) -> None:
+        result = await db.execute(
+            select(_reservations.c.status, _reservations.c.expires_at).where(
+                _reservations.c.id == reservation_id,
+                _reservations.c.tenant_id == tenant_id,
+                _reservations.c.status != RESERVATION_LEASE,
+            )
+        )
+        row = result.first()
+        if row is None:
+            raise ReservationNotFoundError(reservation_id)
+        status = row.status
+        if status == RESERVATION_HELD and _as_utc(row.expires_at) <= _utcnow():
+            status = RESERVATION_EXPIRED
+        raise ReservationStateError(f"预留状态为 {status}")
+
+    @staticmethod
+    def _row_response(row: Any) -> Dict[str, Any]:
+        return {
+            "id": row.id,
+            "product_id": row.product_id,
+            "quantity": row.quantity,
+            "status": row.status,
+            "expires_at": _as_utc(row.expires_at),
+        }
+
+    async def _restock(self, db: Any, items: Iterable[Tuple[str, int, int]]) -> Dict[Tuple[str, int], int]:
+        """把 (租户, 产品ID, 数量) 加回库存，同一产品合并为一次更新"""
+        totals: Counter = Counter()
+        for tenant_id, product_id, quantity in items:
+            totals[(tenant_id, product_id)] += quantity
+        if not totals:
+            return {}
+        await db.execute(
+            update(_products)
+            .where(_products.c.id == bindparam("product_id"), _products.c.tenant_id == bindparam("b_tenant_id"))
+            .values(stock=_products.c.stock + bindparam("quantity")),
+            [
+                {"product_id": product_id, "b_tenant_id": tenant_id, "quantity": quantity}
+                for (tenant_id, product_id), quantity in totals.items()
+            ]
+        )
+        return await self._sync_projection(db, totals)
+
+    async def _maintain(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_seconds)
+            try:
+                await self.reconcile()
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"库存额度维护失败: {str(e)}")
+
+    async def reconcile(self) -> None:
+        """按最近的预留频率重新判定热门产品，返还冷却产品的额度，并为其余额度续期"""
+        async with self._lock:
+            now = self.clock()
+            elapsed = max(now - self._window_started, 1e-6)
+            if not self._stopping:
+                self._hot = {
+                    product_id for product_id, hits in self._hits.items()
+                    if hits / elapsed >= self.hot_threshold
+                }
+            self._hits.clear()
+            self._window_started = now
+
+            available: Dict[Tuple[str, int], int] = {}
+            if self._leases:
+                expires_at = _utcnow() + self.lease_ttl
+                dropped = []
+                returned = []
+                async with self.session_factory() as db:
+                    for product_id, lease in self._leases.items():
+                        owned = and_(_reservations.c.id == lease.id, _reservations.c.owner == self.owner)
+                        if product_id not in self._hot:
+                            deleted = await db.execute(delete(_reservations).where(owned))
+                            dropped.append(product_id)
+                            # 额度行已被其他进程返还时不能重复返还
+                            if deleted.rowcount:
+                                returned.append((lease.tenant_id, product_id, lease.remaining))
+                            continue
+                        renewed = await db.execute(
+                            update(_reservations).where(owned).values(quantity=lease.remaining, expires_at=expires_at)
+                        )
+                        if renewed.rowcount == 0:
+                            logger.warning(f"产品 {product_id} 的额度已被返还，丢弃进程内额度")
+                            dropped.append(product_id)
+                    available = await self._restock(db, returned)
+                    await db.commit()
+                for product_id in dropped:
+                    self._leases.pop(product_id, None)
+        self._apply_stock(available)
+        metrics.set_gauge("inventory_hot_products", len(self._hot))
+        metrics.set_gauge("inventory_leased_units", self.leased_units)
+
+    async def sweep(self) -> int:
+        """
+        将过期未确认的预留标记为过期并返还库存，同时返还其他进程未续期的额度
+
+        Returns:
+            过期的预留数
+        """
+        now = _utcnow()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(_reservations)
+                .where(_reservations.c.status == RESERVATION_HELD, _reservations.c.expires_at <= now)
+                .values(status=RESERVATION_EXPIRED)
+                .returning(_reservations.c.tenant_id, _reservations.c.product_id, _reservations.c.quantity)
+            )
+            expired = result.all()
+            result = await db.execute(
+                delete(_reservations)
+                .where(
+                    _reservations.c.status == RESERVATION_LEASE,
+                    _reservations.c.expires_at <= now,
+                    _reservations.c.owner != self.owner,
+                )
+                .returning(_reservations.c.tenant_id, _reservations.c.product_id, _reservations.c.quantity)
+            )
+            abandoned = result.all()
+            if not expired and not abandoned:
+                return 0
+            available = await self._restock(db, [tuple(row) for row in expired + abandoned])
+            await db.commit()
+        self._apply_stock(available)
+        metrics.inc("inventory_expired_total", len(expired))
+        if abandoned:
+            logger.info(f"已返还 {len(abandoned)} 个过期的进程额度")
+        return len(expired)
+
+
+# 全局库存预留服务，随应用启动和关闭
+inventory_service = InventoryService()
@@ -0,0 +1,489 @@
+import asyncio
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote, urljoin, urlparse
+
+import httpx
+from PIL import Image
+from sqlalchemy import and_, or_, select, update
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import async_session_factory
+from app.models.product import MEDIA_FAILED, MEDIA_READY, Product, ProductMedia, ProductSearch
+from app.services.caches import invalidate_products
+
+logger = logging.getLogger(__name__)
+
+# 支持的图片格式 -> 文件扩展名
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+
+
+# 请求扩展字段：下载前已检查过的目标IP
+PINNED_ADDRESS = "media_pinned_address"
+
+
+class MediaError(Exception):
+    """图片无法获取或不是支持的图片格式"""
+
+
+class PinnedAddressTransport(httpx.AsyncBaseTransport):
+    """
+    把请求发往下载前检查过的IP，不再重新解析域名，避免检查后域名被改为解析到内网（DNS重绑定）
+
+    请求地址中的域名替换为IP，Host头保持原域名，HTTPS 的 SNI 和证书校验也使用原域名。
+    连接池按IP复用连接。
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        extensions = dict(request.extensions)
+        address = extensions.pop(PINNED_ADDRESS, None)
+        if address is not None:
+            host = request.url.host
+            # Host头在构造请求时已按原地址设置，这里只改连接目标
+            request.url = request.url.copy_with(host=address)
+            if request.url.scheme == "https":
+                extensions["sni_hostname"] = host
+        request.extensions = extensions
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def is_public_address(address: str) -> bool:
+    """地址是否为公网地址（排除私有、回环、链路本地、组播、保留等地址）"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def sniff_image(data: bytes) -> Tuple[str, int, int]:
+    """
+    根据文件头识别图片格式并读取尺寸，不解码像素
+
+    Returns:
+        (MIME类型, 宽, 高)
+
+    Raises:
+        MediaError: 不是支持的图片格式或文件头损坏
+    """
+    try:
+        if data.startswith(b"\x89PNG\r\n\x1a\n"):
+            width, height = struct.unpack(">II", data[16:24])
+            return "image/png", width, height
+        if data[:6] in (b"GIF87a", b"GIF89a"):
+            width, height = struct.unpack("<HH", data[6:10])
+            return "image/gif", width, height
+        if data.startswith(b"\xff\xd8"):
+            return ("image/jpeg",) + _jpeg_size(data)
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return ("image/webp",) + _webp_size(data)
+    except struct.error:
+        raise MediaError("图片文件头不完整")
+    raise MediaError("不是支持的图片格式")
+
+
+def _jpeg_size(data: bytes) -> Tuple[int, int]:
+    # 依次跳过各个段，直到帧头（SOF0-SOF15，排除DHT/JPG/DAC）
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            raise MediaError("JPEG文件结构损坏")
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if 0xD0 <= marker <= 0xD9 or marker == 0x01:
+            offset += 2
+            continue
+        length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + length
+    raise MediaError("JPEG文件中没有帧头")
+
+
+def _webp_size(data: bytes) -> Tuple[int, int]:
+    chunk = data[12:16]
+    if chunk == b"VP8X":
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return width, height
+    if chunk == b"VP8L":
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    raise MediaError("不支持的WebP格式")
+
+
+class MediaPipeline:
+    """
+    图片处理流水线
+
+    产品图片地址变更时加入有界队列，由固定数量的工作协程获取图片、识别格式和尺寸、
+    生成缩略图，按内容哈希写入媒体目录并记录CDN地址。
+    解码和缩放在线程池中执行，不阻塞事件循环；请求路径上只读取预先计算好的地址字符串。
+    图片地址由商家提供，下载前解析域名并拒绝内网地址，重定向逐跳检查；
+    下载失败的图片按指数退避在进程内重试，直到达到 MEDIA_MAX_ATTEMPTS 次。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any] = async_session_factory,
+        fetcher: Optional[Callable[[str], Awaitable[bytes]]] = None,
+        media_dir: Path = settings.MEDIA_DIR,
+        base_url: str = settings.MEDIA_BASE_URL,
+        workers: int = settings.MEDIA_WORKERS,
+        queue_size: int = settings.MEDIA_QUEUE_SIZE,
+        thumbnail_size: int = settings.MEDIA_THUMBNAIL_SIZE,
+        max_bytes: int = settings.MEDIA_MAX_BYTES,
+        retry_base_seconds: float = settings.MEDIA_RETRY_BASE_SECONDS,
+        allowed_hosts: Optional[List[str]] = None,
+    ):
+        self.session_factory = session_factory
+        # 测试时可传入桩函数，避免访问网络
+        self.fetcher = fetcher or self.fetch
+        self.media_dir = Path(media_dir)
+        self.base_url = base_url.rstrip("/")
+        self.workers = workers
+        self.queue_size = queue_size
+        self.thumbnail_size = thumbnail_size
+        self.max_bytes = max_bytes
+        self.retry_base_seconds = retry_base_seconds
+        if allowed_hosts is None:
+            allowed_hosts = [host.strip() for host in settings.MEDIA_ALLOWED_HOSTS.split(",") if host.strip()]
+        self.allowed_hosts = [host.lower().lstrip(".") for host in allowed_hosts]
+        self._queue: Optional[asyncio.Queue] = None
+        # 已在队列中的产品ID，同一产品只排队一次，处理时读取最新的图片地址
+        self._queued: Set[int] = set()
+        self._tasks: List[asyncio.Task] = []
+        # 等待重试的产品ID -> 定时器
+        self._retries: Dict[int, asyncio.TimerHandle] = {}
+        self._client: Any = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        """启动工作协程，并在后台补处理尚未处理或已过期的产品图片"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._backfill()))
+
+    async def stop(self) -> None:
+        """停止处理，队列中未处理的任务在下次启动时由补处理重新加入"""
+        for handle in self._retries.values():
+            handle.cancel()
+        self._retries.clear()
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._queued.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def enqueue(self, product_id: int) -> bool:
+        """
+        请求处理产品图片，不等待处理完成
+
+        Returns:
+            是否已加入队列；队列已满或流水线未启动时返回False
+        """
+        if not self.running:
+            return False
+        if product_id in self._queued:
+            return True
+        try:
+            self._queue.put_nowait(product_id)
+        except asyncio.QueueFull:
+            metrics.inc("media_jobs_total", status="dropped")
+            return False
+        self._queued.add(product_id)
+        metrics.set_gauge("media_queue_depth", self._queue.qsize())
+        return True
+
+    async def _backfill(self, batch_size: int = 500) -> None:
+        """把有图片但没有处理结果、图片已更换或失败次数未达上限的产品加入队列"""
+        last_id = 0
+        pending = or_(
+            ProductMedia.product_id.is_(None),
+            ProductMedia.source_url != Product.image_url,
+            and_(ProductMedia.status == MEDIA_FAILED, ProductMedia.attempts < settings.MEDIA_MAX_ATTEMPTS),
+        )
+        while True:
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(Product.id)
+                    .outerjoin(ProductMedia, ProductMedia.product_id == Product.id)
+                    .where(Product.id > last_id, Product.image_url.isnot(None), pending)
+                    .order_by(Product.id)
+                    .limit(batch_size)
+                )
+                product_ids = list(result.scalars().all())
+            if not product_ids:
+                break
+            for product_id in product_ids:
+                if product_id not in self._queued:
+                    # 队列满时等待，补处理不丢弃任务
+                    self._queued.add(product_id)
+                    await self._queue.put(product_id)
+            last_id = product_ids[-1]
+
+    async def _worker(self) -> None:
+        while True:
+            product_id = await self._queue.get()
+            self._queued.discard(product_id)
+            metrics.set_gauge("media_queue_depth", self._queue.qsize())
+            try:
+                await self.process(product_id)
+            except Exception as e:
+                logger.error(f"处理产品 {product_id} 的图片失败: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """等待队列中的任务全部处理完"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def process(self, product_id: int) -> Optional[str]:
+        """
+        处理单个产品的当前图片
+
+        Returns:
+            处理状态；产品不存在或没有图片时返回None
+        """
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(Product.tenant_id, Product.image_url).where(Product.id == product_id)
+            )
+            row = result.first()
+        if row is None or not row.image_url:
+            return None
+        tenant_id, source_url = row
+
+        started = time.perf_counter()
+        try:
+            data = await self.fetcher(source_url)
+            stored = await asyncio.to_thread(self._store, tenant_id, data)
+        except Exception as e:
+            error = str(e)[:255] or type(e).__name__
+            attempts = await self._save(product_id, tenant_id, source_url, {"status": MEDIA_FAILED, "error": error})
+            metrics.inc("media_jobs_total", status=MEDIA_FAILED)
+            logger.warning(f"产品 {product_id} 的图片处理失败: {source_url}: {error}")
+            # 地址被拒绝、格式不支持等错误重试也不会成功，只重试网络错误
+            if attempts is not None and not isinstance(e, MediaError):
+                self._schedule_retry(product_id, attempts)
+            return MEDIA_FAILED
+        await self._save(product_id, tenant_id, source_url, {"status": MEDIA_READY, "error": None, **stored})
+        metrics.inc("media_jobs_total", status=MEDIA_READY)
+        metrics.observe("media_process_ms", (time.perf_counter() - started) * 1000)
+        return MEDIA_READY
+
+    def _schedule_retry(self, product_id: int, attempts: int) -> None:
+        """按指数退避安排重试，达到最大次数后不再重试"""
+        if attempts >= settings.MEDIA_MAX_ATTEMPTS or not self.running or product_id in self._retries:
+            return
+        delay = self.retry_base_seconds * 2 ** (attempts - 1)
+
+        def retry() -> None:
+            self._retries.pop(product_id, None)
+            self.enqueue(product_id)
+
+        self._retries[product_id] = asyncio.get_running_loop().call_later(delay, retry)
+        metrics.inc("media_retries_scheduled_total")
+
+    async def _save(
+        self, product_id: int, tenant_id: str, source_url: str, values: Dict[str, Any]
+    ) -> Optional[int]:
+        """
+        写入处理结果；处理期间图片地址已变更时丢弃结果，由新的任务处理
+
+        Returns:
+            该图片地址已尝试的次数，结果被丢弃时返回None
+        """
+        async with self.session_factory() as db:
+            current = await db.execute(select(Product.image_url).where(Product.id == product_id))
+            if current.scalar_one_or_none() != source_url:
+                return None
+            media = await db.get(ProductMedia, product_id)
+            if media is None:
+                media = ProductMedia(product_id=product_id, attempts=0)
+                db.add(media)
+            elif media.source_url != source_url:
+                media.attempts = 0
+            media.tenant_id = tenant_id
+            media.source_url = source_url
+            media.attempts += 1
+            for key, value in values.items():
+                setattr(media, key, value)
+            if values["status"] == MEDIA_READY:
+                await db.execute(
+                    update(ProductSearch)
+                    .where(ProductSearch.id == product_id)
+                    .values(image_url=values["image_url"], thumbnail_url=values["thumbnail_url"])
+                )
+            attempts = media.attempts
+            await db.commit()
+        invalidate_products(tenant_id, [product_id])
+        return attempts
+
+    def _store(self, tenant_id: str, data: bytes) -> Dict[str, Any]:
+        """识别图片并写入原图和缩略图，在线程池中执行"""
+        content_type, width, height = sniff_image(data)
+        extension = IMAGE_EXTENSIONS[content_type]
+        content_hash = hashlib.sha256(data).hexdigest()
+        relative = Path(tenant_id) / content_hash[:2] / f"{content_hash}{extension}"
+        self._write(relative, data)
+
+        thumbnail = relative
+        if max(width, height) > self.thumbnail_size:
+            thumbnail_data, thumbnail_extension = self._thumbnail(data)
+            thumbnail = relative.with_name(f"{content_hash}_{self.thumbnail_size}{thumbnail_extension}")
+            self._write(thumbnail, thumbnail_data)
+        return {
+            "content_hash": content_hash,
+            "content_type": content_type,
+            "width": width,
+            "height": height,
+            "image_url": self.url_for(relative),
+            "thumbnail_url": self.url_for(thumbnail),
+        }
+
+    def _thumbnail(self, data: bytes) -> Tuple[bytes, str]:
+        """
+        按最长边缩放，带透明通道的图片保存为PNG，其余保存为JPEG
+
+        Raises:
+            MediaError: 文件头可以识别但像素数据损坏，或像素数超出Pillow的解压炸弹限制
+        """
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                output = io.BytesIO()
+                if image.mode in ("RGBA", "LA", "P"):
+                    image.save(output, format="PNG", optimize=True)
+                    return output.getvalue(), ".png"
+                image.convert("RGB").save(output, format="JPEG", quality=85, optimize=True)
+                return output.getvalue(), ".jpg"
+        except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+            raise MediaError(f"无法生成缩略图: {e}")
+
+    def _write(self, relative: Path, data: bytes) -> None:
+        # 文件名即内容哈希，已存在时无需重写；先写临时文件再改名，避免读到写了一半的文件
+        path = self.media_dir / relative
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+
+    def url_for(self, relative: Path) -> str:
+        return f"{self.base_url}/{relative.as_posix()}"
+
+    async def fetch(self, url: str) -> bytes:
+        """
+        获取图片内容：http(s) 地址通过网络下载，file:// 地址和本地路径只允许读取媒体目录下的文件
+
+        Raises:
+            MediaError: 地址不受支持、文件不在媒体目录下或超出大小限制
+        """
+        parsed = urlparse(url)
+        if parsed.scheme in ("http", "https"):
+            return await self._download(url)
+        if parsed.scheme not in ("", "file"):
+            raise MediaError(f"不支持的图片地址: {parsed.scheme}")
+        path = Path(unquote(parsed.path)).resolve()
+        if not path.is_relative_to(self.media_dir.resolve()):
+            raise MediaError("本地图片必须位于媒体目录下")
+        if not path.is_file():
+            raise MediaError("图片文件不存在")
+        if path.stat().st_size > self.max_bytes:
+            raise MediaError("图片超出大小限制")
+        return await asyncio.to_thread(path.read_bytes)
+
+    async def _download(self, url: str) -> bytes:
+        """下载图片，不自动跟随重定向：每一跳都先检查目标地址，并连接到检查过的IP"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=settings.MEDIA_FETCH_TIMEOUT,
+                follow_redirects=False,
+                transport=PinnedAddressTransport(),
+            )
+        for _ in range(settings.MEDIA_MAX_REDIRECTS + 1):
+            address = await self._check_url(url)
+            async with self._client.stream("GET", url, extensions={PINNED_ADDRESS: address}) as response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers["location"])
+                    continue
+                response.raise_for_status()
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise MediaError("图片超出大小限制")
+                    chunks.append(chunk)
+            return b"".join(chunks)
+        raise MediaError("图片地址重定向次数过多")
+
+    async def _check_url(self, url: str) -> str:
+        """
+        检查下载地址：只允许 http(s)、允许的域名，且域名解析出的所有地址都是公网地址
+
+        Returns:
+            下载时应连接的IP（解析结果中的第一个地址）
+
+        Raises:
+            MediaError: 地址不允许访问
+        """
+        parsed = urlparse(url)
+        host = (parsed.hostname or "").lower()
+        if parsed.scheme not in ("http", "https") or not host:
+            raise MediaError(f"不支持的图片地址: {url}")
+        if self.allowed_hosts and not any(
+            host == allowed or host.endswith("." + allowed) for allowed in self.allowed_hosts
+        ):
+            raise MediaError(f"图片域名不在允许列表中: {host}")
+        try:
+            port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        except ValueError:
+            raise MediaError(f"图片地址端口不正确: {url}")
+        try:
+            addresses = await asyncio.get_running_loop().getaddrinfo(host, port)
+        except OSError as e:
+            # 域名暂时无法解析属于网络错误，可以重试
+            raise ConnectionError(f"无法解析图片域名 {host}: {e}")
+        if not addresses or not all(is_public_address(info[4][0]) for info in addresses):
+            metrics.inc("media_blocked_total")
+            raise MediaError(f"图片地址指向内网或保留地址: {host}")
+        return addresses[0][4][0].split("%", 1)[0]
+
+
+# 全局图片处理流水线，随应用启动和关闭
+media_pipeline = MediaPipeline()
@@ -1,174 +1,451 @@
-from typing import Dict, List, Optional, Any, Union
-from sqlalchemy import select, func, or_, and_, desc, asc
+import asyncio
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Tuple, Union
+from sqlalchemy import select, update, func, or_, and_, desc, asc
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.product import Product
-from app.schemas.product import ProductCreate, ProductUpdate, ProductSearchResponse
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.product import Category, Product, ProductSearch
+from app.schemas.intent import SearchIntent
+from app.schemas.product import (
+    ProductCreate,
+    ProductResponse,
+    ProductSearchResponse,
+    ProductStockPriceUpdate,
+    ProductUpdate,
+)
+from app.services import search_projection
+from app.services.caches import featured_cache, invalidate_products, product_detail_cache, search_result_cache
+from app.services.filter_store import ColumnarFilterStore, filter_stores
+from app.services.media import media_pipeline
+from app.services.query_normalizer import product_terms, query_normalizer
+from app.services.search_projection import normalize_text
+from app.services.trending import trending_engine
+from app.services.write_behind import BATCHABLE_FIELDS, ProductNotFoundError, StockBelowReservedError, write_queue
 
 class ProductService:
-    """产品服务，处理产品相关的业务逻辑"""
+    """
+    产品服务，处理产品相关的业务逻辑
+    
+    每个实例只访问一个租户的数据，所有查询、缓存和内存结构都限定在该租户内。
+    """
     
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, tenant_id: str = settings.DEFAULT_TENANT_ID):
         self.db = db
+        self.tenant_id = tenant_id
+    
+    async def _filter_store(self) -> Optional[ColumnarFilterStore]:
+        """本租户的列式筛选存储，未启用时返回None"""
+        if not settings.FILTER_STORE_ENABLED:
+            return None
+        return await filter_stores.get(self.tenant_id)
     
     async def get_products(
         self,
         skip: int = 0,
         limit: int = 100,
-        category: Optional[str] = None
+        category: Optional[str] = None,
+        in_stock: Optional[bool] = None
     ) -> List[Product]:
         """获取产品列表"""
-        query = select(Product)
+        store = await self._filter_store()
+        if store is not None:
+            # 在列式内存存储上完成筛选和分页，只按ID取出当前页的完整产品
+            category_ids = store.match_categories(category, exact=True) if category else None
+            if category_ids == []:
+                return []
+            ids, _ = store.page(category_ids=category_ids, in_stock=in_stock, offset=skip, limit=limit)
+            return await self._get_products_by_ids(ids)
+        
+        # 先在搜索投影的覆盖索引上完成筛选和分页，再按ID取出当前页的完整产品
+        query = select(ProductSearch.id).where(ProductSearch.tenant_id == self.tenant_id)
         if category:
-            query = query.where(Product.category == category)
+            category_ids = await search_projection.find_category_ids(self.db, category, exact=True)
+            if not category_ids:
+                return []
+            query = query.where(ProductSearch.category_id.in_(category_ids))
+        if in_stock is not None:
+            query = query.where(ProductSearch.in_stock == in_stock)
         
+        query = query.order_by(desc(ProductSearch.created_at), desc(ProductSearch.id))
         query = query.offset(skip).limit(limit)
-        result = await self.db.execute(query)
-        return result.scalars().all()
+        ids = (await self.db.execute(query)).scalars().all()
+        return await self._get_products_by_ids(ids)
+    
+    async def _get_products_by_ids(self, ids: List[int]) -> List[Product]:
+        """按给定ID顺序获取产品"""
+        if not ids:
+            return []
+        result = await self.db.execute(
+            select(Product).where(Product.tenant_id == self.tenant_id, Product.id.in_(ids))
+        )
+        products = {product.id: product for product in result.scalars().all()}
+        return [products[product_id] for product_id in ids if product_id in products]
     
     async def get_product(self, product_id: int) -> Optional[Product]:
-        """根据ID获取产品"""
-        query = select(Product).where(Product.id == product_id)
+        """根据ID获取产品，其他租户的产品视为不存在"""
+        query = select(Product).where(Product.id == product_id, Product.tenant_id == self.tenant_id)
         result = await self.db.execute(query)
         return result.scalar_one_or_none()
     
+    async def get_product_payload(self, product_id: int) -> Optional[Dict[str, Any]]:
+        """获取序列化后的产品详情，优先读取详情缓存"""
+        payload = product_detail_cache.get(self.tenant_id, product_id)
+        if payload is not None:
+            metrics.inc("product_detail_cache_total", outcome="hit")
+            return payload
+        metrics.inc("product_detail_cache_total", outcome="miss")
+        product = await self.get_product(product_id)
+        if product is None:
+            return None
+        payload = ProductResponse.model_validate(product).model_dump(mode="json")
+        product_detail_cache.set(self.tenant_id, product_id, payload)
+        return payload
+    
     async def create_product(self, product: ProductCreate) -> Product:
         """创建新产品"""
         db_product = Product(
+            tenant_id=self.tenant_id,
             name=product.name,
             description=product.description,
             price=product.price,
             currency=product.currency,
             category=product.category,
             stock=product.stock,
-            image_url=product.image_url,
+            image_url=str(product.image_url) if product.image_url else None,
             sku=product.sku,
             tags=product.tags,
             attributes=product.attributes
         )
+        return await self._insert_product(db_product)
+    
+    async def _insert_product(self, db_product: Product) -> Product:
+        """写入产品并同步搜索投影"""
         self.db.add(db_product)
-        await self.db.commit()
+        await self.db.flush()
         await self.db.refresh(db_product)
+        row = await search_projection.sync_product(self.db, db_product, leased=0)
+        await self.db.commit()
+        self._sync_filter_store(db_product, row, leased=0)
+        query_normalizer.add_product(db_product)
+        if db_product.image_url:
+            media_pipeline.enqueue(db_product.id)
+        invalidate_products(self.tenant_id, [db_product.id])
         return db_product
     
+    def _sync_filter_store(self, product: Product, row: ProductSearch, leased: int) -> None:
+        """事务提交后把产品写入本租户已加载的列式筛选存储，库存列为库存加预留额度"""
+        store = filter_stores.for_update(self.tenant_id)
+        if store is None:
+            return
+        store.add_category(row.category_id, product.category)
+        store.upsert(product.id, product.price, (product.stock or 0) + leased, row.category_id, product.created_at)
+    
     async def create_product_from_dict(self, product_data: Dict[str, Any]) -> Product:
         """从字典创建产品"""
-        db_product = Product.from_dict(product_data)
-        self.db.add(db_product)
-        await self.db.commit()
-        await self.db.refresh(db_product)
-        return db_product
+        db_product = Product.from_dict({**product_data, "tenant_id": self.tenant_id})
+        return await self._insert_product(db_product)
     
     async def update_product(self, product_id: int, product: ProductUpdate) -> Product:
-        """更新产品信息"""
+        """
+        更新产品信息
+        
+        写入的库存是现有的总件数，products.stock 保存扣除未确认预留和额度后的件数。
+        
+        Raises:
+            StockBelowReservedError: 库存少于已预留的件数
+        """
         db_product = await self.get_product(product_id)
         
         # 仅更新非None字段
         update_data = product.dict(exclude_unset=True)
+        if update_data and set(update_data) <= BATCHABLE_FIELDS and write_queue.running:
+            # 只改库存/价格的请求交给写合并队列，与其他请求一起组提交
+            await write_queue.submit(product_id, update_data, tenant_id=self.tenant_id)
+            await self.db.refresh(db_product)
+            return db_product
+        
+        if "stock" in update_data:
+            # 预留件数在 UPDATE 中计算，与预留的扣减和返还串行
+            total = update_data.pop("stock")
+            reserved = search_projection.reserved_units(Product.id)
+            result = await self.db.execute(
+                update(Product)
+                .where(Product.id == product_id, Product.tenant_id == self.tenant_id, reserved <= total)
+                .values(stock=total - reserved)
+                .returning(Product.stock)
+                .execution_options(synchronize_session=False)
+            )
+            stock = result.scalar_one_or_none()
+            if stock is None:
+                await self.db.rollback()
+                reserved = (await self.db.execute(select(search_projection.reserved_units(product_id)))).scalar_one()
+                raise StockBelowReservedError(product_id, total, reserved)
+            set_committed_value(db_product, "stock", stock)
+        
+        if update_data.get("image_url") is not None:
+            update_data["image_url"] = str(update_data["image_url"])
+        image_changed = "image_url" in update_data and update_data["image_url"] != db_product.image_url
+        old_terms = product_terms(db_product)
         for key, value in update_data.items():
             setattr(db_product, key, value)
         
+        leased = await search_projection.get_leased_units(self.db, product_id)
+        row = await search_projection.sync_product(self.db, db_product, leased=leased)
         await self.db.commit()
         await self.db.refresh(db_product)
+        self._sync_filter_store(db_product, row, leased)
+        query_normalizer.remove_terms(old_terms, self.tenant_id)
+        query_normalizer.add_product(db_product)
+        if image_changed and db_product.image_url:
+            media_pipeline.enqueue(db_product.id)
+        invalidate_products(self.tenant_id, [product_id])
         return db_product
     
+    async def bulk_update_stock_price(self, updates: List[ProductStockPriceUpdate]) -> Dict[str, Any]:
+        """
+        批量更新库存和价格
+        
+        所有修改提交到写合并队列，对同一产品的多次修改会被合并，全部提交后返回。
+        库存少于已预留件数的产品不会被修改，其ID在 rejected 中返回。
+        """
+        async def submit(item: ProductStockPriceUpdate) -> Optional[Tuple[int, bool]]:
+            try:
+                await write_queue.submit(
+                    item.id, item.dict(exclude_unset=True, exclude={"id"}), tenant_id=self.tenant_id
+                )
+            except ProductNotFoundError:
+                return item.id, False
+            except StockBelowReservedError:
+                return item.id, True
+            return None
+        
+        results = await asyncio.gather(*(submit(item) for item in updates))
+        failed = [result for result in results if result is not None]
+        missing = sorted({product_id for product_id, rejected in failed if not rejected})
+        rejected = sorted({product_id for product_id, rejected in failed if rejected})
+        return {"updated": len(updates) - len(failed), "missing": missing, "rejected": rejected}
+    
     async def delete_product(self, product_id: int) -> None:
         """删除产品"""
         db_product = await self.get_product(product_id)
+        terms = product_terms(db_product)
+        await search_projection.remove_product(self.db, product_id)
         await self.db.delete(db_product)
         await self.db.commit()
+        query_normalizer.remove_terms(terms, self.tenant_id)
+        store = filter_stores.for_update(self.tenant_id)
+        if store is not None:
+            store.remove(product_id)
+        invalidate_products(self.tenant_id, [product_id])
     
     async def count_products(self) -> int:
-        """获取产品总数"""
-        query = select(func.count()).select_from(Product)
+        """获取本租户的产品总数"""
+        query = select(func.count()).select_from(Product).where(Product.tenant_id == self.tenant_id)
         result = await self.db.execute(query)
         return result.scalar_one()
     
-    async def get_featured_products(self, limit: int = 10) -> List[Product]:
-        """获取推荐产品"""
+    async def get_featured_products(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        获取推荐产品
+        
+        优先返回热度引擎预先计算的热门列表；热门产品不足 limit 个时用最新产品补足（排除已有的产品），
+        最新产品列表在 FEATURED_CACHE_TTL 内复用。
+        """
+        trending = trending_engine.featured(self.tenant_id, limit) or []
+        if len(trending) >= limit:
+            return trending
+        newest = await self._newest_products(limit)
+        if not trending:
+            return newest
+        seen = {item["id"] for item in trending}
+        return trending + [item for item in newest if item["id"] not in seen][:limit - len(trending)]
+    
+    async def _newest_products(self, limit: int) -> List[Dict[str, Any]]:
+        cached = featured_cache.get(self.tenant_id, limit)
+        if cached is not None:
+            return cached
         # 这里可以实现自定义逻辑，例如按照销量、评分等获取推荐产品
         # 这里简化为获取最新产品
-        query = select(Product).order_by(Product.created_at.desc()).limit(limit)
+        query = (
+            select(Product)
+            .where(Product.tenant_id == self.tenant_id)
+            .order_by(Product.created_at.desc(), Product.id.desc())
+            .limit(limit)
+        )
         result = await self.db.execute(query)
-        return result.scalars().all()
+        products = [
+            ProductSearchResponse.model_validate(product).model_dump(mode="json")
+            for product in result.scalars().all()
+        ]
+        featured_cache.set(self.tenant_id, limit, products)
+        return products
         
     async def search_products_by_intent(
         self, 
-        intent_data: Dict[str, Any],
+        intent: Union[SearchIntent, Dict[str, Any]],
         page: int = 1,
-        limit: int = 20
+        limit: int = 20,
+        cache_ttl: Optional[float] = None
     ) -> Dict[str, Any]:
-        """基于意图数据搜索产品"""
-        query = select(Product)
-        
-        # 筛选条件
-        filters = []
-        
-        # 产品类型筛选
-        if product_type := intent_data.get("product_type"):
-            if product_type != "其他":
-                filters.append(Product.category.ilike(f"%{product_type}%"))
-        
-        # 价格范围筛选
-        if price_range := intent_data.get("price_range"):
-            if price_range.get("min", 0) > 0:
-                filters.append(Product.price >= price_range["min"])
-            if price_range.get("max", 0) > 0:
-                filters.append(Product.price <= price_range["max"])
-        
-        # 品牌筛选 - 假设品牌信息可能在tags字段中
-        if brands := intent_data.get("brands"):
-            for brand in brands:
-                # 注意：这里需要根据您的实际数据结构调整
-                filters.append(Product.tags.contains([brand]))
-        
-        # 关键词筛选
-        if keywords := intent_data.get("keywords"):
-            keyword_filters = []
-            for keyword in keywords:
-                keyword_filters.append(
-                    or_(
-                        Product.name.ilike(f"%{keyword}%"),
-                        Product.description.ilike(f"%{keyword}%")
-                    )
-                )
-            if keyword_filters:
-                filters.append(or_(*keyword_filters))
-        
-        # 应用筛选条件
-        if filters:
-            query = query.where(and_(*filters))
-        
-        # 排序处理
-        sort_preference = intent_data.get("sort_preference")
-        if sort_preference:
-            if "价格" in sort_preference and "高到低" in sort_preference:
-                query = query.order_by(desc(Product.price))
-            elif "价格" in sort_preference:
-                query = query.order_by(asc(Product.price))
-            else:
-                # 默认按创建时间排序
-                query = query.order_by(desc(Product.created_at))
+        """
+        基于搜索意图搜索产品，查询只访问搜索投影和类别表
+        
+        结果按 (意图, 页码, 每页数量) 短时缓存，相同意图的请求直接复用。
+        
+        Args:
+            cache_ttl: 指定时不读取缓存，重新查询并按该时长缓存（缓存预热使用）
+        """
+        if isinstance(intent, dict):
+            intent = SearchIntent.from_dict(intent)
+        cache_key = (intent, page, limit)
+        if cache_ttl is None:
+            cached = search_result_cache.get(self.tenant_id, cache_key)
+            if cached is not None:
+                metrics.inc("search_result_cache_total", outcome="hit")
+                return cached
+            metrics.inc("search_result_cache_total", outcome="miss")
+        
+        store = await self._filter_store() if not intent.brands and not intent.keywords else None
+        if store is not None:
+            # 只有价格、类别和排序条件时在列式内存存储上筛选，不需要关键词匹配
+            response = await self._search_filter_store(store, intent, page, limit)
         else:
-            # 默认排序
-            query = query.order_by(desc(Product.created_at))
+            response = await self._search_projection(intent, page, limit)
+        search_result_cache.set(self.tenant_id, cache_key, response, ttl=cache_ttl)
+        return response
+    
+    async def _search_projection(self, intent: SearchIntent, page: int, limit: int) -> Dict[str, Any]:
+        """在搜索投影上执行意图查询"""
+        filters, order_by = compile_intent_filters(intent)
+        filters = (ProductSearch.tenant_id == self.tenant_id,) + filters
+        
+        # 产品类型筛选：先在很小的类别表上匹配出类别ID，再走投影的类别复合索引
+        if intent.category:
+            category_ids = await search_projection.find_category_ids(self.db, intent.category)
+            if not category_ids:
+                return self._page_response([], 0, page, limit)
+            filters = (ProductSearch.category_id.in_(category_ids),) + filters
         
         # 计算总数
-        total_query = select(func.count()).select_from(Product)
-        if filters:
-            total_query = total_query.where(and_(*filters))
+        total_query = select(func.count()).select_from(ProductSearch).where(and_(*filters))
+        total = (await self.db.execute(total_query)).scalar_one()
         
-        total_result = await self.db.execute(total_query)
-        total = total_result.scalar_one()
+        # 分页：先在复合索引上取出当前页的ID，再按ID取出展示字段，排序和偏移不需要回表
+        query = (
+            select(ProductSearch.id)
+            .where(and_(*filters))
+            .order_by(*order_by)
+            .offset((page - 1) * limit)
+            .limit(limit)
+        )
+        ids = (await self.db.execute(query)).scalars().all()
         
-        # 分页
-        query = query.offset((page - 1) * limit).limit(limit)
-        result = await self.db.execute(query)
-        products = result.scalars().all()
+        return self._page_response(await self._load_search_items(ids), total, page, limit)
+    
+    async def _search_filter_store(
+        self,
+        store: ColumnarFilterStore,
+        intent: SearchIntent,
+        page: int,
+        limit: int
+    ) -> Dict[str, Any]:
+        """在本租户的列式内存存储上筛选排序，只为当前页的ID查询投影"""
+        category_ids = store.match_categories(intent.category) if intent.category else None
+        if category_ids == []:
+            return self._page_response([], 0, page, limit)
+        ids, total = store.page(
+            category_ids=category_ids,
+            min_price=intent.min_price,
+            max_price=intent.max_price,
+            sort=intent.sort,
+            offset=(page - 1) * limit,
+            limit=limit,
+        )
+        if not ids:
+            return self._page_response([], total, page, limit)
+        return self._page_response(await self._load_search_items(ids), total, page, limit)
+    
+    async def _load_search_items(self, ids: List[int]) -> List[Dict[str, Any]]:
+        """按给定ID顺序从搜索投影取出结果项"""
+        if not ids:
+            return []
+        query = (
+            select(
+                ProductSearch.id,
+                ProductSearch.name,
+                ProductSearch.description,
+                ProductSearch.price,
+                ProductSearch.image_url,
+                ProductSearch.thumbnail_url,
+                Category.name.label("category"),
+            )
+            .join(Category, Category.id == ProductSearch.category_id)
+            .where(ProductSearch.tenant_id == self.tenant_id, ProductSearch.id.in_(ids))
+        )
+        rows = {row.id: row for row in (await self.db.execute(query)).all()}
+        return search_projection.to_search_items(rows[product_id] for product_id in ids if product_id in rows)
+    
+    async def find_core_candidates(self, core_intent: SearchIntent) -> Optional[List[Any]]:
+        """
+        提前搜索：按核心意图（类目、价格范围）取出候选行
         
-        # 构建响应
+        候选行带有其余条件需要的列（检索文本、价格、创建时间），完整意图到达后
+        由 search_candidates 在内存中完成品牌、关键词筛选和排序，不必再查询一遍。
+        候选超过 INTENT_SPECULATIVE_MAX_CANDIDATES 行时返回None，由调用方按完整意图查询。
+        """
+        max_candidates = settings.INTENT_SPECULATIVE_MAX_CANDIDATES
+        filters, _ = compile_intent_filters(core_intent)
+        filters = (ProductSearch.tenant_id == self.tenant_id,) + filters
+        if core_intent.category:
+            category_ids = await search_projection.find_category_ids(self.db, core_intent.category)
+            if not category_ids:
+                return []
+            filters = (ProductSearch.category_id.in_(category_ids),) + filters
+        query = (
+            select(ProductSearch.id, ProductSearch.price, ProductSearch.created_at, ProductSearch.search_text)
+            .where(and_(*filters))
+            .limit(max_candidates + 1)
+        )
+        rows = (await self.db.execute(query)).all()
+        if len(rows) > max_candidates:
+            return None
+        return rows
+    
+    async def search_candidates(
+        self,
+        candidates: List[Any],
+        intent: SearchIntent,
+        page: int = 1,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """在 find_core_candidates 取出的候选行上应用完整意图的其余条件，结果与 search_products_by_intent 一致"""
+        cache_key = (intent, page, limit)
+        cached = search_result_cache.get(self.tenant_id, cache_key)
+        if cached is not None:
+            metrics.inc("search_result_cache_total", outcome="hit")
+            return cached
+        
+        matched = [row for row in candidates if match_intent_terms(intent, row.search_text)]
+        if intent.sort == "pd":
+            matched.sort(key=lambda row: (row.price, row.id), reverse=True)
+        elif intent.sort == "pa":
+            matched.sort(key=lambda row: (row.price, row.id))
+        else:
+            # 与数据库的降序一致，没有创建时间的行排在最后
+            matched.sort(key=lambda row: (row.created_at is not None, row.created_at, row.id), reverse=True)
+        offset = (page - 1) * limit
+        ids = [row.id for row in matched[offset:offset + limit]]
+        response = self._page_response(await self._load_search_items(ids), len(matched), page, limit)
+        search_result_cache.set(self.tenant_id, cache_key, response)
+        return response
+    
+    def _page_response(self, items: List[Any], total: int, page: int, limit: int) -> Dict[str, Any]:
+        """构建分页响应"""
         return {
-            "items": products,
+            "items": items,
             "total": total,
             "page": page,
             "limit": limit,
@@ -176,6 +453,57 @@ class ProductService:
         }
 
 
+@lru_cache(maxsize=1024)
+def compile_intent_filters(intent: SearchIntent) -> Tuple[Tuple[Any, ...], Tuple[Any, ...]]:
+    """
+    把搜索意图翻译为搜索投影上的筛选条件和排序
+    
+    意图不可变且可哈希，翻译结果按意图缓存，热门意图不必每次重新构建表达式。
+    产品类型需要查询类别表得到ID，由调用方单独处理。
+    
+    Returns:
+        (筛选条件元组, 排序表达式元组)
+    """
+    filters = []
+    
+    # 价格范围筛选
+    if intent.min_price is not None:
+        filters.append(ProductSearch.price >= intent.min_price)
+    if intent.max_price is not None:
+        filters.append(ProductSearch.price <= intent.max_price)
+    
+    # 品牌筛选 - 品牌出现在名称、标签或属性中，均已写入检索文本
+    for brand in intent.brands:
+        filters.append(ProductSearch.search_text.contains(normalize_text(brand)))
+    
+    # 关键词筛选
+    if intent.keywords:
+        filters.append(or_(*(
+            ProductSearch.search_text.contains(normalize_text(keyword))
+            for keyword in intent.keywords
+        )))
+    
+    # 排序处理，以ID作为次级排序键保证分页稳定
+    if intent.sort == "pd":
+        order_by = (desc(ProductSearch.price), desc(ProductSearch.id))
+    elif intent.sort == "pa":
+        order_by = (asc(ProductSearch.price), asc(ProductSearch.id))
+    else:
+        # 默认按创建时间排序
+        order_by = (desc(ProductSearch.created_at), desc(ProductSearch.id))
+    
+    return tuple(filters), order_by
+
+
+def match_intent_terms(intent: SearchIntent, search_text: str) -> bool:
+    """在内存中判断检索文本是否满足意图的品牌和关键词条件，语义与 compile_intent_filters 一致"""
+    if any(normalize_text(brand) not in search_text for brand in intent.brands):
+        return False
+    if intent.keywords and not any(normalize_text(keyword) in search_text for keyword in intent.keywords):
+        return False
+    return True
+
+
 async def search_products(
     query: str,
     categories: Optional[List[str]] = None,
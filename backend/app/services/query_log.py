@@ -0,0 +1,173 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.schemas.intent import SearchIntent
+from app.services.search_projection import normalize_text
+
+logger = logging.getLogger(__name__)
+
+LOG_FILE_PATTERN = "queries-*.jsonl.gz"
+
+
+class QueryLogger:
+    """
+    查询日志
+
+    请求路径上只把记录放入有界队列（队列满时丢弃并计数），
+    后台任务按批次在线程池中追加写入gzip压缩的JSON Lines文件，文件超过大小后轮转。
+    """
+
+    def __init__(
+        self,
+        log_dir: Path = settings.QUERY_LOG_DIR,
+        flush_interval: float = settings.QUERY_LOG_FLUSH_INTERVAL_SECONDS,
+        batch_size: int = settings.QUERY_LOG_BATCH_SIZE,
+        max_queue: int = settings.QUERY_LOG_QUEUE_SIZE,
+        rotate_bytes: int = settings.QUERY_LOG_ROTATE_MB * 1024 * 1024,
+        max_files: int = settings.QUERY_LOG_MAX_FILES,
+    ):
+        self.log_dir = Path(log_dir)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.rotate_bytes = rotate_bytes
+        self.max_files = max_files
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._current: Optional[Path] = None
+        self._sequence = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def log(
+        self,
+        endpoint: str,
+        query: str,
+        intent: Optional[SearchIntent] = None,
+        result_count: Optional[int] = None,
+        latencies_ms: Optional[Dict[str, float]] = None,
+        **extra: Any,
+    ) -> None:
+        """记录一次查询，不阻塞调用方"""
+        if self._queue is None:
+            return
+        record = {
+            "ts": round(time.time(), 3),
+            "endpoint": endpoint,
+            "query": normalize_text(query),
+            "intent": intent.cache_key if intent is not None else None,
+            "results": result_count,
+            "latency": {k: round(v, 2) for k, v in (latencies_ms or {}).items()},
+        }
+        record.update(extra)
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            metrics.inc("query_log_dropped_total")
+
+    async def start(self) -> None:
+        """启动后台写入任务"""
+        if self.running:
+            return
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务并写入剩余记录"""
+        if self._task is None:
+            return
+        self._stop.set()
+        await self._task
+        self._task = None
+        self._queue = None
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        batch = []
+        while not self._queue.empty() and len(batch) < self.batch_size:
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            # 每个刷写间隔把积压的记录成批写出，停止时最后再写一次
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.flush_interval)
+                stopping = True
+            except asyncio.TimeoutError:
+                pass
+            while batch := self._drain():
+                try:
+                    await self._flush(batch)
+                except Exception as e:
+                    logger.error(f"写入查询日志失败: {str(e)}")
+                    metrics.inc("query_log_dropped_total", len(batch))
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        # 压缩和文件IO放到线程池，避免阻塞事件循环
+        await asyncio.to_thread(self._write, batch)
+        metrics.inc("query_log_written_total", len(batch))
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        path = self._current_file()
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+        # 追加模式下每批是一个独立的gzip成员，读取时可连续解压
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            f.write(data)
+
+    def _current_file(self) -> Path:
+        """返回当前写入的文件，超过大小时轮转并清理最旧的文件"""
+        if self._current is None or not self._current.exists() or self._current.stat().st_size >= self.rotate_bytes:
+            self._current = self._new_file()
+            files = sorted(self.log_dir.glob(LOG_FILE_PATTERN))
+            for old in files[: max(0, len(files) - self.max_files + 1)]:
+                os.remove(old)
+        return self._current
+
+    def _new_file(self) -> Path:
+        """
+        生成新的日志文件名
+
+        文件名包含微秒时间戳和进程内递增序号，同一秒内多次轮转也不会写回同一个文件，
+        且文件名的字典序与创建顺序一致。
+        """
+        while True:
+            self._sequence += 1
+            name = datetime.now().strftime("queries-%Y%m%d-%H%M%S-%f") + f"-{self._sequence:06d}.jsonl.gz"
+            path = self.log_dir / name
+            if not path.exists():
+                return path
+
+
+def read_query_logs(log_dir: Path = settings.QUERY_LOG_DIR):
+    """按时间顺序读取所有查询日志记录"""
+    for path in sorted(Path(log_dir).glob(LOG_FILE_PATTERN)):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+        except EOFError:
+            # 正在写入的文件末尾可能不完整
+            logger.warning(f"查询日志文件不完整: {path}")
+
+
+# 全局查询日志实例，随应用启动和关闭
+query_logger = QueryLogger()
@@ -0,0 +1,227 @@
+import logging
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.inventory import RESERVATION_HELD, RESERVATION_LEASE, InventoryReservation
+from app.models.product import Category, Product, ProductSearch
+
+logger = logging.getLogger(__name__)
+
+# 已提交类别的名称到ID缓存，类别表很小且只增不改
+_category_ids: Dict[str, int] = {}
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """规范化文本：全角转半角、转小写并合并空白"""
+    if not text:
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+def build_search_text(product: Product) -> str:
+    """拼接名称、描述、标签和属性值，生成预先规范化的检索文本"""
+    parts: List[str] = [product.name or "", product.description or ""]
+    parts.extend(str(tag) for tag in product.tags or [])
+    parts.extend(str(value) for value in (product.attributes or {}).values())
+    return normalize_text(" ".join(parts))
+
+
+async def get_category_id(db: AsyncSession, name: str) -> int:
+    """
+    获取类别ID，不存在时创建
+
+    并发创建同名类别时，后插入的一方不报唯一约束冲突（INSERT ... ON CONFLICT DO NOTHING），
+    重新查询得到先提交的类别ID。
+    """
+    if name in _category_ids:
+        return _category_ids[name]
+    result = await db.execute(select(Category.id).where(Category.name == name))
+    category_id = result.scalar_one_or_none()
+    if category_id is None:
+        # 新建的类别在事务提交前可能回滚，不放入缓存
+        insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+        await db.execute(insert(Category).values(name=name).on_conflict_do_nothing(index_elements=["name"]))
+        result = await db.execute(select(Category.id).where(Category.name == name))
+        return result.scalar_one()
+    _category_ids[name] = category_id
+    return category_id
+
+
+async def find_category_ids(db: AsyncSession, pattern: str, exact: bool = False) -> List[int]:
+    """
+    按名称查找类别ID
+
+    Args:
+        pattern: 类别名称或名称片段
+        exact: 是否精确匹配，否则按包含关系模糊匹配
+    """
+    if exact:
+        condition = Category.name == pattern
+    else:
+        condition = Category.name.ilike(f"%{pattern}%")
+    result = await db.execute(select(Category.id).where(condition))
+    return list(result.scalars().all())
+
+
+def leased_units(product_id: Any) -> Any:
+    """
+    产品被库存预留进程整块扣下、尚未分配的件数（标量子查询，可关联产品ID列）
+
+    额度中的件数不在 products.stock 中但仍可被预留，有货状态按库存加额度计算。
+    """
+    return (
+        select(func.coalesce(func.sum(InventoryReservation.quantity), 0))
+        .where(InventoryReservation.product_id == product_id, InventoryReservation.status == RESERVATION_LEASE)
+        .scalar_subquery()
+    )
+
+
+async def get_leased_units(db: AsyncSession, product_id: int) -> int:
+    return (await db.execute(select(leased_units(product_id)))).scalar_one()
+
+
+def reserved_units(product_id: Any) -> Any:
+    """
+    产品已从库存中扣除、尚未确认或返还的件数：未确认的预留加额度（标量子查询，可关联产品ID列）
+
+    已过期但还未被清理的预留仍然计入，清理时才返还到库存。
+    """
+    return (
+        select(func.coalesce(func.sum(InventoryReservation.quantity), 0))
+        .where(
+            InventoryReservation.product_id == product_id,
+            InventoryReservation.status.in_([RESERVATION_HELD, RESERVATION_LEASE]),
+        )
+        .scalar_subquery()
+    )
+
+
+async def sync_product(db: AsyncSession, product: Product, leased: Optional[int] = None) -> ProductSearch:
+    """
+    写入或更新单个产品的搜索投影行并返回该行，由调用方负责提交
+
+    Args:
+        leased: 产品的额度件数，未给出时查询
+    """
+    if leased is None:
+        leased = await get_leased_units(db, product.id)
+    row = ProductSearch(
+        id=product.id,
+        tenant_id=product.tenant_id,
+        name=product.name,
+        description=product.description,
+        price=product.price,
+        category_id=await get_category_id(db, product.category),
+        in_stock=(product.stock or 0) + leased > 0,
+        search_text=build_search_text(product),
+        image_url=product.display_image_url or None,
+        thumbnail_url=product.thumbnail_url,
+        created_at=product.created_at,
+    )
+    existing = await db.get(ProductSearch, product.id)
+    if existing is None:
+        db.add(row)
+        return row
+    # 保留已累计的热度分
+    for column in (
+        "tenant_id", "name", "description", "price", "category_id", "in_stock",
+        "search_text", "image_url", "thumbnail_url", "created_at",
+    ):
+        setattr(existing, column, getattr(row, column))
+    return existing
+
+
+async def remove_product(db: AsyncSession, product_id: int) -> None:
+    """删除产品的搜索投影行，由调用方负责提交"""
+    await db.execute(delete(ProductSearch).where(ProductSearch.id == product_id))
+
+
+async def rebuild(db: AsyncSession, batch_size: int = 500) -> int:
+    """
+    根据产品表全量重建搜索投影
+
+    Returns:
+        重建的行数
+    """
+    await db.execute(delete(ProductSearch))
+    count = 0
+    last_id = 0
+    while True:
+        result = await db.execute(
+            select(Product).where(Product.id > last_id).order_by(Product.id).limit(batch_size)
+        )
+        products = result.scalars().all()
+        if not products:
+            break
+        for product in products:
+            await sync_product(db, product)
+        await db.flush()
+        count += len(products)
+        last_id = products[-1].id
+    await db.commit()
+    return count
+
+
+def _stale_product_ids():
+    """投影行缺失或关键字段与产品表不一致的产品ID"""
+    return (
+        select(Product.id)
+        .outerjoin(ProductSearch, ProductSearch.id == Product.id)
+        .outerjoin(Category, Category.id == ProductSearch.category_id)
+        .where(or_(
+            ProductSearch.id.is_(None),
+            ProductSearch.tenant_id != Product.tenant_id,
+            ProductSearch.name != Product.name,
+            ProductSearch.description.is_distinct_from(Product.description),
+            ProductSearch.price != Product.price,
+            Category.name.is_(None),
+            Category.name != Product.category,
+            ProductSearch.in_stock != (func.coalesce(Product.stock, 0) + leased_units(Product.id) > 0),
+        ))
+    )
+
+
+async def ensure_projection(db: AsyncSession, batch_size: int = 500) -> int:
+    """
+    启动时检查投影是否与产品表一致，修复缺失、过期和多余的行
+
+    行数相同并不代表内容一致（例如进程在写入产品后、同步投影前退出），
+    因此按关键字段逐行比较，只重新同步不一致的产品。
+
+    Returns:
+        修复的行数
+    """
+    orphaned = await db.execute(
+        delete(ProductSearch).where(ProductSearch.id.not_in(select(Product.id)))
+    )
+    stale_ids = list((await db.execute(_stale_product_ids())).scalars().all())
+    for start in range(0, len(stale_ids), batch_size):
+        result = await db.execute(select(Product).where(Product.id.in_(stale_ids[start:start + batch_size])))
+        for product in result.scalars().all():
+            await sync_product(db, product)
+        await db.flush()
+    await db.commit()
+    repaired = orphaned.rowcount + len(stale_ids)
+    if repaired:
+        logger.info(f"搜索投影已修复: {len(stale_ids)} 行重新同步, {orphaned.rowcount} 行删除")
+    return repaired
+
+
+def to_search_items(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """把投影查询结果转换为搜索结果项"""
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "description": row.description,
+            "price": row.price,
+            "category": row.category,
+            "image_url": row.image_url,
+            "thumbnail_url": row.thumbnail_url,
+        }
+        for row in rows
+    ]
@@ -0,0 +1,313 @@
+import asyncio
+import heapq
+import logging
+import math
+import random
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import async_session_factory
+from app.models.product import Category, ProductRanking, ProductSearch
+from app.services import search_projection
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+# 候选产品以 (租户, 产品ID) 标识
+CandidateKey = Tuple[str, int]
+
+
+def sketch_key(tenant_id: str, product_id: int) -> int:
+    """(租户, 产品ID) 在计数矩阵中的整数键，不同租户对同一产品ID的计数互不累加"""
+    return (zlib.crc32(tenant_id.encode("utf-8")) << 32) | product_id
+
+
+class CountMinSketch:
+    """
+    Count-Min Sketch
+
+    用固定大小的计数矩阵近似统计每个产品的热度，估计值只会偏高不会偏低。
+    计数为浮点数，可整体乘以衰减因子实现指数衰减。
+    """
+
+    def __init__(self, width: int, depth: int, seed: int = 1):
+        rng = random.Random(seed)
+        self.width = width
+        self.depth = depth
+        self._hashes = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(depth)]
+        self._rows = [[0.0] * width for _ in range(depth)]
+
+    def _indexes(self, key: int):
+        for a, b in self._hashes:
+            yield ((a * key + b) % _MERSENNE_PRIME) % self.width
+
+    def add(self, key: int, weight: float = 1.0) -> float:
+        """累加权重并返回新的估计值"""
+        estimate = math.inf
+        for row, index in zip(self._rows, self._indexes(key)):
+            row[index] += weight
+            estimate = min(estimate, row[index])
+        return estimate
+
+    def estimate(self, key: int) -> float:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def decay(self, factor: float) -> None:
+        """所有计数乘以衰减因子"""
+        for row in self._rows:
+            for i, value in enumerate(row):
+                if value:
+                    row[i] = value * factor
+
+
+class TrendingEngine:
+    """
+    热门产品引擎
+
+    浏览和搜索点击事件写入 Count-Min Sketch，并维护一个有界的候选集（堆式淘汰最低分）。
+    所有租户共用一个计数矩阵和候选集，计数和候选都按 (租户, 产品ID) 区分：
+    事件中的租户来自请求头，伪造其他租户产品的点击只会累加到自己租户的键上，不影响产品所属租户的排名。
+    后台任务按间隔衰减计数、剔除产品不存在或不属于该租户的候选，为每个租户选出前K名写入
+    product_rankings 物化表并同步投影的热度分，然后生成各租户的推荐列表并整体替换引用，读取时无需查询数据库。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = async_session_factory,
+        top_k: int = settings.TRENDING_TOP_K,
+        max_candidates: int = settings.TRENDING_MAX_CANDIDATES,
+        refresh_seconds: float = settings.TRENDING_REFRESH_SECONDS,
+        half_life_seconds: float = settings.TRENDING_HALF_LIFE_SECONDS,
+        click_weight: float = settings.TRENDING_CLICK_WEIGHT,
+        sketch_width: int = settings.TRENDING_SKETCH_WIDTH,
+        sketch_depth: int = settings.TRENDING_SKETCH_DEPTH,
+    ):
+        self.session_factory = session_factory
+        self.top_k = top_k
+        self.refresh_seconds = refresh_seconds
+        self.half_life_seconds = half_life_seconds
+        self.click_weight = click_weight
+        self.sketch = CountMinSketch(sketch_width, sketch_depth)
+        self._capacity = max_candidates
+        self._candidates: Dict[CandidateKey, float] = {}
+        # 候选集的最小堆，条目可能过期（分数已更新），弹出时与候选集核对
+        self._heap: List[Tuple[float, CandidateKey]] = []
+        self._last_decay = time.monotonic()
+        self._ranked_ids: Tuple[int, ...] = ()
+        # 租户 -> 推荐列表
+        self._featured: Dict[str, Tuple[Dict[str, Any], ...]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record_view(self, product_id: int, tenant_id: str = settings.DEFAULT_TENANT_ID) -> None:
+        """记录一次产品浏览"""
+        self._record(product_id, tenant_id, 1.0)
+        metrics.inc("trending_events_total", kind="view")
+
+    def record_click(self, product_id: int, tenant_id: str = settings.DEFAULT_TENANT_ID) -> None:
+        """记录一次搜索结果点击"""
+        self._record(product_id, tenant_id, self.click_weight)
+        metrics.inc("trending_events_total", kind="click")
+
+    def _record(self, product_id: int, tenant_id: str, weight: float) -> None:
+        key = (tenant_id, product_id)
+        estimate = self.sketch.add(sketch_key(tenant_id, product_id), weight)
+        if key in self._candidates or len(self._candidates) < self._capacity:
+            self._candidates[key] = estimate
+            heapq.heappush(self._heap, (estimate, key))
+        else:
+            # 候选集已满：丢弃过期的堆顶，仅当新估计值高于当前最低分时替换
+            while self._candidates.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            lowest_score, lowest_key = self._heap[0]
+            if estimate <= lowest_score:
+                return
+            heapq.heapreplace(self._heap, (estimate, key))
+            del self._candidates[lowest_key]
+            self._candidates[key] = estimate
+        if len(self._heap) > self._capacity * 4:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(score, key) for key, score in self._candidates.items()]
+        heapq.heapify(self._heap)
+
+    def featured(self, tenant_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """读取租户预先计算的推荐列表；尚未生成或为空时返回None"""
+        featured = self._featured.get(tenant_id)
+        if not featured:
+            return None
+        return list(featured[:limit])
+
+    async def start(self) -> None:
+        """从物化表恢复排名并启动定期刷新"""
+        if self._task is not None:
+            return
+        try:
+            await self._restore()
+        except Exception as e:
+            logger.error(f"恢复热门排名失败: {str(e)}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"刷新热门排名失败: {str(e)}")
+
+    async def _restore(self) -> None:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(ProductRanking.product_id, ProductRanking.tenant_id, ProductRanking.score)
+                .order_by(ProductRanking.tenant_id, ProductRanking.rank)
+            )
+            rows = result.all()
+            for product_id, tenant_id, score in rows:
+                self._candidates[(tenant_id, product_id)] = self.sketch.add(sketch_key(tenant_id, product_id), score)
+            self._rebuild_heap()
+            self._featured, ranked = await self._load_featured(db, [tuple(row) for row in rows])
+            self._ranked_ids = tuple(product_id for product_id, _, _ in ranked)
+
+    def _decay(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_decay
+        self._last_decay = now
+        if self.half_life_seconds <= 0 or elapsed <= 0:
+            return
+        factor = 0.5 ** (elapsed / self.half_life_seconds)
+        self.sketch.decay(factor)
+        for key in self._candidates:
+            self._candidates[key] *= factor
+        self._rebuild_heap()
+
+    async def refresh(self) -> None:
+        """衰减计数，剔除无效候选，把每个租户的前K名写入物化表并替换推荐列表"""
+        started = time.perf_counter()
+        self._decay()
+
+        async with self.session_factory() as db:
+            await self._prune(db)
+            by_tenant: Dict[str, List[Tuple[int, float]]] = {}
+            for tenant_id, product_id in self._candidates:
+                by_tenant.setdefault(tenant_id, []).append(
+                    (product_id, self.sketch.estimate(sketch_key(tenant_id, product_id)))
+                )
+            ranked: List[Tuple[int, str, float]] = []
+            for tenant_id, scored in by_tenant.items():
+                scored.sort(key=lambda item: item[1], reverse=True)
+                ranked.extend((product_id, tenant_id, score) for product_id, score in scored[:self.top_k])
+
+            featured, ranked = await self._load_featured(db, ranked)
+            await db.execute(delete(ProductRanking))
+            if ranked:
+                ranks: Dict[str, int] = {}
+                rows = []
+                for product_id, tenant_id, score in ranked:
+                    ranks[tenant_id] = ranks.get(tenant_id, 0) + 1
+                    rows.append({
+                        "product_id": product_id,
+                        "tenant_id": tenant_id,
+                        "rank": ranks[tenant_id],
+                        "score": score,
+                    })
+                await db.execute(insert(ProductRanking), rows)
+                # 已删除的产品在投影中没有对应行，使用不校验行数的批量更新
+                await db.execute(
+                    update(ProductSearch.__table__)
+                    .where(ProductSearch.__table__.c.id == bindparam("product_id"))
+                    .values(popularity=bindparam("score")),
+                    [{"product_id": product_id, "score": score} for product_id, _, score in ranked]
+                )
+            ranked_ids = tuple(product_id for product_id, _, _ in ranked)
+            dropped = set(self._ranked_ids) - set(ranked_ids)
+            if dropped:
+                await db.execute(
+                    update(ProductSearch).where(ProductSearch.id.in_(dropped)).values(popularity=0.0)
+                )
+            await db.commit()
+
+        # 整体替换引用，读取方看到的要么是旧列表要么是新列表
+        self._ranked_ids = ranked_ids
+        self._featured = featured
+        metrics.observe("trending_refresh_ms", (time.perf_counter() - started) * 1000)
+        metrics.set_gauge("trending_candidates", len(self._candidates))
+        metrics.set_gauge("trending_tenants", len(featured))
+
+    async def _prune(self, db: Any, batch_size: int = 500) -> None:
+        """从候选集中剔除已删除的产品和不属于所记录租户的产品（例如伪造的点击事件）"""
+        product_ids = list({product_id for _, product_id in self._candidates})
+        valid = set()
+        for start in range(0, len(product_ids), batch_size):
+            result = await db.execute(
+                select(ProductSearch.tenant_id, ProductSearch.id)
+                .where(ProductSearch.id.in_(product_ids[start:start + batch_size]))
+            )
+            valid.update(map(tuple, result.all()))
+        # 查询期间新记录的产品未经检查，留到下次刷新
+        checked = set(product_ids)
+        invalid = [key for key in self._candidates if key[1] in checked and key not in valid]
+        if invalid:
+            for key in invalid:
+                del self._candidates[key]
+            self._rebuild_heap()
+            metrics.inc("trending_pruned_total", len(invalid))
+
+    async def _load_featured(
+        self, db: Any, ranked: List[Tuple[int, str, float]], batch_size: int = 500
+    ) -> Tuple[Dict[str, Tuple[Dict[str, Any], ...]], List[Tuple[int, str, float]]]:
+        """
+        按排名顺序从搜索投影生成各租户的推荐列表
+
+        已删除的产品和不属于所记录租户的产品（例如伪造的点击事件）会被剔除。
+
+        Returns:
+            (租户 -> 推荐列表, 剔除后的排名)
+        """
+        owners: Dict[int, str] = {}
+        items: Dict[int, Dict[str, Any]] = {}
+        product_ids = [product_id for product_id, _, _ in ranked]
+        for start in range(0, len(product_ids), batch_size):
+            result = await db.execute(
+                select(
+                    ProductSearch.id,
+                    ProductSearch.tenant_id,
+                    ProductSearch.name,
+                    ProductSearch.description,
+                    ProductSearch.price,
+                    ProductSearch.image_url,
+                    ProductSearch.thumbnail_url,
+                    Category.name.label("category"),
+                )
+                .join(Category, Category.id == ProductSearch.category_id)
+                .where(ProductSearch.id.in_(product_ids[start:start + batch_size]))
+            )
+            rows = result.all()
+            owners.update((row.id, row.tenant_id) for row in rows)
+            items.update((item["id"], item) for item in search_projection.to_search_items(rows))
+
+        valid = [entry for entry in ranked if owners.get(entry[0]) == entry[1]]
+        featured: Dict[str, List[Dict[str, Any]]] = {}
+        for product_id, tenant_id, _ in valid:
+            featured.setdefault(tenant_id, []).append(items[product_id])
+        return {tenant_id: tuple(tenant_items) for tenant_id, tenant_items in featured.items()}, valid
+
+
+# 全局热度引擎，随应用启动和关闭
+trending_engine = TrendingEngine()
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import async_session_factory
+from app.services.ai_service import AIService
+from app.services.product_service import ProductService
+from app.services.query_log import read_query_logs
+
+logger = logging.getLogger(__name__)
+
+
+def load_warmup_queries(
+    path: Path = settings.WARMUP_QUERIES_FILE,
+    from_logs: bool = settings.WARMUP_FROM_LOGS,
+    limit: int = settings.WARMUP_MAX_QUERIES,
+) -> List[str]:
+    """读取预热查询列表，文件不存在时可从查询日志中选取热门查询"""
+    if path and Path(path).exists():
+        lines = Path(path).read_text(encoding="utf-8").splitlines()
+        queries = [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+        return list(dict.fromkeys(queries))[:limit]
+    if from_logs:
+        # 延迟导入，避免应用启动时加载离线分析工具
+        from app.tools.query_report import warmup_queries
+        return warmup_queries(read_query_logs(), top=limit)
+    return []
+
+
+class CacheWarmer:
+    """
+    缓存预热
+
+    应用启动后在后台依次重放热门查询（填充意图缓存和搜索结果缓存），
+    预先计算推荐列表和热门产品详情。每项之间按配置间隔休眠，
+    与线上请求共享事件循环但不会长时间占用。预热完成前就绪检查返回未就绪。
+    预热的搜索结果按 WARMUP_RESULT_TTL 缓存，并每隔 WARMUP_REFRESH_SECONDS 重新查询，
+    在过期或被产品写入失效后重新填充。未配置LLM时规则解析没有可缓存的结果，跳过意图预热。
+    """
+
+    def __init__(
+        self,
+        ai_service: AIService,
+        session_factory: Callable = async_session_factory,
+        queries_loader: Callable[[], List[str]] = load_warmup_queries,
+        throttle_ms: float = settings.WARMUP_THROTTLE_MS,
+        result_ttl: float = settings.WARMUP_RESULT_TTL,
+        refresh_seconds: float = settings.WARMUP_REFRESH_SECONDS,
+    ):
+        self.ai_service = ai_service
+        self.session_factory = session_factory
+        self.queries_loader = queries_loader
+        self.throttle = throttle_ms / 1000
+        self.result_ttl = result_ttl
+        self.refresh_seconds = refresh_seconds
+        self.ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """在后台启动预热"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self) -> None:
+        """执行一次完整预热，无论成功与否最终都标记为就绪；之后定期重新预热搜索结果"""
+        queries = await self._warm_all()
+        while self.refresh_seconds > 0 and queries:
+            await asyncio.sleep(self.refresh_seconds)
+            started = time.perf_counter()
+            try:
+                async with self.session_factory() as db:
+                    await self._warm_queries(ProductService(db), queries)
+                logger.info(f"搜索结果重新预热完成: {len(queries)} 个查询, 耗时 {time.perf_counter() - started:.1f}s")
+            except Exception as e:
+                logger.error(f"搜索结果重新预热失败: {str(e)}")
+
+    async def _warm_all(self) -> List[str]:
+        """启动时的完整预热，返回预热的查询"""
+        started = time.perf_counter()
+        queries: List[str] = []
+        try:
+            queries = await asyncio.to_thread(self.queries_loader)
+            if not self.ai_service.llm_enabled:
+                logger.info("未配置LLM，跳过意图预热，只预热规则解析的搜索结果")
+            async with self.session_factory() as db:
+                product_service = ProductService(db)
+                await product_service.get_featured_products()
+                product_ids = await self._warm_queries(product_service, queries)
+                await self._warm_details(product_service, product_ids)
+            logger.info(
+                f"缓存预热完成: {len(queries)} 个查询, {len(product_ids)} 个产品详情, "
+                f"耗时 {time.perf_counter() - started:.1f}s"
+            )
+        except Exception as e:
+            logger.error(f"缓存预热失败: {str(e)}")
+        finally:
+            metrics.observe("warmup_duration_ms", (time.perf_counter() - started) * 1000)
+            self.ready.set()
+        return queries
+
+    async def _warm_queries(self, product_service: ProductService, queries: List[str]) -> List[int]:
+        """重放查询，返回结果中出现的产品ID（按出现顺序去重）"""
+        product_ids = {}
+        for query in queries:
+            try:
+                # 未配置LLM时不经过LLM路由，只取规则解析结果
+                intent = await self.ai_service.parse_search_intent(
+                    query, allow_llm=self.ai_service.llm_enabled, tenant_id=product_service.tenant_id
+                )
+                results = await product_service.search_products_by_intent(
+                    intent=intent,
+                    page=1,
+                    limit=settings.WARMUP_PAGE_SIZE,
+                    cache_ttl=self.result_ttl
+                )
+            except Exception as e:
+                logger.warning(f"预热查询失败 {query}: {str(e)}")
+                continue
+            for item in results["items"]:
+                product_ids.setdefault(item["id"] if isinstance(item, dict) else item.id, None)
+            metrics.inc("warmup_items_total", kind="query")
+            await asyncio.sleep(self.throttle)
+        return list(product_ids)[:settings.WARMUP_TOP_PRODUCTS]
+
+    async def _warm_details(self, product_service: ProductService, product_ids: List[int]) -> None:
+        for product_id in product_ids:
+            await product_service.get_product_payload(product_id)
+            metrics.inc("warmup_items_total", kind="product")
+            await asyncio.sleep(self.throttle)
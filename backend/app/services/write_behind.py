@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, select, update
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import async_session_factory
+from app.models.product import Product, ProductSearch
+from app.services.caches import invalidate_products
+from app.services.filter_store import filter_stores
+from app.services.search_projection import leased_units, reserved_units
+
+logger = logging.getLogger(__name__)
+
+# 允许走写合并队列的字段
+BATCHABLE_FIELDS = frozenset({"stock", "price"})
+
+
+_products = Product.__table__
+
+
+class ProductNotFoundError(LookupError):
+    """批量更新的目标产品不存在"""
+
+
+class StockBelowReservedError(ValueError):
+    """写入的库存少于已被预留（未确认的预留和进程额度）的件数"""
+
+    def __init__(self, product_id: int, stock: int, reserved: int):
+        super().__init__(f"产品 {product_id} 的库存 {stock} 少于已预留的 {reserved} 件")
+        self.product_id = product_id
+        self.stock = stock
+        self.reserved = reserved
+
+
+class WriteBehindQueue:
+    """
+    库存/价格写合并队列
+
+    同一产品在一个批次内的多次更新合并为一次（后到的值覆盖先到的值），
+    批次按固定间隔或达到批量上限时在一个事务中提交（组提交）。
+    每个调用方在所在批次提交成功后才得到确认。
+    待写入的更新按 (租户, 产品ID) 归并，产品不属于提交方租户时视为不存在。
+    写入的库存是现有的总件数，其中已被预留的部分不能再预留，products.stock 保存扣除预留后的件数。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any] = async_session_factory,
+        interval_ms: float = settings.WRITE_BATCH_INTERVAL_MS,
+        max_batch: int = settings.WRITE_BATCH_MAX_SIZE,
+        rate_window_seconds: float = 10.0,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self.rate_window = rate_window_seconds
+        self._pending: Dict[Tuple[str, int], Tuple[Dict[str, Any], List[asyncio.Future]]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._committed: Deque[Tuple[float, int]] = deque()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """启动后台刷写任务"""
+        if self.running:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务并刷写剩余更新"""
+        if self._task is None:
+            return
+        # 不取消任务，避免打断正在提交的批次
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        await self.flush()
+
+    async def submit(
+        self,
+        product_id: int,
+        changes: Dict[str, Any],
+        tenant_id: str = settings.DEFAULT_TENANT_ID
+    ) -> None:
+        """
+        提交一次更新并等待其所在批次提交
+
+        Raises:
+            ValueError: 包含不支持批量写入的字段或值为None
+            ProductNotFoundError: 产品不存在
+            StockBelowReservedError: 库存少于已预留的件数（合并到同一次写入的调用方得到同一个异常）
+        """
+        if not changes:
+            raise ValueError("更新内容不能为空")
+        unsupported = set(changes) - BATCHABLE_FIELDS
+        if unsupported:
+            raise ValueError(f"字段不支持批量更新: {sorted(unsupported)}")
+        if any(value is None for value in changes.values()):
+            # 库存和价格都不能为空，null 不能当作0件写入
+            raise ValueError(f"库存和价格不能为null: {sorted(k for k, v in changes.items() if v is None)}")
+        if not self.running:
+            raise RuntimeError("写合并队列未启动")
+
+        future = asyncio.get_running_loop().create_future()
+        key = (tenant_id, product_id)
+        if key in self._pending:
+            fields, waiters = self._pending[key]
+            fields.update(changes)
+            waiters.append(future)
+            metrics.inc("write_queue_coalesced_total")
+        else:
+            self._pending[key] = (dict(changes), [future])
+        metrics.inc("write_queue_submitted_total")
+
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        await future
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # 错误已传递给等待的调用方，这里只保证后台任务不退出
+                logger.error(f"写合并队列刷写失败: {str(e)}")
+
+    async def flush(self) -> None:
+        """把当前积压的更新作为一个批次提交"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        started = time.perf_counter()
+        try:
+            missing, rejected, available = await self._write_batch(batch)
+        except Exception as e:
+            for _, waiters in batch.values():
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            raise
+
+        for (tenant_id, product_id), (fields, _) in batch.items():
+            if (tenant_id, product_id) in missing or (tenant_id, product_id) in rejected:
+                continue
+            invalidate_products(tenant_id, [product_id])
+            store = filter_stores.for_update(tenant_id)
+            if store is not None:
+                store.update_fields(product_id, price=fields.get("price"), stock=available.get(product_id))
+        for key, (_, waiters) in batch.items():
+            for waiter in waiters:
+                if waiter.done():
+                    continue
+                if key in missing:
+                    waiter.set_exception(ProductNotFoundError(key[1]))
+                elif key in rejected:
+                    waiter.set_exception(rejected[key])
+                else:
+                    waiter.set_result(None)
+        if rejected:
+            metrics.inc("write_queue_rejected_total", len(rejected))
+        self._record(len(batch) - len(missing) - len(rejected), (time.perf_counter() - started) * 1000)
+
+    async def _write_batch(
+        self, batch: Dict[Tuple[str, int], Tuple[Dict[str, Any], List[asyncio.Future]]]
+    ) -> Tuple[set, Dict[Tuple[str, int], StockBelowReservedError], Dict[int, int]]:
+        """
+        在一个事务中写入产品表和搜索投影
+
+        库存写入为总件数减去未确认的预留和额度，预留件数在 UPDATE 中用关联子查询计算：
+        语句先取得写锁再读取预留，与预留的扣减和返还串行，不会在读取后被并发修改。
+        有货状态按库存加预留额度计算（额度中的件数不在 products.stock 中）。
+
+        Returns:
+            (不存在或不属于该租户的 (租户, 产品ID), 库存少于预留件数而被拒绝的 (租户, 产品ID) -> 异常,
+             修改了库存的产品ID -> 库存加额度)
+        """
+        applied = set()
+        price_rows = []
+        rejected: Dict[Tuple[str, int], StockBelowReservedError] = {}
+        available: Dict[int, int] = {}
+        async with self.session_factory() as db:
+            for (tenant_id, product_id), (fields, _) in batch.items():
+                if "stock" not in fields:
+                    price_rows.append({"b_id": product_id, "b_tenant": tenant_id, "b_price": fields["price"]})
+                    continue
+                total = fields["stock"]
+                reserved = reserved_units(_products.c.id)
+                result = await db.execute(
+                    update(_products)
+                    .where(_products.c.id == product_id, _products.c.tenant_id == tenant_id, reserved <= total)
+                    .values(stock=total - reserved, **{key: value for key, value in fields.items() if key != "stock"})
+                )
+                if result.rowcount:
+                    applied.add((tenant_id, product_id))
+            if price_rows:
+                await db.execute(
+                    update(_products)
+                    .where(_products.c.id == bindparam("b_id"), _products.c.tenant_id == bindparam("b_tenant"))
+                    .values(price=bindparam("b_price")),
+                    price_rows
+                )
+
+            result = await db.execute(
+                select(_products.c.tenant_id, _products.c.id).where(_products.c.id.in_([key[1] for key in batch]))
+            )
+            existing = set(map(tuple, result.all()))
+            for key, (fields, _) in batch.items():
+                if "stock" in fields and key in existing and key not in applied:
+                    reserved = (await db.execute(select(reserved_units(key[1])))).scalar_one()
+                    rejected[key] = StockBelowReservedError(key[1], fields["stock"], reserved)
+            written = [key for key in batch if key in existing and key not in rejected]
+
+            stock_ids = [product_id for tenant_id, product_id in written if "stock" in batch[(tenant_id, product_id)][0]]
+            if stock_ids:
+                result = await db.execute(
+                    select(Product.id, func.coalesce(Product.stock, 0) + leased_units(Product.id))
+                    .where(Product.id.in_(stock_ids))
+                )
+                available = dict(result.all())
+            if written:
+                projection_rows = [self._projection_row(key[1], batch[key][0], available) for key in written]
+                await db.execute(update(ProductSearch), projection_rows)
+            await db.commit()
+        return set(batch) - existing, rejected, available
+
+    def _projection_row(self, product_id: int, fields: Dict[str, Any], available: Dict[int, int]) -> Dict[str, Any]:
+        projection = {"id": product_id}
+        if "price" in fields:
+            projection["price"] = fields["price"]
+        if "stock" in fields:
+            projection["in_stock"] = available.get(product_id, 0) > 0
+        return projection
+
+    def _record(self, committed: int, flush_ms: float) -> None:
+        """记录批次大小、刷写耗时和近期每秒提交的更新数"""
+        now = time.monotonic()
+        self._committed.append((now, committed))
+        while self._committed and now - self._committed[0][0] > self.rate_window:
+            self._committed.popleft()
+        metrics.inc("write_queue_committed_total", committed)
+        metrics.observe("write_queue_batch_size", committed)
+        metrics.observe("write_queue_flush_ms", flush_ms)
+        metrics.set_gauge(
+            "write_queue_updates_per_second",
+            sum(count for _, count in self._committed) / self.rate_window
+        )
+
+
+# 全局写合并队列，随应用启动和关闭
+write_queue = WriteBehindQueue()
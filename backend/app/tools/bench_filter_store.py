@@ -0,0 +1,108 @@
+"""
+列式筛选存储的内存与延迟基准
+
+用法:
+    python -m app.tools.bench_filter_store [--rows N] [--categories C] [--repeat R] [--unordered-created]
+
+在内存中按加载路径（分批追加）构造 N 行产品，不访问数据库，
+输出 memory_usage() 的结果以及典型筛选条件下 page() 的 p50/p99 延迟。
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def build_store(rows: int, categories: int, unordered_created: bool, batch_size: int = 50000) -> Any:
+    """按ID升序分批追加行，与 ColumnarFilterStore.load 的写入方式相同"""
+    from app.services.filter_store import ColumnarFilterStore
+
+    rng = random.Random(0)
+    store = ColumnarFilterStore()
+    base = datetime(2024, 1, 1)
+    for start in range(0, rows, batch_size):
+        batch = []
+        for product_id in range(start + 1, min(rows, start + batch_size) + 1):
+            seconds = rng.randint(0, rows) if unordered_created else product_id
+            batch.append((
+                product_id,
+                round(rng.uniform(1, 10000), 2),
+                0 if rng.random() < 0.2 else rng.randint(1, 500),
+                rng.randint(1, categories),
+                base + timedelta(seconds=seconds),
+            ))
+        store._append_rows(batch)
+    for category_id in range(1, categories + 1):
+        store.add_category(category_id, f"类别{category_id}")
+    store.loaded = True
+    return store
+
+
+def _measure(call: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    # 首次调用会构建类别索引或创建时间排序，单独计时
+    started = time.perf_counter()
+    call()
+    first = (time.perf_counter() - started) * 1000
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {"first_ms": first, "p50_ms": _percentile(latencies, 50), "p99_ms": _percentile(latencies, 99)}
+
+
+def run_benchmark(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    store = build_store(args.rows, args.categories, args.unordered_created)
+    build_seconds = time.perf_counter() - started
+
+    usage = store.memory_usage()
+    print(f"{usage['products']} 行，构造耗时 {build_seconds:.1f}s，创建时间有序: {store._created_sorted}")
+    print(
+        f"内存: {usage['bytes'] / 1024 / 1024:.1f} MiB（按已分配容量），"
+        f"每行 {usage['row_bytes']} 字节，每个产品 {usage['bytes_per_product']:.1f} 字节"
+    )
+
+    cases = [
+        ("默认排序 第1页", dict()),
+        ("默认排序 第500页", dict(offset=500 * 20)),
+        ("价格区间", dict(min_price=100, max_price=500)),
+        ("价格区间 价格升序", dict(min_price=100, max_price=500, sort="pa")),
+        ("价格降序 全部", dict(sort="pd")),
+        ("有货", dict(in_stock=True)),
+        ("单个类别", dict(category_ids=[1])),
+        ("单个类别 价格升序", dict(category_ids=[1], min_price=100, max_price=5000, sort="pa")),
+        ("三个类别 有货", dict(category_ids=[1, 2, 3], in_stock=True)),
+    ]
+    print(f"\npage() 延迟（重复 {args.repeat} 次，每页20条）:")
+    for label, kwargs in cases:
+        result = _measure(lambda: store.page(limit=20, **kwargs), args.repeat)
+        _, total = store.page(limit=20, **kwargs)
+        print(
+            f"  {label:<14} 命中 {total:>8}  首次 {result['first_ms']:>8.2f}ms  "
+            f"p50 {result['p50_ms']:>7.2f}ms  p99 {result['p99_ms']:>7.2f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="列式筛选存储的内存与延迟基准")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="产品行数")
+    parser.add_argument("--categories", type=int, default=200, help="类别数")
+    parser.add_argument("--repeat", type=int, default=50, help="每个筛选条件的重复次数")
+    parser.add_argument("--unordered-created", action="store_true", help="创建时间与ID顺序不一致")
+    args = parser.parse_args()
+
+    # 只导入存储模块，不连接数据库
+    os.environ.setdefault("OPENAI_API_KEY", "")
+    run_benchmark(args)
+
+
+if __name__ == "__main__":
+    main()
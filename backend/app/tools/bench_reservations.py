@@ -0,0 +1,151 @@
+"""
+库存预留吞吐基准
+
+用法:
+    python -m app.tools.bench_reservations [--clients C] [--reservations K] [--lease-size N]
+
+在临时SQLite数据库上，C 个并发客户端各对同一个热门产品预留 K 次（每次1件），
+分别测量三种方式的每秒预留数与延迟:
+    逐条提交   每次预留单独一个事务：条件扣减产品库存并写入预留行，不经过 InventoryService
+    条件扣减   InventoryService 组提交，产品不视为热门，每个批次对产品行做条件扣减
+    额度分配   InventoryService 组提交，产品立即视为热门，预留只扣减进程内额度，额度用完才扣减产品行
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def _reserve_directly(product_id: int) -> None:
+    """不经过组提交的基线：一次预留一个事务"""
+    from sqlalchemy import insert, update
+
+    from app.db.database import async_session_factory
+    from app.models.inventory import RESERVATION_HELD, InventoryReservation
+    from app.models.product import Product
+    from app.services.inventory import InsufficientStockError
+
+    async with async_session_factory() as db:
+        result = await db.execute(
+            update(Product)
+            .where(Product.id == product_id, Product.stock >= 1)
+            .values(stock=Product.stock - 1)
+        )
+        if result.rowcount == 0:
+            await db.rollback()
+            raise InsufficientStockError(product_id, 1, 0)
+        await db.execute(insert(InventoryReservation).values(
+            id=uuid.uuid4().hex,
+            tenant_id="default",
+            product_id=product_id,
+            quantity=1,
+            status=RESERVATION_HELD,
+            expires_at=datetime.now(timezone.utc) + timedelta(minutes=15),
+        ))
+        await db.commit()
+
+
+async def _measure(args: argparse.Namespace, mode: str, product_id: int) -> Dict[str, Any]:
+    from app.core.metrics import metrics
+    from app.services.inventory import InventoryService
+
+    service = None
+    if mode != "direct":
+        # 热门阈值为0时第一次预留即改为额度分配，无穷大时始终直接扣减产品行
+        service = InventoryService(
+            hot_threshold=0 if mode == "leased" else float("inf"),
+            lease_size=args.lease_size,
+        )
+        await service.start()
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def client() -> None:
+        for _ in range(args.reservations):
+            started = time.perf_counter()
+            try:
+                if service is None:
+                    await _reserve_directly(product_id)
+                else:
+                    await service.reserve(product_id, 1)
+            except Exception as e:
+                # 逐条提交时写锁竞争激烈，等待超过忙等待超时的预留失败
+                errors.append(type(e).__name__)
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    batches_before = metrics.snapshot()["summaries"].get("inventory_batch_size", {}).get("count", 0)
+    refills_before = metrics.get_counter("inventory_lease_refills_total")
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(args.clients)))
+        elapsed = time.perf_counter() - started
+    finally:
+        if service is not None:
+            await service.stop()
+    batches = metrics.snapshot()["summaries"].get("inventory_batch_size", {}).get("count", 0) - batches_before
+    return {
+        "reservations": len(latencies),
+        "per_second": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 50),
+        "p99_ms": _percentile(latencies, 99),
+        "failed": len(errors),
+        "batches": batches,
+        "refills": metrics.get_counter("inventory_lease_refills_total") - refills_before,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    from app.db.database import Base, async_session_factory, engine
+    from app.models import inventory, product  # noqa: F401  注册所有表
+    from app.services.product_service import ProductService
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    total = args.clients * args.reservations
+    print(f"{args.clients} 个客户端 x {args.reservations} 次预留（同一产品），额度块 {args.lease_size} 件")
+    modes = (("逐条提交", "direct"), ("条件扣减", "batched"), ("额度分配", "leased"))
+    for index, (label, mode) in enumerate(modes):
+        # 每种方式使用新产品，库存足够全部预留成功
+        async with async_session_factory() as db:
+            created = await ProductService(db).create_product_from_dict({
+                "name": f"热门产品 {index}", "category": "耳机", "price": 100,
+                "stock": total + args.lease_size, "sku": f"BENCH-HOT-{index}",
+            })
+        result = await _measure(args, mode, created.id)
+        print(
+            f"  {label:<6} {result['per_second']:>9.0f} 次/秒  "
+            f"p50 {result['p50_ms']:>7.2f}ms  p99 {result['p99_ms']:>7.2f}ms  "
+            f"成功 {result['reservations']} 次, 失败 {result['failed']} 次, "
+            f"批次 {result['batches']:.0f}, 额度补充 {result['refills']:.0f} 次"
+        )
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="库存预留吞吐基准")
+    parser.add_argument("--clients", type=int, default=100, help="并发客户端数")
+    parser.add_argument("--reservations", type=int, default=50, help="每个客户端的预留次数")
+    parser.add_argument("--lease-size", type=int, default=100, help="额度分配每次从库存扣下的件数")
+    args = parser.parse_args()
+
+    # 应用模块在导入时读取配置，必须先指定临时数据库，基准不会改动正式数据库
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='bench-reservations-')}/bench.db"
+    os.environ.setdefault("OPENAI_API_KEY", "")
+    # 不输出每条SQL，日志会主导耗时
+    os.environ["DEBUG"] = "false"
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
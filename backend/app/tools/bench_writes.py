@@ -0,0 +1,121 @@
+"""
+库存/价格写入吞吐基准
+
+用法:
+    python -m app.tools.bench_writes [--products N] [--clients C] [--updates K]
+
+在临时SQLite数据库上，用 C 个并发客户端各发出 K 次库存/价格更新（经 ProductService.update_product），
+分别测量写合并队列关闭（每次更新单独提交）和开启（组提交）时的每秒更新数与延迟，
+以及不经过请求路径、直接提交到写合并队列的吞吐。
+
+请求路径上每次更新还要读取产品，并发受连接池大小限制；仅写合并队列一项反映组提交本身的上限。
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def _measure(args: argparse.Namespace, mode: str) -> Dict[str, Any]:
+    """
+    Args:
+        mode: direct 写合并队列关闭，每次更新单独提交；batched 写合并队列开启；
+            queue_only 直接调用 write_queue.submit，不经过请求路径上读取产品的查询（不占用连接池）
+    """
+    from app.db.database import async_session_factory
+    from app.schemas.product import ProductUpdate
+    from app.services.product_service import ProductService
+    from app.services.write_behind import write_queue
+
+    rng = random.Random(0)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def client() -> None:
+        async with async_session_factory() as db:
+            service = ProductService(db)
+            for _ in range(args.updates):
+                product_id = rng.randint(1, args.products)
+                if rng.random() < 0.5:
+                    update = ProductUpdate(stock=rng.randint(0, 100))
+                else:
+                    update = ProductUpdate(price=round(rng.uniform(10, 1000), 2))
+                started = time.perf_counter()
+                try:
+                    if mode == "queue_only":
+                        await write_queue.submit(product_id, update.model_dump(exclude_unset=True))
+                    else:
+                        await service.update_product(product_id, update)
+                except Exception as e:
+                    # 逐条提交时写锁竞争激烈，等待超过忙等待超时的更新失败
+                    errors.append(type(e).__name__)
+                    await db.rollback()
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    if mode != "direct":
+        await write_queue.start()
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(args.clients)))
+        elapsed = time.perf_counter() - started
+    finally:
+        if mode != "direct":
+            await write_queue.stop()
+    return {
+        "updates": len(latencies),
+        "per_second": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 50),
+        "p99_ms": _percentile(latencies, 99),
+        "failed": len(errors),
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    from app.db.database import Base, async_session_factory, engine
+    from app.models import inventory, product  # noqa: F401  注册所有表
+    from app.services.product_service import ProductService
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session_factory() as db:
+        service = ProductService(db)
+        for i in range(args.products):
+            await service.create_product_from_dict({
+                "name": f"基准产品 {i}", "category": "耳机", "price": 100, "stock": 10, "sku": f"BENCH-{i}",
+            })
+
+    print(f"{args.clients} 个客户端 x {args.updates} 次更新, {args.products} 个产品")
+    for label, mode in (("逐条提交", "direct"), ("写合并队列", "batched"), ("仅写合并队列", "queue_only")):
+        result = await _measure(args, mode)
+        print(
+            f"  {label:<8} {result['per_second']:>9.0f} 次/秒  "
+            f"p50 {result['p50_ms']:>7.2f}ms  p99 {result['p99_ms']:>7.2f}ms  "
+            f"成功 {result['updates']} 次, 失败 {result['failed']} 次"
+        )
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="库存/价格写入吞吐基准")
+    parser.add_argument("--products", type=int, default=200, help="产品数")
+    parser.add_argument("--clients", type=int, default=20, help="并发客户端数")
+    parser.add_argument("--updates", type=int, default=50, help="每个客户端的更新次数")
+    args = parser.parse_args()
+
+    # 应用模块在导入时读取配置，必须先指定临时数据库，基准不会改动正式数据库
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='bench-writes-')}/bench.db"
+    os.environ.setdefault("OPENAI_API_KEY", "")
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+查询日志离线分析
+
+用法:
+    python -m app.tools.query_report [--log-dir DIR] [--top N] [--slow-ms MS] [--emit-warmup FILE]
+
+输出头部查询分布、零结果查询和慢意图，并可生成意图/结果缓存的预热查询列表。
+"""
+import argparse
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+from app.core.config import settings
+from app.services.query_log import read_query_logs
+
+
+# 统计为搜索的端点；点击、联想等记录只计入按端点的分布
+SEARCH_ENDPOINTS = ("natural", "search")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def analyze(records: Iterable[Dict[str, Any]], top: int = 20, slow_ms: float = 500) -> Dict[str, Any]:
+    """
+    汇总查询日志
+
+    Returns:
+        包含总数、头部查询、零结果查询和慢意图的报告
+    """
+    total = 0
+    by_endpoint: Counter = Counter()
+    queries: Counter = Counter()
+    zero_results: Counter = Counter()
+    intent_latency: Dict[str, List[float]] = defaultdict(list)
+
+    for record in records:
+        total += 1
+        by_endpoint[record.get("endpoint")] += 1
+        if record.get("endpoint") not in SEARCH_ENDPOINTS:
+            continue
+        query = record.get("query") or ""
+        queries[query] += 1
+        if record.get("results") == 0:
+            zero_results[query] += 1
+        latency = (record.get("latency") or {}).get("total")
+        if record.get("intent") and latency is not None:
+            intent_latency[record["intent"]].append(latency)
+
+    head = []
+    cumulative = 0
+    query_total = sum(queries.values())
+    for query, count in queries.most_common(top):
+        cumulative += count
+        head.append({
+            "query": query,
+            "count": count,
+            "share": count / query_total,
+            "cumulative_share": cumulative / query_total,
+        })
+
+    slow_intents = []
+    for intent, latencies in intent_latency.items():
+        p95 = _percentile(latencies, 95)
+        if p95 >= slow_ms:
+            slow_intents.append({
+                "intent": intent,
+                "count": len(latencies),
+                "p50_ms": _percentile(latencies, 50),
+                "p95_ms": p95,
+            })
+    slow_intents.sort(key=lambda item: (item["p95_ms"], item["count"]), reverse=True)
+
+    return {
+        "total": total,
+        "distinct_queries": len(queries),
+        "by_endpoint": dict(by_endpoint),
+        "head_queries": head,
+        "zero_result_queries": [{"query": q, "count": c} for q, c in zero_results.most_common(top)],
+        "slow_intents": slow_intents[:top],
+    }
+
+
+def warmup_queries(records: Iterable[Dict[str, Any]], top: int = 100) -> List[str]:
+    """按频次取有结果的自然语言查询，作为缓存预热列表"""
+    counts: Counter = Counter(
+        record["query"]
+        for record in records
+        if record.get("endpoint") == "natural" and record.get("query") and record.get("results")
+    )
+    return [query for query, _ in counts.most_common(top)]
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"查询总数: {report['total']}  不同查询数: {report['distinct_queries']}")
+    print(f"按端点: {report['by_endpoint']}")
+
+    print("\n头部查询:")
+    for item in report["head_queries"]:
+        print(f"  {item['count']:>8}  {item['share']:6.1%}  累计 {item['cumulative_share']:6.1%}  {item['query']}")
+
+    print("\n零结果查询:")
+    for item in report["zero_result_queries"]:
+        print(f"  {item['count']:>8}  {item['query']}")
+
+    print("\n慢意图:")
+    for item in report["slow_intents"]:
+        print(f"  p95 {item['p95_ms']:>8.1f}ms  p50 {item['p50_ms']:>8.1f}ms  {item['count']:>6}次  {item['intent']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="查询日志离线分析")
+    parser.add_argument("--log-dir", type=Path, default=settings.QUERY_LOG_DIR, help="查询日志目录")
+    parser.add_argument("--top", type=int, default=20, help="每项报告列出的条数")
+    parser.add_argument("--slow-ms", type=float, default=500, help="慢意图的p95耗时阈值")
+    parser.add_argument("--emit-warmup", type=Path, default=None, help="把预热查询列表写入该文件")
+    parser.add_argument("--warmup-size", type=int, default=100, help="预热查询数量")
+    args = parser.parse_args()
+
+    records = list(read_query_logs(args.log_dir))
+    print_report(analyze(records, top=args.top, slow_ms=args.slow_ms))
+
+    if args.emit_warmup:
+        queries = warmup_queries(records, top=args.warmup_size)
+        args.emit_warmup.write_text("".join(q + "\n" for q in queries), encoding="utf-8")
+        print(f"\n已写入 {len(queries)} 条预热查询: {args.emit_warmup}")
+
+
+if __name__ == "__main__":
+    main()
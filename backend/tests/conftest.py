@@ -0,0 +1,44 @@
+import asyncio
+import os
+import tempfile
+
+# 测试使用独立的临时数据库，必须在导入应用模块（读取配置）之前设置
+_test_dir = tempfile.mkdtemp(prefix="ecommerce-test-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_test_dir}/test.db")
+os.environ.setdefault("OPENAI_API_KEY", "")
+os.environ.setdefault("DEBUG", "false")
+
+import pytest
+
+from app.db.database import Base, engine
+from app.models import inventory, product  # noqa: F401  注册所有表
+from app.services import search_projection
+from app.services.caches import featured_cache, product_detail_cache, search_result_cache
+from app.services.filter_store import filter_stores
+
+
+@pytest.fixture
+def run():
+    """在新的事件循环中运行协程，结束后关闭连接池（连接不能跨事件循环复用）"""
+    def runner(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    return runner
+
+
+@pytest.fixture
+def database(run):
+    """每个测试使用空表，并清空进程内的缓存和筛选存储"""
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+    run(reset())
+    search_projection._category_ids.clear()
+    for cache in (search_result_cache, product_detail_cache, featured_cache):
+        cache.clear()
+    filter_stores.clear()
@@ -0,0 +1,46 @@
+import asyncio
+
+from app.core.admission import AdmissionMiddleware, RateLimiter
+
+
+async def _app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def _request(middleware, path, api_key=None, ip="10.0.0.1"):
+    headers = [(b"x-api-key", api_key.encode())] if api_key else []
+    scope = {"type": "http", "method": "GET", "path": path, "headers": headers, "client": (ip, 1234)}
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    asyncio.run(middleware(scope, None, send))
+    return statuses[0]
+
+
+def _middleware():
+    # 不补充令牌，每个客户端只有两次请求
+    return AdmissionMiddleware(
+        _app, rate_limiter=RateLimiter(rate=0, burst=2), api_keys={"issued"}, exempt_paths=["/health", "/media"]
+    )
+
+
+def test_unknown_api_keys_share_the_ip_bucket():
+    middleware = _middleware()
+    statuses = [_request(middleware, "/api/v1/products", api_key=f"forged-{i}") for i in range(3)]
+    assert statuses == [200, 200, 429]
+    # 已签发的密钥有独立的令牌桶
+    assert _request(middleware, "/api/v1/products", api_key="issued") == 200
+
+
+def test_health_and_media_are_exempt():
+    middleware = _middleware()
+    for _ in range(2):
+        _request(middleware, "/api/v1/products")
+    assert _request(middleware, "/api/v1/products") == 429
+    assert _request(middleware, "/health/live") == 200
+    assert _request(middleware, "/media/ab/cd.jpg") == 200
+    assert _request(middleware, "/mediafoo") == 429
@@ -0,0 +1,232 @@
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.db.database import async_session_factory
+from app.models.product import Product, ProductSearch
+from app.schemas.intent import SearchIntent
+from app.services import filter_store as filter_store_module
+from app.services.filter_store import COLUMNS, ColumnarFilterStore, TenantFilterStores, filter_stores
+from app.services.product_service import ProductService
+
+CATEGORIES = ["耳机", "手机", "蓝牙耳机"]
+
+# 价格、类别和排序的组合，覆盖并列价格、包含匹配多个类别和空结果
+INTENTS = [
+    SearchIntent(),
+    SearchIntent(sort="pa"),
+    SearchIntent(sort="pd"),
+    SearchIntent(min_price=150, max_price=300),
+    SearchIntent(min_price=150, max_price=300, sort="pa"),
+    SearchIntent(max_price=200, sort="pd"),
+    SearchIntent(category="耳机"),
+    SearchIntent(category="耳机", sort="pa"),
+    SearchIntent(category="手机", min_price=200, sort="pd"),
+    SearchIntent(category="蓝牙耳机", max_price=250),
+    SearchIntent(min_price=5000),
+    SearchIntent(category="不存在的类别"),
+]
+
+
+async def _seed(db, count=40):
+    service = ProductService(db)
+    for i in range(count):
+        await service.create_product_from_dict({
+            "name": f"测试产品 {i}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            # 价格重复出现，检验并列时按ID排序
+            "price": 100 + (i % 7) * 50,
+            "stock": 0 if i % 4 == 0 else i,
+            "sku": f"SKU-{i}",
+        })
+
+
+async def _all_pages(fetch, limit=6):
+    """逐页取出全部结果，直到最后一页之后的空页"""
+    pages = []
+    page = 1
+    while True:
+        response = await fetch(page, limit)
+        pages.append(([item["id"] for item in response["items"]], response["total"]))
+        if not response["items"]:
+            return pages
+        page += 1
+
+
+async def _assert_search_parity(db):
+    service = ProductService(db)
+    store = await filter_stores.get("default")
+    for intent in INTENTS:
+        expected = await _all_pages(lambda page, limit: service._search_projection(intent, page, limit))
+        actual = await _all_pages(lambda page, limit: service._search_filter_store(store, intent, page, limit))
+        assert actual == expected, intent
+
+
+async def _assert_listing_parity(db, monkeypatch):
+    """产品列表的类别精确匹配和有货筛选与搜索投影一致"""
+    service = ProductService(db)
+    for category in (None, "耳机", "手机", "不存在的类别"):
+        for in_stock in (None, True, False):
+            for skip in (0, 5, 12):
+                monkeypatch.setattr(settings, "FILTER_STORE_ENABLED", True)
+                actual = await service.get_products(skip=skip, limit=7, category=category, in_stock=in_stock)
+                monkeypatch.setattr(settings, "FILTER_STORE_ENABLED", False)
+                expected = await service.get_products(skip=skip, limit=7, category=category, in_stock=in_stock)
+                assert [p.id for p in actual] == [p.id for p in expected], (category, in_stock, skip)
+
+
+def test_store_pages_match_projection_query(database, run, monkeypatch):
+    # 缩小分块，让默认排序的倒序扫描跨越多个分块
+    monkeypatch.setattr(filter_store_module, "_SCAN_CHUNK", 4)
+
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db)
+            await _assert_search_parity(db)
+            await _assert_listing_parity(db, monkeypatch)
+
+    run(scenario())
+
+
+def test_store_pages_match_after_deletes(database, run, monkeypatch):
+    monkeypatch.setattr(filter_store_module, "_SCAN_CHUNK", 4)
+
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db)
+            store = await filter_stores.get("default")
+            service = ProductService(db)
+            for product_id in (1, 2, 7, 20, 40):
+                await service.delete_product(product_id)
+            # 删除只打标记，死行仍在数组中
+            assert (store._size, len(store)) == (40, 35)
+            await _assert_search_parity(db)
+            await _assert_listing_parity(db, monkeypatch)
+            store._compact()
+            assert store._size == 35
+            await _assert_search_parity(db)
+
+    run(scenario())
+
+
+def test_store_pages_match_with_unordered_created_times(database, run, monkeypatch):
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db)
+            # 创建时间与ID顺序不一致，并带有并列值
+            base = datetime(2024, 1, 1)
+            for product_id in range(1, 41):
+                created = base + timedelta(minutes=(product_id * 17) % 11)
+                await db.execute(update(Product).where(Product.id == product_id).values(created_at=created))
+                await db.execute(
+                    update(ProductSearch).where(ProductSearch.id == product_id).values(created_at=created)
+                )
+            await db.commit()
+            store = await filter_stores.get("default")
+            assert not store._created_sorted
+            await _assert_search_parity(db)
+            await _assert_listing_parity(db, monkeypatch)
+
+    run(scenario())
+
+
+def test_empty_store(database, run):
+    async def scenario():
+        async with async_session_factory() as db:
+            store = await filter_stores.get("default")
+            service = ProductService(db)
+            response = await service._search_filter_store(store, SearchIntent(sort="pa"), 1, 20)
+            return store, response
+
+    store, response = run(scenario())
+    assert len(store) == 0
+    assert store.page() == ([], 0)
+    assert store.page(category_ids=[1], sort="pd") == ([], 0)
+    assert (response["items"], response["total"]) == ([], 0)
+    assert store.memory_usage()["bytes_per_product"] == 0.0
+
+
+def test_in_memory_edits_keep_pages_consistent():
+    store = ColumnarFilterStore(initial_capacity=2)
+    created = datetime(2024, 1, 1)
+    for product_id in (5, 3, 9, 1):
+        store.upsert(product_id, float(product_id * 10), product_id % 2, 1, created + timedelta(seconds=product_id))
+    assert store._col("id").tolist() == [1, 3, 5, 9]
+    assert store.page() == ([9, 5, 3, 1], 4)
+    assert store.page(sort="pa", offset=3, limit=5) == ([9], 4)
+    store.update_fields(3, price=1000.0, stock=0)
+    assert store.page(sort="pd", limit=1) == ([3], 4)
+    assert store.page(in_stock=True) == ([9, 5, 1], 3)
+    store.remove(9)
+    store.remove(9)
+    assert store.page() == ([5, 3, 1], 3)
+    # 删除后重新写入同一ID
+    store.upsert(9, 1.0, 1, 2, created)
+    assert store.page(category_ids=[2]) == ([9], 1)
+    assert store.page(sort="pa", limit=2) == ([9, 1], 4)
+
+
+def test_tenants_are_evicted_by_bytes(database, run):
+    store_bytes = ColumnarFilterStore().nbytes
+    assert store_bytes == 1024 * sum(np.dtype(dtype).itemsize for dtype in COLUMNS.values())
+    stores = TenantFilterStores(max_bytes=int(store_bytes * 2.5))
+
+    async def scenario():
+        a = await stores.get("a")
+        await stores.get("b")
+        # 访问a后b成为最久未访问的租户
+        assert await stores.get("a") is a
+        await stores.get("c")
+        evicted = list(stores._stores)
+        stores.for_update("a")
+        await stores.get("b")
+        return evicted, list(stores._stores)
+
+    evicted, reloaded = run(scenario())
+    assert evicted == ["a", "c"]
+    assert reloaded == ["c", "b"]
+    # 被淘汰租户的变更计数一并丢弃
+    assert "a" not in stores._versions
+
+
+def test_load_retries_when_tenant_changes_during_load(database, run):
+    calls = []
+
+    @asynccontextmanager
+    async def session_factory():
+        async with async_session_factory() as db:
+            yield db
+        calls.append(1)
+        if len(calls) == 1:
+            # 第一次加载读完之后、放入存储之前有新产品写入
+            async with async_session_factory() as db:
+                await ProductService(db).create_product_from_dict({
+                    "name": "加载期间写入", "category": "耳机", "price": 10, "stock": 1, "sku": "LATE",
+                })
+            assert stores.for_update("default") is None
+
+    stores = TenantFilterStores(session_factory=session_factory)
+
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db, count=3)
+        return await stores.get("default")
+
+    store = run(scenario())
+    assert len(calls) == 2
+    assert len(store) == 4
+    assert store.page(limit=1) == ([4], 4)
+
+
+@pytest.mark.parametrize("sort", [None, "pa", "pd"])
+def test_page_beyond_last_page_reports_total(sort):
+    store = ColumnarFilterStore()
+    for product_id in range(1, 6):
+        store.upsert(product_id, 10.0, 1, 1, datetime(2024, 1, 1))
+    assert store.page(sort=sort, offset=4, limit=3) == ([5] if sort == "pa" else [1], 5)
+    assert store.page(sort=sort, offset=5, limit=3) == ([], 5)
+    assert store.page(category_ids=[1], sort=sort, offset=10) == ([], 5)
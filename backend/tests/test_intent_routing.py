@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.ai_service import AIService
+from app.services.intent_router import CircuitBreaker, ModelRouter
+from app.services.query_normalizer import QueryNormalizer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))])
+
+
+class StubCompletions:
+    """离线的流式补全桩：按片段返回预设文本，可模拟失败或阻塞"""
+
+    def __init__(self, fragments=(), error=None, gate=None, stream=None):
+        self.fragments = fragments
+        self.error = error
+        self.gate = gate
+        self.stream = stream
+        self.calls = []
+        self.called = threading.Event()
+
+    def create(self, stream=False, **request):
+        self.calls.append(request)
+        self.called.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        if self.stream is not None:
+            return self.stream
+        return iter([_chunk(fragment) for fragment in self.fragments])
+
+
+class BlockingStream:
+    """模拟慢模型：输出第一个片段后阻塞在读取上，直到连接被关闭"""
+
+    def __init__(self):
+        self.closed = threading.Event()
+        self.response = SimpleNamespace(close=self.closed.set)
+        self.finished = threading.Event()
+
+    def __iter__(self):
+        try:
+            yield _chunk('{"t":null,')
+            if not self.closed.wait(5):
+                return
+            raise ConnectionError("连接已关闭")
+        finally:
+            self.finished.set()
+
+
+def make_service(clock=None, **stub):
+    completions = StubCompletions(**stub)
+    router = ModelRouter(
+        ["main"],
+        {"main": 100},
+        failure_threshold=1,
+        recovery_timeout=10,
+        clock=clock or FakeClock(),
+    )
+    service = AIService(
+        client=SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+        router=router,
+        normalizer=QueryNormalizer(),
+    )
+    return service, completions, router.breakers["main"]
+
+
+def test_confident_rule_parse_skips_llm():
+    service, completions, _ = make_service(fragments=['{"t":"手机","p":null}'])
+    intent = asyncio.run(service.parse_search_intent("3000元以下的华为手机"))
+    assert completions.calls == []
+    assert intent.category == "手机"
+    assert intent.brands == ("华为",)
+    assert intent.max_price == 3000
+
+
+def test_uncovered_chinese_query_goes_to_llm():
+    # 不带空格的中文查询里只有“耳机”能被规则识别，不能因为识别出类目就跳过LLM
+    fragments = ['{"t":"耳机",', '"p":null,"s":null,', '"b":[],"k":["跑步","运动"]}']
+    service, completions, _ = make_service(fragments=fragments)
+    core = []
+    intent = asyncio.run(service.parse_search_intent("适合跑步的耳机", on_core_ready=core.append))
+    assert len(completions.calls) == 1
+    assert intent.category == "耳机"
+    assert intent.keywords == ("跑步", "运动")
+    assert [c.category for c in core] == ["耳机"]
+    assert core[0].keywords == ()
+
+
+def test_rule_confidence_scores_query_coverage():
+    service, _, _ = make_service()
+    for query in ("华为手机", "3000元以下的华为手机", "想要一个相机 500元以下"):
+        assert service._rule_confidence(query, service._mock_intent_data(query)) == 1.0
+    for query in ("适合跑步的耳机", "轻薄笔记本", "给我老婆买个生日礼物"):
+        assert service._rule_confidence(query, service._mock_intent_data(query)) < 0.75
+
+
+def test_llm_error_falls_back_and_opens_breaker():
+    service, completions, breaker = make_service(error=RuntimeError("boom"))
+    intent = asyncio.run(service.parse_search_intent("适合跑步的耳机"))
+    assert intent.category == "耳机"
+    assert breaker.state == CircuitBreaker.OPEN
+    # 熔断期间不再调用模型
+    asyncio.run(service.parse_search_intent("适合跑步的耳机"))
+    assert len(completions.calls) == 1
+
+
+def test_cancelled_probe_releases_half_open_slot():
+    clock = FakeClock()
+    gate = threading.Event()
+    service, completions, breaker = make_service(clock=clock, gate=gate, fragments=['{"t":null,"p":null}'])
+    breaker.record_failure()
+    clock.now += 11
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    async def cancel_probe():
+        task = asyncio.create_task(service.parse_search_intent("给我老婆买个生日礼物"))
+        while not completions.called.is_set():
+            await asyncio.sleep(0.001)
+        task.cancel()
+        try:
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        finally:
+            gate.set()
+
+    asyncio.run(cancel_probe())
+    # 被取消的探测不占用名额，下一次调用仍可作为探测放行
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_timeout_counts_as_failure():
+    gate = threading.Event()
+    service, _, breaker = make_service(gate=gate, fragments=['{"t":null,"p":null}'])
+    try:
+        intent = asyncio.run(service.parse_search_intent("适合跑步的耳机", latency_budget_ms=200))
+    finally:
+        gate.set()
+    assert intent.category == "耳机"
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_timeout_closes_stream_and_frees_worker():
+    stream = BlockingStream()
+    service, _, breaker = make_service(stream=stream)
+    started = time.perf_counter()
+    intent = asyncio.run(service.parse_search_intent("适合跑步的耳机", latency_budget_ms=200))
+    # 超时后连接被关闭，消费线程随即结束，不会阻塞到模型输出结束
+    assert stream.closed.is_set()
+    assert stream.finished.wait(1)
+    assert time.perf_counter() - started < 1
+    assert intent.category == "耳机"
+    assert breaker.state == CircuitBreaker.OPEN
@@ -0,0 +1,213 @@
+import asyncio
+import io
+import socket
+import struct
+
+import httpx
+import pytest
+from PIL import Image
+
+from app.db.database import async_session_factory
+from app.models.product import MEDIA_READY, ProductMedia
+from app.services import media
+from app.services.media import MediaError, MediaPipeline, PinnedAddressTransport, sniff_image
+from app.services.product_service import ProductService
+
+# 1x1 的PNG文件头，足够识别格式和尺寸
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00\x00\x00\rIHDR" + struct.pack(">II", 1, 1) + b"\x08\x02\x00\x00\x00"
+
+
+
+def _image(size, mode, format):
+    output = io.BytesIO()
+    Image.new(mode, size, color=(200, 30, 30, 128)[:len(mode)]).save(output, format=format)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("mode, format, thumbnail_suffix", [
+    ("RGB", "JPEG", ".jpg"),
+    ("RGBA", "PNG", ".png"),
+])
+def test_wide_images_get_a_separate_thumbnail(tmp_path, mode, format, thumbnail_suffix):
+    data = _image((1000, 400), mode, format)
+    pipeline = MediaPipeline(media_dir=tmp_path, base_url="/media", thumbnail_size=320)
+    stored = pipeline._store("default", data)
+
+    assert (stored["width"], stored["height"]) == (1000, 400)
+    assert stored["thumbnail_url"] != stored["image_url"]
+    assert stored["thumbnail_url"].endswith(f"_320{thumbnail_suffix}")
+    original = tmp_path / stored["image_url"].removeprefix("/media/")
+    thumbnail = tmp_path / stored["thumbnail_url"].removeprefix("/media/")
+    assert original.read_bytes() == data
+    # 按最长边缩放并保持宽高比
+    assert sniff_image(thumbnail.read_bytes())[1:] == (320, 128)
+    with Image.open(thumbnail) as image:
+        assert image.size == (320, 128)
+    assert thumbnail.stat().st_size < original.stat().st_size
+
+
+def test_small_images_are_their_own_thumbnail(tmp_path):
+    pipeline = MediaPipeline(media_dir=tmp_path, base_url="/media", thumbnail_size=320)
+    stored = pipeline._store("default", _image((200, 300), "RGB", "PNG"))
+    assert stored["thumbnail_url"] == stored["image_url"]
+    assert len(list(tmp_path.rglob("*.png"))) == 1
+
+
+def test_corrupt_pixel_data_is_not_retried(tmp_path):
+    # 文件头完整、像素数据被截断的图片：识别尺寸成功，生成缩略图失败
+    data = _image((1000, 400), "RGB", "PNG")[:80]
+    pipeline = MediaPipeline(media_dir=tmp_path, thumbnail_size=320)
+    with pytest.raises(MediaError, match="缩略图"):
+        pipeline._store("default", data)
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/a.png",
+    "http://localhost:8000/a.png",
+    "http://10.0.0.8/a.png",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://[::1]/a.png",
+    "http://[::ffff:192.168.1.1]/a.png",
+    "ftp://93.184.216.34/a.png",
+])
+def test_private_addresses_are_rejected(url):
+    with pytest.raises(MediaError):
+        asyncio.run(MediaPipeline().fetch(url))
+
+
+def test_redirects_are_checked_on_every_hop():
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        if request.url.host == "93.184.216.34":
+            return httpx.Response(302, headers={"location": "http://127.0.0.1/secret"})
+        return httpx.Response(200, content=PNG)
+
+    async def scenario():
+        pipeline = MediaPipeline()
+        pipeline._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            await pipeline.fetch("http://93.184.216.34/a.png")
+        finally:
+            await pipeline._client.aclose()
+
+    with pytest.raises(MediaError):
+        asyncio.run(scenario())
+    assert requested == ["http://93.184.216.34/a.png"]
+
+
+def _resolver(*answers):
+    """依次返回给定地址的域名解析桩，模拟每次解析结果都可能不同的域名"""
+    calls = []
+
+    async def getaddrinfo(self, host, port, *args, **kwargs):
+        calls.append(host)
+        address = answers[min(len(calls), len(answers)) - 1]
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+
+    return getaddrinfo, calls
+
+
+@pytest.mark.parametrize("url, sni", [
+    ("https://img.example.com/a.png", "img.example.com"),
+    ("http://img.example.com:8080/a.png", None),
+])
+def test_download_connects_to_checked_address(monkeypatch, url, sni):
+    getaddrinfo, calls = _resolver("93.184.216.34", "127.0.0.1")
+    monkeypatch.setattr(asyncio.BaseEventLoop, "getaddrinfo", getaddrinfo)
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, content=PNG)
+
+    async def scenario():
+        pipeline = MediaPipeline()
+        pipeline._client = httpx.AsyncClient(transport=PinnedAddressTransport(httpx.MockTransport(handler)))
+        try:
+            return await pipeline.fetch(url)
+        finally:
+            await pipeline._client.aclose()
+
+    assert asyncio.run(scenario()) == PNG
+    # 只在检查时解析一次，连接发往检查过的地址，Host头和SNI保持原域名
+    assert calls == ["img.example.com"]
+    request = seen[0]
+    assert request.url.host == "93.184.216.34"
+    assert request.headers["host"] == httpx.URL(url).netloc.decode()
+    assert request.extensions.get("sni_hostname") == sni
+    assert media.PINNED_ADDRESS not in request.extensions
+
+
+def test_rebinding_after_check_is_ignored(monkeypatch):
+    """检查时解析到“公网”地址（这里用本机服务代替），之后解析结果改为别的地址也不会被使用"""
+    requests = []
+
+    async def handle(reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        requests.append(head.decode())
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % len(PNG) + PNG)
+        await writer.drain()
+        writer.close()
+
+    # 本机地址在测试中视为公网地址；第二次起的解析结果指向不可达的地址
+    monkeypatch.setattr(media, "is_public_address", lambda address: address != "192.0.2.1")
+    getaddrinfo, calls = _resolver("127.0.0.1", "192.0.2.1")
+    monkeypatch.setattr(asyncio.BaseEventLoop, "getaddrinfo", getaddrinfo)
+
+    async def scenario():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pipeline = MediaPipeline()
+        try:
+            async with server:
+                return await pipeline.fetch(f"http://images.example.com:{port}/a.png"), port
+        finally:
+            await pipeline.stop()
+
+    data, port = asyncio.run(scenario())
+    assert data == PNG
+    assert calls == ["images.example.com"]
+    assert f"host: images.example.com:{port}" in requests[0].lower()
+
+
+def test_allowed_hosts():
+    pipeline = MediaPipeline(allowed_hosts=["cdn.example.com"])
+    with pytest.raises(MediaError, match="允许列表"):
+        asyncio.run(pipeline.fetch("http://93.184.216.34/a.png"))
+
+
+def test_failed_downloads_are_retried_with_backoff(database, run, tmp_path):
+    calls = []
+
+    async def flaky(url):
+        calls.append(asyncio.get_running_loop().time())
+        if len(calls) < 3:
+            raise ConnectionError("连接被重置")
+        return PNG
+
+    async def scenario():
+        async with async_session_factory() as db:
+            product = await ProductService(db).create_product_from_dict({
+                "name": "测试耳机", "category": "耳机", "price": 199, "stock": 1, "sku": "SKU-1",
+                "image_url": "http://93.184.216.34/a.png",
+            })
+        # 启动时的补处理发起第一次尝试，之后的两次由进程内的退避重试发起
+        pipeline = MediaPipeline(fetcher=flaky, media_dir=tmp_path, workers=1, retry_base_seconds=0.05)
+        await pipeline.start()
+        try:
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                async with async_session_factory() as db:
+                    media = await db.get(ProductMedia, product.id)
+                    if media is not None and media.status == MEDIA_READY:
+                        return media.attempts
+        finally:
+            await pipeline.stop()
+        return None
+
+    assert run(scenario()) == 3
+    assert len(calls) == 3
+    # 第二次重试的间隔是第一次的两倍
+    assert calls[2] - calls[1] > (calls[1] - calls[0]) * 1.5
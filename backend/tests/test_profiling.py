@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.api.api import api_router
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.profiling import (
+    LoopLagMonitor,
+    SlowRequestMiddleware,
+    instrument_engine,
+    slow_requests,
+    uninstrument_engine,
+)
+from app.db.database import async_session_factory, engine
+from app.services.product_service import ProductService
+
+TOKEN = "test-admin-token"
+
+
+@pytest.fixture
+def admin_app(monkeypatch):
+    """挂载全部接口的应用，所有请求都记为慢请求"""
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", TOKEN)
+    slow_requests.clear()
+    app = FastAPI()
+    app.add_middleware(SlowRequestMiddleware, threshold_ms=0)
+    app.include_router(api_router, prefix=settings.API_PREFIX)
+    instrument_engine(engine.sync_engine)
+    yield app
+    uninstrument_engine(engine.sync_engine)
+    slow_requests.clear()
+
+
+async def _get(app, path, **kwargs):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get(f"{settings.API_PREFIX}{path}", **kwargs)
+
+
+def test_slow_request_is_listed_with_its_sql(database, run, admin_app):
+    async def scenario():
+        async with async_session_factory() as db:
+            await ProductService(db).create_product_from_dict({
+                "name": "测试耳机", "category": "耳机", "price": 100, "stock": 1, "sku": "SKU-1",
+            })
+        listing = await _get(admin_app, "/products/", params={"category": "耳机"})
+        slow = await _get(admin_app, "/admin/slow-requests", headers={"X-Admin-Token": TOKEN})
+        return listing, slow
+
+    listing, slow = run(scenario())
+    assert listing.status_code == 200
+    assert slow.status_code == 200
+    records = [record for record in slow.json() if record["path"] == f"{settings.API_PREFIX}/products/"]
+    assert len(records) == 1
+    record = records[0]
+    assert record["status"] == 200
+    # 引擎事件在SQLAlchemy的greenlet中执行，仍然记到发起查询的请求上
+    statements = [query["statement"] for query in record["sql"]]
+    assert any("FROM products" in statement for statement in statements)
+    assert record["sql_ms"] == pytest.approx(sum(query["ms"] for query in record["sql"]), abs=0.05)
+    # 建表和写入测试数据的SQL不在任何请求内，不会被记录
+    assert not any("INSERT" in statement for statement in statements)
+
+
+@pytest.mark.parametrize("enabled, token, header, status", [
+    (False, TOKEN, TOKEN, 404),
+    (True, None, None, 403),
+    (True, None, "anything", 403),
+    (True, TOKEN, None, 403),
+    (True, TOKEN, "wrong-token", 403),
+    (True, TOKEN, TOKEN, 200),
+])
+def test_admin_endpoints_require_profiling_and_token(run, admin_app, monkeypatch, enabled, token, header, status):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", enabled)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", token)
+    headers = {"X-Admin-Token": header} if header else {}
+
+    slow = run(_get(admin_app, "/admin/slow-requests", headers=headers))
+    profile = run(_get(admin_app, "/admin/profile", params={"seconds": 0.01}, headers=headers))
+    assert slow.status_code == status
+    assert profile.status_code == status
+
+
+def test_loop_lag_monitor_records_blocking_call(caplog):
+    def blocking_call():
+        time.sleep(0.3)
+
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+        monitor.start()
+        try:
+            await asyncio.sleep(0.05)
+            blocking_call()
+            await asyncio.sleep(0.05)
+        finally:
+            await monitor.stop()
+
+    blocked_before = metrics.get_counter("event_loop_blocked_total")
+    with caplog.at_level(logging.WARNING, logger="app.core.profiling"):
+        asyncio.run(scenario())
+
+    assert metrics.get_counter("event_loop_blocked_total") > blocked_before
+    assert metrics.snapshot()["summaries"]["event_loop_lag_ms"]["max"] >= 200
+    # 看门狗线程在阻塞期间记录了事件循环线程的调用栈
+    stacks = [record.getMessage() for record in caplog.records if "当前调用栈" in record.getMessage()]
+    assert stacks and "blocking_call" in stacks[0]
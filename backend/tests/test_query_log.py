@@ -0,0 +1,26 @@
+from app.services.query_log import QueryLogger, read_query_logs
+from app.tools.query_report import analyze
+
+
+def test_report_counts_only_search_endpoints():
+    records = [
+        {"endpoint": "natural", "query": "耳机", "results": 3},
+        {"endpoint": "search", "query": "耳机", "results": 0},
+        {"endpoint": "click", "query": "耳机", "product_id": 1},
+        {"endpoint": "suggest", "query": "耳"},
+    ]
+    report = analyze(records)
+    assert report["total"] == 4
+    assert report["distinct_queries"] == 1
+    assert report["head_queries"][0]["count"] == 2
+    assert report["by_endpoint"] == {"natural": 1, "search": 1, "click": 1, "suggest": 1}
+
+
+def test_rotations_in_the_same_second_do_not_collide(tmp_path):
+    # 每批写入后都超过大小上限，连续的批次都会轮转到新文件
+    query_logger = QueryLogger(log_dir=tmp_path, rotate_bytes=1, max_files=100)
+    for i in range(5):
+        query_logger._write([{"endpoint": "search", "query": str(i)}])
+    files = sorted(tmp_path.iterdir())
+    assert len(files) == 5
+    assert [record["query"] for record in read_query_logs(tmp_path)] == ["0", "1", "2", "3", "4"]
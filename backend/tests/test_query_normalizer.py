@@ -0,0 +1,117 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from app.api.endpoints import search
+from app.db.database import async_session_factory
+from app.schemas.product import ProductSearchQuery
+from app.services import query_normalizer as query_normalizer_module
+from app.services.product_service import ProductService
+from app.services.query_normalizer import QueryNormalizer
+
+
+def _product(tenant_id, name, category, tags=()):
+    return SimpleNamespace(tenant_id=tenant_id, name=name, category=category, tags=list(tags))
+
+
+def test_vocabulary_is_per_tenant():
+    normalizer = QueryNormalizer()
+    normalizer.add_static_terms(["手机"])
+    normalizer.add_product(_product("a", "Sennheiser Momentum", "耳机"))
+    normalizer.add_product(_product("b", "Sonos Beam", "音响"))
+
+    # 只会纠正为本租户的商品词或共用的内置词
+    assert normalizer.normalize("sennhieser", tenant_id="a", fuzzy=True) == "sennheiser"
+    assert normalizer.normalize("sennhieser", tenant_id="b", fuzzy=True) == "sennhieser"
+    assert normalizer.contains("手机", tenant_id="b")
+    assert not normalizer.contains("momentum", tenant_id="b")
+
+    normalizer.remove_product(_product("a", "Sennheiser Momentum", "耳机"))
+    assert normalizer.normalize("sennhieser", tenant_id="a", fuzzy=True) == "sennhieser"
+
+
+@pytest.mark.parametrize("query", ["耳环", "耳钉", "手套", "手链", "相框", "书包"])
+def test_valid_words_are_not_rewritten_to_similar_categories(query):
+    normalizer = QueryNormalizer(lexicon_file=None)
+    normalizer.add_static_terms(["耳机", "手机", "相机", "箱包", "外套", "书架"])
+    assert normalizer.normalize(query) == query
+    assert normalizer.normalize(query, fuzzy=True) == query
+    assert normalizer.normalize(f"{query} 500元以下", fuzzy=True) == f"{query} 500元以下"
+
+
+def test_edit_distance_correction_only_in_fuzzy_mode():
+    normalizer = QueryNormalizer(lexicon_file=None)
+    normalizer.add_static_terms(["耳机", "iphone"])
+    # “耳巾”与“耳机”读音不同，只能按字形纠正
+    assert normalizer.normalize("耳巾") == "耳巾"
+    assert normalizer.normalize("耳巾", fuzzy=True) == "耳机"
+    assert normalizer.normalize("iphnoe") == "iphnoe"
+    assert normalizer.normalize("iphnoe", fuzzy=True) == "iphone"
+
+
+def test_lexicon_file_extends_common_words(tmp_path):
+    lexicon = tmp_path / "lexicon.txt"
+    lexicon.write_text("# 补充词\n耳饰\n", encoding="utf-8")
+    normalizer = QueryNormalizer(lexicon_file=lexicon)
+    normalizer.add_static_terms(["耳机"])
+    assert normalizer.normalize("耳饰", fuzzy=True) == "耳饰"
+
+
+def test_zero_result_search_retries_with_correction(database, run):
+    async def scenario():
+        async with async_session_factory() as db:
+            await ProductService(db).create_product_from_dict({
+                "name": "降噪耳机", "category": "耳机", "price": 299, "stock": 3, "sku": "SKU-1",
+            })
+            request = SimpleNamespace(state=SimpleNamespace())
+            typo = await search.search_by_natural_language(ProductSearchQuery(query="耳巾"), request, db, "default")
+            valid = await search.search_by_natural_language(ProductSearchQuery(query="耳环"), request, db, "default")
+            return typo, valid
+
+    typo, valid = run(scenario())
+    assert typo["total"] == 1
+    assert typo["corrected_query"] == "耳机"
+    assert valid["total"] == 0
+    assert "corrected_query" not in valid
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("erji", "耳机"),
+    ("lanya erji 500元以下", "蓝牙 耳机 500元以下"),
+    ("耳鸡", "耳机"),
+    ("兰牙耳机", "蓝牙耳机"),
+])
+def test_pinyin_and_homophones_are_corrected_without_fuzzy(query, expected):
+    pytest.importorskip("pypinyin")
+    normalizer = QueryNormalizer(lexicon_file=None)
+    normalizer.add_static_terms(["耳机", "蓝牙", "手机"])
+    assert normalizer.normalize(query) == expected
+
+
+def test_pinyin_query_finds_products(database, run):
+    pytest.importorskip("pypinyin")
+
+    async def scenario():
+        async with async_session_factory() as db:
+            await ProductService(db).create_product_from_dict({
+                "name": "降噪耳机", "category": "耳机", "price": 299, "stock": 3, "sku": "SKU-1",
+            })
+            request = SimpleNamespace(state=SimpleNamespace())
+            return await search.search_by_natural_language(ProductSearchQuery(query="erji"), request, db, "default")
+
+    result = run(scenario())
+    assert result["total"] == 1
+
+
+def test_missing_pypinyin_is_reported_at_startup(run, monkeypatch, caplog):
+    monkeypatch.setattr(query_normalizer_module, "lazy_pinyin", None)
+    normalizer = QueryNormalizer(lexicon_file=None)
+
+    async def scenario():
+        normalizer.start(session_factory=async_session_factory)
+        await normalizer.stop()
+
+    with caplog.at_level(logging.WARNING, logger="app.services.query_normalizer"):
+        run(scenario())
+    assert any("pypinyin" in record.getMessage() for record in caplog.records)
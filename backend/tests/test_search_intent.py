@@ -0,0 +1,93 @@
+import pickle
+
+import pytest
+
+from app.schemas.intent import CompactIntent, SearchIntent
+from app.services.product_service import compile_intent_filters
+
+
+def test_equal_intents_share_hash_and_cache_key():
+    a = SearchIntent(category=" 耳机 ", min_price="100", brands=["Sony", "Bose", "Sony"], keywords=["降噪", "蓝牙"])
+    b = SearchIntent(category="耳机", min_price=100.0, brands=("Bose", "Sony"), keywords=["蓝牙", "降噪 "])
+    assert a == b
+    assert hash(a) == hash(b)
+    assert a.cache_key == b.cache_key
+    assert len({a, b}) == 1
+    assert a != SearchIntent(category="耳机", min_price=100, brands=["Sony"], keywords=["降噪", "蓝牙"])
+
+
+def test_strings_are_interned():
+    a = SearchIntent(category="".join(["耳", "机"]), brands=["".join(["So", "ny"])])
+    b = SearchIntent(category="耳机", brands=["Sony"])
+    assert a.category is b.category
+    assert a.brands[0] is b.brands[0]
+
+
+def test_intent_is_immutable():
+    intent = SearchIntent(category="耳机")
+    with pytest.raises(AttributeError):
+        intent.category = "手机"
+    with pytest.raises(AttributeError):
+        intent.extra = 1
+    with pytest.raises(AttributeError):
+        del intent.category
+    assert intent.category == "耳机"
+
+
+@pytest.mark.parametrize("low, high, expected", [
+    (500, 100, (100.0, 500.0)),
+    (-10, 200, (None, 200.0)),
+    (0, 0, (None, None)),
+    ("abc", "99.999", (None, 100.0)),
+    (None, -5, (None, None)),
+])
+def test_prices_are_normalized(low, high, expected):
+    intent = SearchIntent(min_price=low, max_price=high)
+    assert (intent.min_price, intent.max_price) == expected
+
+
+def test_other_category_and_sort_text_are_normalized():
+    intent = SearchIntent(category="其他", sort="价格从高到低")
+    assert intent.category is None
+    assert intent.sort == "pd"
+    assert SearchIntent(sort="最新").sort == "new"
+    assert SearchIntent(sort="随便").sort is None
+
+
+def test_dict_round_trip():
+    intent = SearchIntent(category="手机", min_price=1000, max_price=3000, brands=["华为"], keywords=["5g"], sort="pa")
+    data = intent.to_dict()
+    assert data == {
+        "product_type": "手机",
+        "price_range": {"min": 1000.0, "max": 3000.0},
+        "brands": ["华为"],
+        "keywords": ["5g"],
+        "sort_preference": "价格从低到高",
+    }
+    assert SearchIntent.from_dict(data) == intent
+    # 未指定的字段在字典中用“其他”和0表示，转换回来仍是未指定
+    empty = SearchIntent()
+    assert SearchIntent.from_dict(empty.to_dict()) == empty
+    assert SearchIntent.from_dict({"price_range": "bad"}) == empty
+
+
+def test_pickle_and_compact_conversion():
+    intent = SearchIntent(category="耳机", max_price=300, brands=["Sony"], keywords=["降噪"], sort="pd")
+    assert pickle.loads(pickle.dumps(intent)) == intent
+    compact = CompactIntent.model_validate({"t": "耳机", "p": [None, 300], "s": "pd", "b": ["Sony"], "k": ["降噪"]})
+    assert compact.to_search_intent() == intent
+    assert intent.core() == SearchIntent(category="耳机", max_price=300)
+
+
+def test_compiled_filters_are_cached_per_intent():
+    compile_intent_filters.cache_clear()
+    a = SearchIntent(category="耳机", min_price=100, max_price=500, brands=["Sony"], keywords=["降噪"], sort="pa")
+    b = SearchIntent(category="耳机", min_price=500, max_price=100, brands=["Sony"], keywords=["降噪"], sort="pa")
+    compiled = compile_intent_filters(a)
+    assert compile_intent_filters(b) is compiled
+    assert compile_intent_filters.cache_info().hits == 1
+    filters, order_by = compiled
+    # 价格上下界、一个品牌和一组关键词
+    assert len(filters) == 4
+    assert len(order_by) == 2
+    assert compile_intent_filters(SearchIntent(category="耳机")) is not compiled
@@ -0,0 +1,102 @@
+import asyncio
+
+from sqlalchemy import and_, select, text, update
+
+from app.db.database import async_session_factory
+from app.models.product import Category, ProductSearch
+from app.schemas.intent import SearchIntent
+from app.services import search_projection
+from app.services.product_service import ProductService, compile_intent_filters
+
+
+async def _seed(db, count=5):
+    service = ProductService(db)
+    for i in range(count):
+        await service.create_product_from_dict({
+            "name": f"测试手机 {i}", "category": "手机", "price": 1000 + i * 100, "stock": i, "sku": f"SKU-{i}",
+        })
+
+
+def test_ensure_projection_repairs_stale_rows(database, run):
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db)
+            # 行数一致但内容过期：价格、名称被改写，另有一行缺失
+            await db.execute(update(ProductSearch).where(ProductSearch.id == 1).values(price=1.0))
+            await db.execute(update(ProductSearch).where(ProductSearch.id == 2).values(name="旧名称"))
+            await db.execute(text("DELETE FROM product_search WHERE id = 3"))
+            await db.commit()
+            repaired = await search_projection.ensure_projection(db)
+            rows = (await db.execute(
+                select(ProductSearch.id, ProductSearch.name, ProductSearch.price).order_by(ProductSearch.id)
+            )).all()
+            again = await search_projection.ensure_projection(db)
+            return repaired, rows, again
+
+    repaired, rows, again = run(scenario())
+    assert repaired == 3
+    assert [tuple(row) for row in rows] == [(i + 1, f"测试手机 {i}", 1000 + i * 100) for i in range(5)]
+    assert again == 0
+
+
+def test_page_query_uses_covering_index(database, run):
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db)
+            intent = SearchIntent(min_price=1100, max_price=1300, sort="pa")
+            filters, order_by = compile_intent_filters(intent)
+            query = (
+                select(ProductSearch.id)
+                .where(and_(ProductSearch.tenant_id == "default", *filters))
+                .order_by(*order_by)
+                .limit(2)
+            )
+            compiled = query.compile(db.bind, compile_kwargs={"literal_binds": True})
+            plan = (await db.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))).all()
+            page = await ProductService(db).search_products_by_intent(
+                SearchIntent(min_price=1100, max_price=1300, keywords=["测试"], sort="pa"), limit=2
+            )
+            return " ".join(row[-1] for row in plan), page
+
+    plan, page = run(scenario())
+    assert "COVERING INDEX ix_product_search_tenant_price" in plan
+    assert [item["price"] for item in page["items"]] == [1100, 1200]
+    assert page["total"] == 3
+
+
+def test_search_items_keep_full_description(database, run):
+    description = "旗舰降噪耳机，" * 40
+
+    async def scenario():
+        async with async_session_factory() as db:
+            await ProductService(db).create_product_from_dict({
+                "name": "降噪耳机", "category": "耳机", "price": 999, "stock": 1, "sku": "SKU-1",
+                "description": description,
+            })
+            return await ProductService(db).search_products_by_intent(SearchIntent(category="耳机"))
+
+    results = run(scenario())
+    assert results["items"][0]["description"] == description
+
+
+def test_concurrent_new_category_does_not_conflict(database, run):
+    async def create(delay):
+        async with async_session_factory() as db:
+            category_id = await search_projection.get_category_id(db, "新类别")
+            # 先插入的一方持有写锁一段时间后提交，另一方在此期间已确认类别不存在
+            await asyncio.sleep(delay)
+            await db.commit()
+            return category_id
+
+    async def scenario():
+        # 连接池的首次连接初始化不能并发进行，先建立一个连接
+        async with async_session_factory() as db:
+            await db.execute(select(Category.id))
+        ids = await asyncio.gather(create(0.2), create(0))
+        async with async_session_factory() as db:
+            rows = (await db.execute(select(Category.id).where(Category.name == "新类别"))).all()
+        return ids, rows
+
+    ids, rows = run(scenario())
+    assert ids[0] == ids[1]
+    assert len(rows) == 1
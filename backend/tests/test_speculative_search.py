@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.db.database import async_session_factory
+from app.schemas.intent import CompactIntent, SearchIntent
+from app.services.caches import search_result_cache
+from app.services.product_service import ProductService
+
+PRODUCTS = [
+    ("华为 Mate 60 手机", "手机", 5999, ["华为", "旗舰"]),
+    ("华为 nova 12 手机", "手机", 2699, ["华为", "轻薄"]),
+    ("小米 14 手机", "手机", 3999, ["小米", "旗舰"]),
+    ("Redmi K70 手机", "手机", 2499, ["小米", "游戏"]),
+    ("三星 Galaxy S24 手机", "手机", 5499, ["三星", "轻薄"]),
+    ("索尼 降噪耳机", "耳机", 1999, ["索尼", "降噪"]),
+]
+
+
+async def _seed(db):
+    service = ProductService(db)
+    for i, (name, category, price, tags) in enumerate(PRODUCTS):
+        await service.create_product_from_dict({
+            "name": name, "category": category, "price": price, "stock": 5, "sku": f"SKU-{i}", "tags": tags,
+        })
+
+
+@pytest.mark.parametrize("intent", [
+    SearchIntent(category="手机", max_price=4000, brands=["华为"]),
+    SearchIntent(category="手机", max_price=4000, keywords=["旗舰", "轻薄"], sort="pa"),
+    SearchIntent(category="手机", max_price=6000, sort="pd"),
+    SearchIntent(category="手机", max_price=6000, keywords=["游戏"]),
+    SearchIntent(category="手机", max_price=6000),
+])
+def test_candidates_match_full_search(database, run, intent):
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db)
+            service = ProductService(db)
+            candidates = await service.find_core_candidates(intent.core())
+            speculative = await service.search_candidates(candidates, intent, page=1, limit=2)
+            search_result_cache.clear()
+            expected = await service.search_products_by_intent(intent, page=1, limit=2)
+            return speculative, expected
+
+    speculative, expected = run(scenario())
+    assert speculative == expected
+
+
+def test_candidates_over_limit_fall_back(database, run, monkeypatch):
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "INTENT_SPECULATIVE_MAX_CANDIDATES", 3)
+
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db)
+            return await ProductService(db).find_core_candidates(SearchIntent(category="手机"))
+
+    assert run(scenario()) is None
+
+
+def test_core_intent_ignores_other_filters():
+    core = CompactIntent.model_validate({"t": "手机", "p": [None, 3000]}).to_search_intent()
+    final = SearchIntent(category="手机", max_price=3000, brands=["华为"], keywords=["轻薄"], sort="pa")
+    assert final.core() == core
+    assert final != core
+
+
+def test_compact_intent_rejects_unknown_fields():
+    with pytest.raises(ValueError):
+        CompactIntent.model_validate({"t": "手机", "p": None, "x": 1})
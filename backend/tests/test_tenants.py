@@ -0,0 +1,13 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api import deps
+
+
+def test_unknown_tenant_is_rejected(monkeypatch):
+    monkeypatch.setattr(deps, "KNOWN_TENANT_IDS", frozenset({"default", "shop-1"}))
+    assert deps.get_tenant_id(None) == "default"
+    assert deps.get_tenant_id("shop-1") == "shop-1"
+    with pytest.raises(HTTPException) as error:
+        deps.get_tenant_id("shop-2")
+    assert error.value.status_code == 403
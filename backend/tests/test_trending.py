@@ -0,0 +1,52 @@
+from unittest import mock
+
+from app.db.database import async_session_factory
+from app.services.product_service import ProductService
+from app.services.trending import TrendingEngine
+
+
+async def _seed(db):
+    # 产品1-3属于店铺a，产品4属于店铺b
+    for i in range(4):
+        tenant_id = "a" if i < 3 else "b"
+        await ProductService(db, tenant_id).create_product_from_dict({
+            "name": f"测试产品 {i}", "category": "耳机", "price": 100, "stock": 1, "sku": f"SKU-{i}",
+        })
+
+
+def test_forged_clicks_do_not_rank_other_tenants_products(database, run):
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db)
+        engine = TrendingEngine(half_life_seconds=0)
+        engine.record_view(2, "a")
+        # 店铺b伪造对店铺a产品1的大量点击
+        for _ in range(50):
+            engine.record_click(1, "b")
+        engine.record_view(4, "b")
+        await engine.refresh()
+        restored = TrendingEngine(half_life_seconds=0)
+        await restored._restore()
+        return engine, restored
+
+    engine, restored = run(scenario())
+    assert set(engine._candidates) == {("a", 2), ("b", 4)}
+    assert [item["id"] for item in engine.featured("a", 10)] == [2]
+    assert [item["id"] for item in engine.featured("b", 10)] == [4]
+    assert set(restored._candidates) == {("a", 2), ("b", 4)}
+    assert restored.featured("a", 10) == engine.featured("a", 10)
+
+
+def test_featured_fills_with_newest_products(database, run):
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db)
+            engine = TrendingEngine(half_life_seconds=0)
+            engine.record_view(1, "a")
+            await engine.refresh()
+            with mock.patch("app.services.product_service.trending_engine", engine):
+                return await ProductService(db, "a").get_featured_products(limit=3)
+
+    featured = run(scenario())
+    # 热门产品在前，其余为最新产品且不重复
+    assert [item["id"] for item in featured] == [1, 3, 2]
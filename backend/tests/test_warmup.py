@@ -0,0 +1,32 @@
+import logging
+import time
+
+from app.db.database import async_session_factory
+from app.services.ai_service import AIService
+from app.services.caches import search_result_cache
+from app.services.product_service import ProductService
+from app.services.warmup import CacheWarmer
+
+
+def test_warmed_results_outlive_request_ttl(database, run, caplog):
+    async def scenario():
+        async with async_session_factory() as db:
+            await ProductService(db).create_product_from_dict({
+                "name": "测试耳机", "category": "耳机", "price": 199, "stock": 3, "sku": "SKU-1",
+            })
+        ai_service = AIService()
+        assert not ai_service.llm_enabled
+        warmer = CacheWarmer(
+            ai_service, queries_loader=lambda: ["耳机"], throttle_ms=0, result_ttl=900, refresh_seconds=0
+        )
+        await warmer.run()
+        return warmer.ready.is_set()
+
+    with caplog.at_level(logging.INFO, logger="app.services.warmup"):
+        assert run(scenario())
+    assert "跳过意图预热" in caplog.text
+    entries = search_result_cache._partitions["default"]
+    assert len(entries) == 1
+    expires_at, response = next(iter(entries.values()))
+    assert response["total"] == 1
+    assert expires_at - time.monotonic() > 600
@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from app.api.endpoints import products
+from app.core.config import settings
+from app.db.database import async_session_factory
+from app.models.inventory import RESERVATION_LEASE, InventoryReservation
+from app.models.product import Product, ProductSearch
+from app.schemas.intent import SearchIntent
+from app.schemas.product import ProductStockPriceUpdate, ProductUpdate
+from app.services.product_service import ProductService
+from app.services.write_behind import StockBelowReservedError, WriteBehindQueue
+
+
+async def _lease(db, product_id, quantity):
+    db.add(InventoryReservation(
+        id=f"lease-{product_id}", tenant_id="default", product_id=product_id, quantity=quantity,
+        status=RESERVATION_LEASE, owner="other", expires_at=datetime.now(timezone.utc) + timedelta(minutes=1),
+    ))
+    await db.commit()
+
+
+async def _seed(db):
+    service = ProductService(db)
+    for i in range(3):
+        await service.create_product_from_dict({
+            "name": f"测试耳机 {i}", "category": "耳机", "price": 100 + i * 10, "stock": 5, "sku": f"SKU-{i}",
+        })
+
+
+def test_price_write_invalidates_cached_search(database, run):
+    async def scenario():
+        queue = WriteBehindQueue(interval_ms=1)
+        await queue.start()
+        try:
+            async with async_session_factory() as db:
+                await _seed(db)
+                intent = SearchIntent(category="耳机", sort="pa")
+                before = await ProductService(db).search_products_by_intent(intent)
+                await queue.submit(1, {"price": 500.0})
+                after = await ProductService(db).search_products_by_intent(intent)
+                return before, after
+        finally:
+            await queue.stop()
+
+    before, after = run(scenario())
+    assert [item["id"] for item in before["items"]] == [1, 2, 3]
+    assert [item["id"] for item in after["items"]] == [2, 3, 1]
+    assert after["items"][-1]["price"] == 500.0
+
+
+def test_stock_write_counts_leased_units(database, run):
+    async def scenario():
+        queue = WriteBehindQueue(interval_ms=1)
+        await queue.start()
+        try:
+            async with async_session_factory() as db:
+                await _seed(db)
+                # 产品1的库存全部被进程扣为额度，产品2没有额度
+                await _lease(db, 1, 3)
+            await queue.submit(1, {"stock": 3})
+            await queue.submit(2, {"stock": 0})
+            async with async_session_factory() as db:
+                rows = await db.execute(select(ProductSearch.id, ProductSearch.in_stock).order_by(ProductSearch.id))
+                return dict(rows.all())
+        finally:
+            await queue.stop()
+
+    in_stock = run(scenario())
+    assert in_stock == {1: True, 2: False, 3: True}
+
+
+def test_stock_write_below_reserved_units_is_rejected(database, run):
+    async def scenario():
+        queue = WriteBehindQueue(interval_ms=1)
+        await queue.start()
+        try:
+            async with async_session_factory() as db:
+                await _seed(db)
+                await _lease(db, 1, 3)
+                await _lease(db, 3, 2)
+            with pytest.raises(StockBelowReservedError) as error:
+                await queue.submit(1, {"stock": 2, "price": 1.0})
+            # 写入的是总件数，products.stock 保存扣除额度后的件数
+            await queue.submit(2, {"stock": 7})
+            await queue.submit(3, {"stock": 6})
+            async with async_session_factory() as db:
+                rows = await db.execute(select(Product.id, Product.stock, Product.price).order_by(Product.id))
+                return error.value, rows.all()
+        finally:
+            await queue.stop()
+
+    error, rows = run(scenario())
+    assert (error.product_id, error.stock, error.reserved) == (1, 2, 3)
+    # 被拒绝的写入整体不生效
+    assert [tuple(row) for row in rows] == [(1, 5, 100.0), (2, 7, 110.0), (3, 4, 120.0)]
+
+
+def test_direct_update_accounts_for_reserved_units(database, run):
+    async def scenario():
+        async with async_session_factory() as db:
+            await _seed(db)
+            await _lease(db, 1, 3)
+            service = ProductService(db)
+            with pytest.raises(StockBelowReservedError):
+                await service.update_product(1, ProductUpdate(stock=2, name="改名"))
+            product = await service.update_product(1, ProductUpdate(stock=4, name="改名"))
+            return product.stock, product.name
+
+    # 写合并队列未启动，更新走直接写入的路径
+    assert run(scenario()) == (1, "改名")
+
+
+def test_null_stock_is_rejected_not_written_as_zero(database, run):
+    with pytest.raises(ValidationError):
+        ProductUpdate.model_validate({"stock": None})
+    with pytest.raises(ValidationError):
+        ProductStockPriceUpdate.model_validate({"id": 1, "stock": None})
+    # 省略的字段不受影响
+    assert ProductUpdate.model_validate({"name": "改名"}).model_dump(exclude_unset=True) == {"name": "改名"}
+
+    async def scenario():
+        queue = WriteBehindQueue(interval_ms=1)
+        await queue.start()
+        try:
+            async with async_session_factory() as db:
+                await _seed(db)
+            with pytest.raises(ValueError):
+                await queue.submit(1, {"stock": None})
+            async with async_session_factory() as db:
+                return await db.get(Product, 1)
+        finally:
+            await queue.stop()
+
+    assert run(scenario()).stock == 5
+
+
+def test_bulk_update_size_is_capped(database, run):
+    updates = [ProductStockPriceUpdate(id=i, stock=1) for i in range(settings.WRITE_BATCH_MAX_SIZE + 1)]
+
+    async def scenario():
+        async with async_session_factory() as db:
+            await products.bulk_update_products(updates, db, "default")
+
+    with pytest.raises(HTTPException) as error:
+        run(scenario())
+    assert error.value.status_code == 413